@@ -0,0 +1,586 @@
+# Author:     Andrew Smith
+# File:       benchmark.py
+# Project:    Pokemon Team Builder
+
+'''
+benchmark.py: This file times the hot paths of the team builder on synthetic
+              dexes of increasing size, so that changes to them can be checked
+              for regressions.  Results are written as JSON and can be compared
+              against a stored baseline, in which case any hot path that got
+              slower than the tolerance makes the run fail.  --legacy instead
+              compares the current code against the original implementations
+              on the real dex.
+'''
+
+import json
+import argparse
+import math
+import os
+import os.path as osp
+import platform
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+import numpy as np
+from numpy.linalg import norm
+from type_functions import DATA_DIR, TYPE_INDICES, TypeChart, set_chart, \
+                           type_synergy
+from dex_matrix import DexMatrix
+from team_search import TeamSearch
+from signature_index import SignatureIndex
+from eligibility import EligibilityIndex
+from result_writers import WRITERS, iter_binary, open_writer
+from dex_snapshot import DexSnapshot, compile_snapshot, load_pokedex
+from dex_store import DexStore, build_store
+from stats_analysis import make_stats_matrix, get_role_data
+from role_index import RoleIndex, build_role_index, role_points
+from damage import DamageCalculator
+from synthetic_dex import generate_dex, write_data_dir
+from scorers import SCORERS, get_scorer
+from type_masks import add_members, popcount, uncovered_weaknesses, \
+                       stacked_weaknesses
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Most seconds a partner query from the command line may take, from starting
+# the interpreter to writing the results
+STARTUP_BUDGET = 0.5
+
+# Runs a partner query through the command line tool in a fresh interpreter
+# and prints which of the modules it shouldn't need got imported
+STARTUP_SCRIPT = '''
+import sys
+import pokemon_team_builder as cli
+cli.main(sys.argv[1:])
+print('imported:' + ','.join(sorted(name for name in sys.modules \\
+                      if name.split('.')[0] in cli.LAZY_MODULES)))
+'''
+
+
+def legacy_get_wri(type, data_path=DATA_DIR):
+    # The original get_wri, which parses type_data.json on every call.  Kept
+    # here only as a point of comparison.
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        data = json.load(f_in)
+    full_type_wri = [1 for i in range(18)]
+    for weakness in data[type]['weaknesses']:
+        full_type_wri[TYPE_INDICES[weakness]] = 2
+    for resistance in data[type]['resistances']:
+        full_type_wri[TYPE_INDICES[resistance]] = 1/2
+    for immunity in data[type]['immunities']:
+        full_type_wri[TYPE_INDICES[immunity]] = 0
+    return full_type_wri
+
+
+def legacy_build_wri(types):
+    if len(types) == 2:
+        return [x*y for x, y in zip(legacy_get_wri(types[0]), \
+                legacy_get_wri(types[1]))]
+    else:
+        return legacy_get_wri(types[0])
+
+
+def legacy_type_synergy(types_1, types_2):
+    wri = np.asarray([x*y for x, y in zip(legacy_build_wri(types_1), \
+                      legacy_build_wri(types_2))])
+    return norm(wri)
+
+
+def time_pairs(func, pairs, repeat=3):
+    # Returns the best average time per call of func over all pairs
+    best = float('inf')
+    for _ in range(repeat):
+        start = timer()
+        for types_1, types_2 in pairs:
+            func(types_1, types_2)
+        best = min(best, (timer() - start) / len(pairs))
+    return best
+
+
+def bench_type_synergy(data_path, num_pairs=2000, seed=0):
+    # Compares the per-pair cost of the old and new type_synergy on random pairs
+    # of mons from the dex
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        dex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        set_chart(TypeChart(json.load(f_in)))
+    rng = np.random.default_rng(seed)
+    types = [entry['type'] for entry in dex.values()]
+    pairs = [(types[i], types[j]) for i, j in \
+             rng.integers(len(types), size=(num_pairs, 2))]
+
+    # Make sure both implementations agree before timing them
+    for types_1, types_2 in pairs[:200]:
+        assert abs(type_synergy(types_1, types_2) - \
+                   legacy_type_synergy(types_1, types_2)) < 1e-9
+
+    legacy = time_pairs(legacy_type_synergy, pairs[:max(1, num_pairs // 10)], \
+                        repeat=1)
+    current = time_pairs(type_synergy, pairs)
+    return {'legacy_us': legacy * 1e6, 'current_us': current * 1e6, \
+            'speedup': legacy / current}
+
+
+def bench_find_partner(data_path, num_queries=200, k=10, seed=0):
+    # Times a warm partner lookup against the whole dex and the one-off cost of
+    # building the dex matrix
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        dex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        set_chart(TypeChart(json.load(f_in)))
+    start = timer()
+    dex_matrix = DexMatrix(dex)
+    build = timer() - start
+
+    rng = np.random.default_rng(seed)
+    names = [dex_matrix.names[i] for i in \
+             rng.integers(len(dex_matrix), size=num_queries)]
+    start = timer()
+    for name in names:
+        dex_matrix.find_partners(name, k=k)
+    query = (timer() - start) / num_queries
+    return {'build_ms': build * 1e3, 'query_us': query * 1e6, \
+            'num_mons': len(dex_matrix)}
+
+
+def bench_team_search(data_path, seeds=('garchomp', 'toxapex', 'corviknight'), \
+                      num_teams=10):
+    # Compares the team search over every mon against the search over type
+    # signatures
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        dex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        set_chart(TypeChart(json.load(f_in)))
+    dex_matrix = DexMatrix(dex)
+    index = SignatureIndex(dex_matrix)
+    search = TeamSearch(dex_matrix)
+
+    start = timer()
+    mon_teams = search.search(list(seeds), num_teams)
+    mon_time = timer() - start
+    start = timer()
+    signature_teams = index.search_teams(list(seeds), num_teams)
+    signature_time = timer() - start
+
+    # Both searches are exact so they have to agree on the scores
+    assert np.allclose([score for _, score in mon_teams], \
+                       [score for _, score in signature_teams])
+    return {'mon_ms': mon_time * 1e3, 'signature_ms': signature_time * 1e3, \
+            'collapse_ratio': index.collapse_ratio, \
+            'speedup': mon_time / signature_time}
+
+
+def bench_load(data_path, snapshot_path, repeat=20):
+    # Compares building the dex matrix from the JSON files against building it
+    # from a compiled snapshot
+    compile_snapshot(data_path, snapshot_path)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        set_chart(TypeChart(json.load(f_in)))
+
+    json_time = float('inf')
+    snapshot_time = float('inf')
+    for _ in range(repeat):
+        start = timer()
+        with open(osp.join(data_path, 'pokedex.json')) as f_in:
+            DexMatrix(json.load(f_in))
+        json_time = min(json_time, timer() - start)
+        start = timer()
+        DexMatrix.from_snapshot(DexSnapshot(snapshot_path))
+        snapshot_time = min(snapshot_time, timer() - start)
+    return {'json_ms': json_time * 1e3, 'snapshot_ms': snapshot_time * 1e3}
+
+
+def best_time(func, repeat=3, number=1):
+    # Returns the best time per call of func() over repeat runs of number calls
+    best = float('inf')
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        best = min(best, (timer() - start) / number)
+    return best
+
+
+def write_ranking(index, mon, path, fmt):
+    # Streams every partner of a mon to a file
+    with open_writer(path, fmt, mon) as writer:
+        return writer.write_all(((name,), score) for name, score in \
+                                index.iter_partners(mon))
+
+
+def team_weaknesses_masks(team_masks):
+    # Uncovered and stacked weakness counts of (T, 6, 4) team masks
+    state = add_members(np.zeros(4, dtype=np.uint32), team_masks[:, 0])
+    for member in range(1, team_masks.shape[1]):
+        state = add_members(state, team_masks[:, member])
+    return popcount(uncovered_weaknesses(state)), \
+           popcount(stacked_weaknesses(state))
+
+
+def team_weaknesses_floats(team_wri):
+    # The same counts from (T, 6, 18) team weaknesses, resistances, and
+    # immunities
+    weak = team_wri >= 2
+    uncovered = weak.any(axis=1) & ~(team_wri <= 1/2).any(axis=1)
+    return uncovered.sum(axis=1), (weak.sum(axis=1) >= 3).sum(axis=1)
+
+
+def scan_pokedex(pokedex, types, min_stats):
+    # The entries of a pokedex dict with one of the types and at least the
+    # minimum stats, found by checking every entry, what the store's indexes
+    # save
+    columns = {'hp': 0, 'atk': 1, 'def': 2, 'spa': 3, 'spd': 4, 'spe': 5}
+    return {name: entry for name, entry in pokedex.items() \
+            if set(types) & set(entry['type']) and \
+            all(entry['stats'][columns[stat]] >= minimum for stat, minimum \
+                in min_stats.items())}
+
+
+def damage_loop(calculator, attacker, defender):
+    # Hits for an attacker to KO a defender with its own types on the lowest
+    # roll, one type at a time in Python, what the damage arrays save
+    best = 0
+    for type in np.flatnonzero(calculator.stab[attacker] > 1).tolist():
+        base = max(math.floor(math.floor(42 * calculator.power * \
+                                         calculator.attack[attacker, i] / \
+                                         calculator.defense[defender, i]) / \
+                              50) + 2 for i in (0, 1))
+        damage = math.floor(math.floor(base * 85 / 100) * 1.5)
+        effectiveness = calculator.effectiveness[defender, type]
+        if effectiveness:
+            best = max(best, math.floor(damage * effectiveness), 1)
+    return math.ceil(calculator.hp[defender] / best) if best else 255
+
+
+def similar_linear(points, row, k=10):
+    # The k rows nearest to a row by scanning every point, what the role
+    # index saves
+    distances = ((points - points[row]) ** 2).sum(axis=1)
+    distances[row] = np.inf
+    return np.argpartition(distances, k)[:k]
+
+
+def bench_size(num_mons, data_path, temp_dir, seed=0, num_queries=100):
+    # Times every hot path on a synthetic dex of num_mons mons.  Returns a dict
+    # of seconds per call.
+    dex = generate_dex(num_mons, seed, data_path)
+    size_path = osp.join(temp_dir, str(num_mons))
+    write_data_dir(dex, size_path, data_path)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        set_chart(TypeChart(json.load(f_in)))
+    results = {}
+
+    # Loading
+    results['load_data_json'] = best_time(lambda: load_pokedex(size_path))
+    snapshot_path = compile_snapshot(size_path)
+    results['load_data_snapshot'] = best_time(lambda: load_pokedex(size_path))
+    results['dex_matrix_snapshot'] = best_time( \
+        lambda: DexMatrix.from_snapshot(DexSnapshot(snapshot_path)))
+    results['dex_matrix_dict'] = best_time(lambda: DexMatrix(dex))
+
+    # The SQLite store, loading all of it and only the mons passing a tight
+    # filter, against scanning the dex dict for them
+    results['store_build'] = best_time(lambda: build_store(size_path), \
+                                       repeat=1)
+    store = DexStore(build_store(size_path))
+    results['load_data_store'] = best_time(lambda: store.pokedex())
+    tight_filter = {'types': ['steel'], 'min_stats': {'spe': 90}}
+    results['store_tight_filter_load'] = best_time( \
+        lambda: store.pokedex(**tight_filter))
+    results['dict_tight_filter_scan'] = best_time( \
+        lambda: scan_pokedex(dex, **tight_filter))
+    store.close()
+
+    # Type functions, per pair of random mons
+    rng = np.random.default_rng(seed)
+    types = [entry['type'] for entry in dex.values()]
+    pairs = [(types[i], types[j]) for i, j in \
+             rng.integers(len(types), size=(2000, 2))]
+    results['type_synergy_pair'] = time_pairs(type_synergy, pairs)
+
+    # Partner queries against the whole dex
+    dex_matrix = DexMatrix(dex)
+    index = SignatureIndex(dex_matrix)
+    names = [dex_matrix.names[i] for i in \
+             rng.integers(num_mons, size=num_queries)]
+    queries = iter(names * 3)
+    results['find_partner_query'] = best_time( \
+        lambda: dex_matrix.find_partners(next(queries)), number=num_queries)
+    queries = iter(names * 3)
+    results['find_partner_signature_query'] = best_time( \
+        lambda: index.find_partners(next(queries)), number=num_queries)
+    results['signature_index_build'] = best_time( \
+        lambda: SignatureIndex(dex_matrix))
+
+    # The same queries as one batch, against one at a time, in seconds per mon
+    results['find_partner_batch_query'] = best_time( \
+        lambda: index.find_partners_batch(names)) / num_queries
+
+    # Filtered partner queries, with a loose and a tight filter
+    eligibility = EligibilityIndex(dex_matrix)
+    results['eligibility_index_build'] = best_time( \
+        lambda: EligibilityIndex(dex_matrix))
+    for name, filters in (('loose', {'exclude_alt_forms': True}), \
+                          ('tight', {'exclude_alt_forms': True, \
+                                     'min_stats': {'spe': 110}, \
+                                     'types': ['steel', 'fairy']})):
+        queries = iter(names * 3)
+        results['find_partner_{}_filter_query'.format(name)] = best_time( \
+            lambda: index.find_partners(next(queries), 10, \
+                                        eligibility.rows(**filters)), \
+            number=num_queries)
+
+    # Writing a mon's whole partner ranking in every format
+    results_path = osp.join(temp_dir, 'results')
+    for fmt in sorted(WRITERS):
+        results['write_all_partners_{}'.format(fmt)] = best_time( \
+            lambda: write_ranking(index, names[0], results_path, fmt), \
+            repeat=1)
+
+    # Every scoring kernel over one mon against the whole dex, and over every
+    # pair of type signatures
+    chart = dex_matrix.chart
+    pair_products = chart.wri[:, None, :] * chart.wri[None, :, :]
+    for scorer in sorted(SCORERS):
+        scored_matrix = dex_matrix.with_scorer(scorer)
+        kernel = get_scorer(scorer)
+        queries = iter(names * 3)
+        results['scorer_{}_partner'.format(scorer)] = best_time( \
+            lambda: scored_matrix.partner_scores(next(queries)), \
+            number=num_queries)
+        results['scorer_{}_table'.format(scorer)] = best_time( \
+            lambda: kernel(pair_products, scored_matrix.weights))
+
+    # Team search around three seeds
+    seeds = dex_matrix.names[:3]
+    results['build_team_3_seeds'] = best_time( \
+        lambda: index.search_teams(seeds, 10), repeat=1)
+    results['build_team_3_seeds_filtered'] = best_time( \
+        lambda: index.search_teams(seeds, 10, max_uncovered=1, \
+                                   max_stacked=1), repeat=1)
+
+    # Weakness checks of random teams of six, with bit masks and with floats
+    teams = rng.integers(num_mons, size=(10000, 6))
+    results['team_weakness_masks'] = best_time( \
+        lambda: team_weaknesses_masks(dex_matrix.masks[teams]))
+    results['team_weakness_floats'] = best_time( \
+        lambda: team_weaknesses_floats(dex_matrix.wri[teams]))
+
+    # Hits to KO from 100 attackers against the whole dex, with the damage
+    # arrays and one pair at a time
+    calculator = DamageCalculator(dex_matrix)
+    attackers = rng.integers(num_mons, size=100)
+    results['damage_hits_100_attackers'] = best_time( \
+        lambda: calculator.hits_to_ko(attackers), repeat=1)
+    pairs = iter(rng.integers(num_mons, size=(3 * num_queries, 2)).tolist())
+    results['damage_hits_pair_loop'] = best_time( \
+        lambda: damage_loop(calculator, *next(pairs)), number=num_queries)
+
+    # Role analysis
+    results['make_stats_matrix'] = best_time(lambda: make_stats_matrix(dex))
+    stats_matrix, _ = make_stats_matrix(dex)
+    results['get_role_data'] = best_time(lambda: get_role_data(stats_matrix))
+
+    # Similar mons by role, from the role index and by scanning the dex
+    role_path = osp.join(temp_dir, 'role_tree')
+    results['role_index_build'] = best_time( \
+        lambda: build_role_index(dex, role_path), repeat=1)
+    role_index = RoleIndex(role_path)
+    queries = iter(names * 3)
+    results['role_similar_query'] = best_time( \
+        lambda: role_index.similar(next(queries)), number=num_queries)
+    points, _, _ = role_points(dex)
+    rows = iter([role_index.name_indices[name] for name in names] * 3)
+    results['role_similar_linear_query'] = best_time( \
+        lambda: similar_linear(points, next(rows)), number=num_queries)
+    return results
+
+
+def run_suite(data_path, sizes=DEFAULT_SIZES, seed=0):
+    # Runs bench_size for every size and returns the results with a little
+    # information about the machine they were measured on
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for num_mons in sizes:
+            print('Benchmarking {} mons...'.format(num_mons), file=sys.stderr)
+            results[str(num_mons)] = bench_size(num_mons, data_path, \
+                                                temp_dir, seed)
+    return {'meta': {'python': platform.python_version(), \
+                     'numpy': np.__version__, \
+                     'machine': platform.machine(), 'seed': seed}, \
+            'results': results}
+
+
+def print_suite(suite):
+    # Prints a table of every hot path's time at every size
+    sizes = list(suite['results'])
+    benches = list(suite['results'][sizes[0]])
+    width = max(len(bench) for bench in benches)
+    print(' ' * width + ''.join('{:>14}'.format(size) for size in sizes))
+    for bench in benches:
+        print(bench.ljust(width) + ''.join('{:>11.3f} ms'.format( \
+              suite['results'][size].get(bench, float('nan')) * 1e3) \
+              for size in sizes))
+
+
+def compare(suite, baseline, tolerance=0.25, min_seconds=1e-4):
+    # Returns a list of (size, bench, baseline time, new time) for every hot
+    # path that got more than tolerance slower than the baseline.  Differences
+    # under min_seconds are treated as noise.
+    regressions = []
+    for size, results in suite['results'].items():
+        for bench, seconds in results.items():
+            old_seconds = baseline['results'].get(size, {}).get(bench)
+            if old_seconds is None:
+                continue
+            if seconds > old_seconds * (1 + tolerance) and \
+               seconds - old_seconds > min_seconds:
+                regressions.append((size, bench, old_seconds, seconds))
+    return regressions
+
+
+def check_startup(data_path, mon='garchomp', repeat=5):
+    # Times a partner query from the command line in a fresh interpreter,
+    # best of repeat.  Returns the seconds it took and the lazily imported
+    # modules it imported anyway.
+    args = [sys.executable, '-c', STARTUP_SCRIPT, '--data', data_path, \
+            'partner', mon, '--results_path', os.devnull]
+    cwd = osp.dirname(osp.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        output = subprocess.run(args, cwd=cwd, check=True, \
+                                capture_output=True, text=True).stdout
+        times.append(timer() - start)
+    imported = output.rsplit('imported:', 1)[1].strip()
+    return min(times), [name for name in imported.split(',') if name]
+
+
+def check_binary_stdout(data_path, mon='garchomp'):
+    # Runs a partner query from the command line with binary results on
+    # stdout and its profile on, and returns whether what it wrote to stdout
+    # is the same results file, read back with read_binary, as the one it
+    # writes to a path
+    args = [sys.executable, 'pokemon_team_builder.py', '--data', data_path, \
+            'partner', mon, '--format', 'binary', '--profile']
+    cwd = osp.dirname(osp.abspath(__file__))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = osp.join(temp_dir, 'file.bin')
+        stdout_path = osp.join(temp_dir, 'stdout.bin')
+        subprocess.run(args + ['--results_path', file_path], cwd=cwd, \
+                       check=True, capture_output=True)
+        with open(stdout_path, 'wb') as f_out:
+            subprocess.run(args, cwd=cwd, check=True, stdout=f_out, \
+                           stderr=subprocess.DEVNULL)
+        with open(file_path, 'rb') as f_in, open(stdout_path, 'rb') as f_std:
+            if f_in.read() != f_std.read():
+                return False
+        results = list(iter_binary(stdout_path))
+        return bool(results) and results == list(iter_binary(file_path))
+
+
+def run_legacy(data_path):
+    # Compares the current hot paths against the original implementations on
+    # the real dex
+    results = bench_type_synergy(data_path)
+    print('type_synergy per pair: {:.2f} us -> {:.3f} us ({:.0f}x)'.format( \
+          results['legacy_us'], results['current_us'], results['speedup']))
+    results = bench_find_partner(data_path)
+    print('find_partner over {} mons: {:.2f} ms build, {:.1f} us per ' \
+          'query'.format(results['num_mons'], results['build_ms'], \
+                         results['query_us']))
+    results = bench_team_search(data_path)
+    print('team search: {:.1f} ms over mons -> {:.1f} ms over signatures ' \
+          '({:.1f}x, {:.1f} mons per signature)'.format(results['mon_ms'], \
+          results['signature_ms'], results['speedup'], \
+          results['collapse_ratio']))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = bench_load(data_path, osp.join(temp_dir, 'pokedex.snapshot'))
+    print('load dex: {:.2f} ms from JSON -> {:.2f} ms from snapshot'.format( \
+          results['json_ms'], results['snapshot_ms']))
+
+
+def main(data_path, sizes=DEFAULT_SIZES, seed=0, out_path=None, \
+         baseline_path=None, save_baseline_path=None, tolerance=0.25, \
+         legacy=False, startup=False, startup_budget=STARTUP_BUDGET):
+    if legacy:
+        run_legacy(data_path)
+        return 0
+    if startup:
+        seconds, imported = check_startup(data_path)
+        print('Partner query from the command line: {:.0f} ms (budget {:.0f} ' \
+              'ms).'.format(seconds * 1e3, startup_budget * 1e3))
+        status = 0
+        if seconds > startup_budget:
+            print('OVER BUDGET: the partner query took {:.0f} ms.'.format( \
+                  seconds * 1e3), file=sys.stderr)
+            status = 1
+        if imported:
+            print('LAZY IMPORTS: the partner query imported {}.'.format( \
+                  ', '.join(imported)), file=sys.stderr)
+            status = 1
+        if check_binary_stdout(data_path):
+            print('Binary results on stdout read back with read_binary.')
+        else:
+            print('BINARY STDOUT: the binary results written to stdout ' \
+                  'don\'t read back with read_binary.', file=sys.stderr)
+            status = 1
+        return status
+
+    suite = run_suite(data_path, sizes, seed)
+    print_suite(suite)
+    for path in (out_path, save_baseline_path):
+        if path is not None:
+            with open(path, 'w') as f_out:
+                json.dump(suite, f_out, indent=2)
+
+    if baseline_path is not None:
+        with open(baseline_path) as f_in:
+            baseline = json.load(f_in)
+        regressions = compare(suite, baseline, tolerance)
+        for size, bench, old_seconds, seconds in regressions:
+            print('REGRESSION: {} at {} mons went from {:.3f} ms to {:.3f} ' \
+                  'ms ({:+.0%}).'.format(bench, size, old_seconds * 1e3, \
+                                        seconds * 1e3, \
+                                        seconds / old_seconds - 1), \
+                  file=sys.stderr)
+        if regressions:
+            return 1
+        print('No regressions against {}.'.format(baseline_path))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the real data directory')
+    parser.add_argument('--sizes', nargs='+', type=int, \
+                        default=list(DEFAULT_SIZES), \
+                        help='synthetic dex sizes to benchmark')
+    parser.add_argument('--seed', type=int, default=0, \
+                        help='random seed for the synthetic dexes')
+    parser.add_argument('--out', help='path to write the JSON results to')
+    parser.add_argument('--baseline', \
+                        help='JSON results to compare against. Exits with ' + \
+                        'status 1 if anything regressed.')
+    parser.add_argument('--save_baseline', \
+                        help='path to store these results as a new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, \
+                        help='allowed slowdown against the baseline, as a ' + \
+                        'fraction')
+    parser.add_argument('--legacy', action='store_true', \
+                        help='compare against the original implementations ' + \
+                        'on the real dex instead')
+    parser.add_argument('--startup', action='store_true', \
+                        help='check that a partner query from the command ' + \
+                        'line stays within the startup budget, imports ' + \
+                        'none of the modules it doesn\'t need, and writes ' + \
+                        'binary results to stdout that read back, instead')
+    parser.add_argument('--startup_budget', type=float, \
+                        default=STARTUP_BUDGET, \
+                        help='startup budget in seconds')
+    args = parser.parse_args()
+    sys.exit(main(args.data, args.sizes, args.seed, args.out, args.baseline, \
+                  args.save_baseline, args.tolerance, args.legacy, \
+                  args.startup, args.startup_budget))
@@ -0,0 +1,198 @@
+# Author:     Andrew Smith
+# File:       damage.py
+# Project:    Pokemon Team Builder
+
+'''
+damage.py: This file computes the damage every Pokemon does to every other
+           Pokemon with a move of every attacking type, as one broadcasted
+           array computation over the dex instead of a loop over pairs, and
+           from it who OHKOs or 2HKOs whom.  Run it directly to save the
+           hits-to-KO tables of a data directory.
+
+Every mon is taken at level 100 with the stats from
+stats_analysis.stats_matrix_from_arrays, and every move has the same base
+power.  Damage follows the standard formula:
+    base    = floor(floor(floor(2 * level / 5 + 2) * power * A / D) / 50) + 2
+    damage  = floor(floor(floor(base * roll / 100) * STAB) * effectiveness)
+where A / D is Atk / Def for physical moves and SpA / SpD for special ones,
+roll goes from 85 to 100, STAB is 1.5 for moves of the attacker's own types,
+and effectiveness is the defender's multiplier from the type chart.  A move
+that isn't resisted completely always does at least 1.  With category='best'
+every attacker uses whichever of its physical and special moves hits harder.
+
+The minimum roll gives the damage a move is guaranteed to do and the maximum
+the most it can do, so a KO on the minimum roll is guaranteed and a KO on the
+maximum roll is possible.
+'''
+
+import argparse
+import os
+import os.path as osp
+import numpy as np
+from type_functions import DATA_DIR, NUM_TYPES, TypeChart
+from dex_matrix import DexMatrix
+from dex_snapshot import load_pokedex
+from stats_analysis import stats_matrix_from_arrays
+
+LEVEL = 100
+POWER = 80
+STAB = 1.5
+MIN_ROLL = 85
+MAX_ROLL = 100
+CATEGORIES = ('physical', 'special', 'best')
+
+# Most bytes of the float64 attacker x defender x type arrays computed at once.
+# Small enough to stay in cache, which is quicker than fewer, bigger chunks.
+CHUNK_BYTES = 2**20
+
+# Hits to KO when a mon can't damage another at all
+NO_KO = 255
+
+
+class DamageCalculator:
+    # Holds, for one dex matrix:
+    #   hp:           level 100 HP of every mon
+    #   attack:       (N, 2) level 100 Atk and SpA
+    #   defense:      (N, 2) level 100 Def and SpD
+    #   stab:         (N, 18) STAB multiplier of every attacking type
+    #   effectiveness (N, 18) multiplier every mon takes from every type
+    # Everything is computed in chunks of attackers of at most chunk_bytes.
+
+    def __init__(self, dex_matrix, power=POWER, category='best', \
+                 chunk_bytes=CHUNK_BYTES):
+        if category not in CATEGORIES:
+            raise ValueError('Unknown category {}, choose from {}.'.format( \
+                             category, ', '.join(CATEGORIES)))
+        self.dex_matrix = dex_matrix
+        self.power = power
+        self.category = category
+        self.chunk_bytes = chunk_bytes
+
+        # | HP | Atk | Def | SpA | SpD | at level 100; the speed column isn't
+        # needed
+        stats = stats_matrix_from_arrays(dex_matrix.stats, \
+                                         np.zeros(len(dex_matrix)))
+        self.hp = stats[:, 0]
+        self.attack = stats[:, [1, 3]]
+        self.defense = stats[:, [2, 4]]
+        types = dex_matrix.chart.type_mask[dex_matrix.combo_ids]
+        self.stab = np.where(types, STAB, 1.0)
+        self.effectiveness = dex_matrix.wri
+
+    def __len__(self):
+        return len(self.hp)
+
+    def _rows(self, rows):
+        return np.arange(len(self)) if rows is None else \
+               np.asarray(rows, dtype=np.intp)
+
+    def base_damage(self, attackers, defenders):
+        # Returns the (A, D) damage before the roll, STAB, and type of every
+        # attacker against every defender, by dex rows
+        columns = {'physical': [0], 'special': [1], 'best': [0, 1]}
+        columns = columns[self.category]
+        ratio = self.attack[attackers][:, None, columns] / \
+                self.defense[defenders][None, :, columns]
+        base = np.floor(np.floor(np.floor(2 * LEVEL / 5 + 2) * self.power * \
+                                 ratio) / 50) + 2
+
+        # The floors keep the order of the ratios, so the better category is
+        # the same for every roll and type
+        return base.max(axis=-1)
+
+    def damage(self, attackers=None, defenders=None, roll=MIN_ROLL):
+        # Returns the (A, D, 18) damage every attacker does to every defender
+        # with a move of every type at a roll from MIN_ROLL to MAX_ROLL, by
+        # dex rows, which default to the whole dex
+        attackers = self._rows(attackers)
+        defenders = self._rows(defenders)
+        base = self.base_damage(attackers, defenders)
+        damage = np.floor(base * roll / 100)[:, :, None]
+        damage = np.floor(damage * self.stab[attackers][:, None, :])
+        effectiveness = self.effectiveness[defenders][None, :, :]
+        damage = np.floor(damage * effectiveness)
+        return np.where(effectiveness > 0, np.maximum(damage, 1), 0)
+
+    def chunks(self, attackers=None, defenders=None):
+        # Yields the attacker rows in chunks whose damage arrays fit in
+        # chunk_bytes
+        attackers = self._rows(attackers)
+        defenders = self._rows(defenders)
+        size = max(1, self.chunk_bytes // max(1, len(defenders) * \
+                                             NUM_TYPES * 8))
+        for start in range(0, len(attackers), size):
+            yield attackers[start:start + size]
+
+    def hits_to_ko(self, attackers=None, defenders=None, roll=MIN_ROLL, \
+                   coverage=False):
+        # Returns the (A, D) uint8 number of hits every attacker needs to KO
+        # every defender at a roll with its best move, NO_KO if it can't hurt
+        # it.  Attackers only use moves of their own types unless coverage is
+        # set, in which case they have a move of every type.
+        defenders = self._rows(defenders)
+        hits = []
+        for chunk in self.chunks(attackers, defenders):
+            damage = self.damage(chunk, defenders, roll)
+            if not coverage:
+                damage *= self.stab[chunk][:, None, :] > 1
+            best = damage.max(axis=-1)
+            with np.errstate(divide='ignore'):
+                chunk_hits = np.ceil(self.hp[defenders] / best)
+            hits.append(np.minimum(chunk_hits, NO_KO).astype(np.uint8))
+        if not hits:
+            return np.zeros((0, len(defenders)), dtype=np.uint8)
+        return np.concatenate(hits)
+
+    def ko_table(self, hits=1, guaranteed=True, attackers=None, \
+                 defenders=None, coverage=False):
+        # Returns the (A, D) table of which attackers KO which defenders in at
+        # most hits hits, on every roll if guaranteed and on the highest one
+        # otherwise.  hits=1 is the OHKO table and hits=2 the 2HKO table.
+        roll = MIN_ROLL if guaranteed else MAX_ROLL
+        return self.hits_to_ko(attackers, defenders, roll, coverage) <= hits
+
+    def ko_lists(self, mon, hits=1, guaranteed=True, coverage=False):
+        # Returns the names of the mons a mon KOs in at most hits hits, and of
+        # the mons that KO it, in dex order
+        row = [self.dex_matrix.index(mon)]
+        names = self.dex_matrix.names
+        kos = self.ko_table(hits, guaranteed, attackers=row, \
+                            coverage=coverage)[0]
+        koed_by = self.ko_table(hits, guaranteed, defenders=row, \
+                                coverage=coverage)[:, 0]
+        return [names[i] for i in np.flatnonzero(kos)], \
+               [names[i] for i in np.flatnonzero(koed_by)]
+
+
+def save_ko_tables(calculator, path, coverage=False):
+    # Saves the hits-to-KO tables of the whole dex on the lowest and highest
+    # rolls, along with the mon names, as an npz file
+    os.makedirs(osp.dirname(osp.abspath(path)), exist_ok=True)
+    np.savez(path, names=np.asarray(calculator.dex_matrix.names), \
+             min_roll=calculator.hits_to_ko(roll=MIN_ROLL, coverage=coverage), \
+             max_roll=calculator.hits_to_ko(roll=MAX_ROLL, coverage=coverage))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--out', help='path to write the tables to. ' + \
+                        'Defaults to ko_tables.npz in the data directory.')
+    parser.add_argument('--power', type=int, default=POWER, \
+                        help='base power of every move')
+    parser.add_argument('--category', choices=CATEGORIES, default='best', \
+                        help='which attacking stat moves use')
+    parser.add_argument('--coverage', action='store_true', \
+                        help='give every mon a move of every type instead ' + \
+                        'of only its own types')
+    args = parser.parse_args()
+
+    out_path = args.out or osp.join(args.data, 'ko_tables.npz')
+    pokedex, type_data = load_pokedex(args.data)
+    dex_matrix = DexMatrix(pokedex, TypeChart(type_data))
+    save_ko_tables(DamageCalculator(dex_matrix, args.power, args.category), \
+                   out_path, args.coverage)
+    print('Wrote the hits-to-KO tables of {} mons to {}.'.format( \
+          len(dex_matrix), out_path))
@@ -0,0 +1,121 @@
+# Author:     Andrew Smith
+# File:       dex_matrix.py
+# Project:    Pokemon Team Builder
+
+'''
+dex_matrix.py: This file holds the pokedex as arrays so that a mon can be scored
+               against every other mon in the dex at once instead of one pair
+               at a time.
+'''
+
+import copy
+import numpy as np
+from type_functions import get_chart
+from scorers import DEFAULT_SCORER, get_scorer, usage_weights
+
+
+def top_k(scores, k):
+    # Returns the indices of the k lowest scores in ascending order.  Uses a
+    # partial selection instead of sorting every score, and breaks ties by
+    # index so the order matches a stable sort of the whole array.
+    if k >= len(scores):
+        return np.argsort(scores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Find the k-th lowest score, then keep everything at or below it so ties
+    # on the boundary aren't dropped arbitrarily
+    kth_score = np.partition(scores, k - 1)[k - 1]
+    candidates = np.flatnonzero(scores <= kth_score)
+    order = np.lexsort((candidates, scores[candidates]))
+    return candidates[order[:k]]
+
+
+class DexMatrix:
+    # Stores the weaknesses, resistances, and immunities of every mon in the
+    # dex as an N x 18 matrix, built once per dex.  Mons are scored with the
+    # named scorer from scorers.py, and synergy is the chart's table of it for
+    # every pair of type signatures.
+
+    def __init__(self, dex, chart=None, scorer=DEFAULT_SCORER):
+        if chart is None:
+            chart = get_chart()
+        names = list(dex.keys())
+
+        # Row of each mon's type signature in the chart's combination tables
+        combo_ids = [chart.combo_index(dex[name]['type']) for name in names]
+        stats = [dex[name]['stats'] for name in names]
+        alt_forms = [dex[name].get('alt_form', False) for name in names]
+
+        # Tiers are only known once they have been scraped
+        tiers = [dex[name].get('tier') for name in names]
+        if not any(tier is not None for tier in tiers):
+            tiers = None
+        self._set_columns(chart, names, combo_ids, stats, alt_forms, tiers)
+        self._set_scorer(scorer)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, chart=None, scorer=DEFAULT_SCORER):
+        # Builds the dex matrix straight from the columns of a DexSnapshot
+        # without going through the pokedex dict
+        if chart is None:
+            chart = get_chart()
+        dex_matrix = cls.__new__(cls)
+        dex_matrix._set_columns(chart, snapshot.names, \
+                                snapshot.combo_ids(chart), snapshot.stats, \
+                                snapshot.alt_form, snapshot.tiers())
+        dex_matrix._set_scorer(scorer)
+        return dex_matrix
+
+    def with_scorer(self, scorer):
+        # Returns a dex matrix sharing this one's arrays that scores with a
+        # different scorer
+        dex_matrix = copy.copy(self)
+        dex_matrix._set_scorer(scorer)
+        return dex_matrix
+
+    def _set_scorer(self, scorer):
+        self.scorer = scorer
+        self.kernel = get_scorer(scorer)
+
+        # Only the usage scorer weights attacking types, by how many mons in
+        # this dex have each type
+        self.weights = None
+        if scorer == 'usage':
+            self.weights = usage_weights(self.type_counts())
+        self.synergy = self.chart.synergy_table(scorer, self.weights)
+
+    def _set_columns(self, chart, names, combo_ids, stats, alt_forms=None, \
+                     tiers=None):
+        self.chart = chart
+        self.names = names
+        self.name_indices = {name: i for i, name in enumerate(self.names)}
+        self.combo_ids = np.asarray(combo_ids, dtype=np.intp)
+        self.wri = chart.wri[self.combo_ids]
+        self.masks = chart.masks[self.combo_ids]
+
+        # | HP | Atk | Def | SpA | SpD | Spe |
+        self.stats = np.asarray(stats, dtype=np.int64).reshape(len(names), 6)
+        self.alt_forms = np.zeros(len(names), dtype=bool) if alt_forms is \
+                         None else np.asarray(alt_forms, dtype=bool)
+        self.tiers = tiers
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, mon):
+        return self.name_indices[mon]
+
+    def type_counts(self):
+        # Number of mons in the dex with each type
+        return self.chart.type_mask[self.combo_ids].sum(axis=0)
+
+    def partner_scores(self, mon):
+        # Returns the type synergy of a mon with every mon in the dex
+        return self.kernel(self.wri[self.index(mon)] * self.wri, self.weights)
+
+    def find_partners(self, mon, k=10):
+        # Returns the k best partners of a mon as (name, score) tuples, best
+        # first
+        scores = self.partner_scores(mon)
+        return [(self.names[i], float(scores[i])) for i in top_k(scores, k)]
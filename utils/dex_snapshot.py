@@ -0,0 +1,271 @@
+# Author:     Andrew Smith
+# File:       dex_snapshot.py
+# Project:    Pokemon Team Builder
+
+'''
+dex_snapshot.py: This file compiles pokedex.json and type_data.json into a
+                 columnar binary snapshot that can be memory mapped instead of
+                 parsed.  Run it directly to (re)build the snapshot.
+
+Layout of the snapshot file:
+    magic (8 bytes) | header length (uint64) | header | columns
+The header lists every column as name, dtype, shape, and byte offset, and the
+columns themselves are raw little-endian arrays aligned to 8 bytes.  Strings,
+the mon names and the names of their tiers, are stored as their concatenated
+UTF-8 bytes and the offsets where each one starts.
+'''
+
+import json
+import argparse
+import os
+import os.path as osp
+import struct
+import numpy as np
+from type_functions import DATA_DIR, TYPE_INDICES, TYPE_NAMES, NUM_TYPES
+
+SNAPSHOT_FILE = 'pokedex.snapshot'
+SOURCE_FILES = ('pokedex.json', 'type_data.json')
+MAGIC = b'PTBSNAP2'
+NO_TYPE = 255
+NO_TIER = -1
+ALIGNMENT = 8
+
+# Multipliers stored in the type matrix and the type_data.json list each one
+# comes from
+MULTIPLIER_LISTS = ((2, 'weaknesses'), (1/2, 'resistances'), (0, 'immunities'))
+
+
+def source_stamps(data_path):
+    # Size and modification time of the source files, used to tell whether a
+    # snapshot is still fresh
+    stamps = []
+    for file_name in SOURCE_FILES:
+        info = os.stat(osp.join(data_path, file_name))
+        stamps.extend([info.st_size, info.st_mtime_ns])
+    return np.asarray(stamps, dtype='<u8')
+
+
+def encode_strings(strings):
+    # Returns the concatenated UTF-8 bytes of a list of strings and the
+    # offsets they start at, with the total length last
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(strings) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(string) for string in encoded])
+    return np.frombuffer(b''.join(encoded), dtype='u1'), offsets
+
+
+def decode_strings(data, offsets):
+    # Inverse of encode_strings
+    data = bytes(data)
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') \
+            for i in range(len(offsets) - 1)]
+
+
+def build_columns(pokedex, type_data):
+    # Turns the pokedex and type data dicts into the snapshot's columns
+    names = list(pokedex.keys())
+    names_data, name_offsets = encode_strings(names)
+
+    # Every distinct tier once, in order of appearance, and each mon's index
+    # into them, NO_TIER for mons without one
+    tiers = [pokedex[name].get('tier') for name in names]
+    tier_names = list(dict.fromkeys(str(tier) for tier in tiers \
+                                    if tier is not None))
+    tier_indices = {tier: i for i, tier in enumerate(tier_names)}
+    tier_ids = np.asarray([NO_TIER if tier is None else \
+                           tier_indices[str(tier)] for tier in tiers], \
+                          dtype='<i2')
+    tier_data, tier_offsets = encode_strings(tier_names)
+
+    type_ids = np.full((len(names), 2), NO_TYPE, dtype='u1')
+    for row, name in enumerate(names):
+        for col, type in enumerate(pokedex[name]['type']):
+            type_ids[row, col] = TYPE_INDICES[type]
+
+    type_matrix = np.ones((NUM_TYPES, NUM_TYPES), dtype='<f8')
+    for type, row in zip(TYPE_NAMES, type_matrix):
+        for multiplier, key in MULTIPLIER_LISTS:
+            for attacking_type in type_data[type][key]:
+                row[TYPE_INDICES[attacking_type]] = multiplier
+
+    return {'names': names_data, \
+            'name_offsets': name_offsets, \
+            'stats': np.asarray([pokedex[name]['stats'] for name in names], \
+                                dtype='<i2').reshape(len(names), 6), \
+            'type_ids': type_ids, \
+            'speed_rank': np.asarray([pokedex[name]['speed_rank'] \
+                                      for name in names], dtype='<i4'), \
+            'dex_id': np.asarray([pokedex[name]['dex_id'] \
+                                  for name in names], dtype='<i4'), \
+            'alt_form': np.asarray([pokedex[name].get('alt_form', False) \
+                                    for name in names], dtype='u1'), \
+            'tier_ids': tier_ids, \
+            'tier_names': tier_data, \
+            'tier_offsets': tier_offsets, \
+            'type_matrix': type_matrix}
+
+
+def write_snapshot(path, columns):
+    # Writes a dict of arrays in the snapshot layout
+    header = []
+    offset = 0
+    for name, array in columns.items():
+        header.append({'name': name, 'dtype': array.dtype.str, \
+                       'shape': list(array.shape), 'offset': offset})
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps(header).encode()
+    header += b' ' * (-len(header) % ALIGNMENT)
+
+    # Write to a temporary file first so a reader never maps half a snapshot
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f_out:
+        f_out.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for array in columns.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f_out.write(data + b'\0' * (-len(data) % ALIGNMENT))
+    os.replace(temp_path, path)
+
+
+def compile_snapshot(data_path=DATA_DIR, path=None):
+    # Builds the snapshot for a data directory and returns its path
+    if path is None:
+        path = osp.join(data_path, SNAPSHOT_FILE)
+    stamps = source_stamps(data_path)
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        pokedex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        type_data = json.load(f_in)
+    columns = build_columns(pokedex, type_data)
+    columns['sources'] = stamps
+    write_snapshot(path, columns)
+    return path
+
+
+class DexSnapshot:
+    # Memory-mapped view of a snapshot file.  Every column is an array backed
+    # by the file, so only the pages that are used get read.
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype='u1', mode='r')
+        if bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError('{} is not a pokedex snapshot.'.format(path))
+        header_start = len(MAGIC) + 8
+        header_len, = struct.unpack('<Q', bytes(self._map[len(MAGIC): \
+                                                           header_start]))
+        data_start = header_start + header_len
+        self.columns = {}
+        for column in json.loads(bytes(self._map[header_start:data_start])):
+            dtype = np.dtype(column['dtype'])
+            count = int(np.prod(column['shape'], dtype=np.int64))
+            start = data_start + column['offset']
+            self.columns[column['name']] = self._map[start:start + count * \
+                dtype.itemsize].view(dtype).reshape(column['shape'])
+
+        self.names = decode_strings(self.columns['names'], \
+                                    self.columns['name_offsets'])
+        self.tier_names = decode_strings(self.columns['tier_names'], \
+                                         self.columns['tier_offsets'])
+        self.name_indices = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getattr__(self, name):
+        # Columns are available as attributes, e.g. snapshot.stats
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def is_fresh(self, data_path):
+        # Whether the source files are unchanged since the snapshot was built
+        try:
+            return np.array_equal(self.columns['sources'], \
+                                  source_stamps(data_path))
+        except OSError:
+            return False
+
+    def types(self, row):
+        return [TYPE_NAMES[i] for i in self.type_ids[row] if i != NO_TYPE]
+
+    def tiers(self):
+        # Every mon's tier, or None if the dex has no tier data, the same as
+        # DexMatrix takes them
+        if not self.tier_names:
+            return None
+        return [None if i == NO_TIER else self.tier_names[i] for i in \
+                self.tier_ids.tolist()]
+
+    def combo_ids(self, chart):
+        # Row of every mon's type signature in a chart's combination tables
+        type_ids = self.type_ids.astype(np.intp)
+        second = np.where(type_ids[:, 1] == NO_TYPE, NUM_TYPES, type_ids[:, 1])
+        return chart.pair_table[type_ids[:, 0], second]
+
+    def to_pokedex(self):
+        # Rebuilds the pokedex.json dict from the columns
+        dex_ids = self.dex_id.tolist()
+        stats = self.stats.tolist()
+        alt_forms = self.alt_form.astype(bool).tolist()
+        speed_ranks = self.speed_rank.tolist()
+        type_ids = self.type_ids.tolist()
+        tiers = self.tiers() or [None] * len(self)
+        pokedex = {}
+        for row, name in enumerate(self.names):
+            pokedex[name] = {'dex_id': dex_ids[row], \
+                             'type': [TYPE_NAMES[i] for i in type_ids[row] \
+                                      if i != NO_TYPE], \
+                             'stats': stats[row], \
+                             'alt_form': alt_forms[row], \
+                             'speed_rank': speed_ranks[row]}
+            if tiers[row] is not None:
+                pokedex[name]['tier'] = tiers[row]
+        return pokedex
+
+    def to_type_data(self):
+        # Rebuilds the type_data.json dict from the type matrix
+        type_data = {}
+        for type, row in zip(TYPE_NAMES, self.type_matrix.tolist()):
+            type_data[type] = {key: [TYPE_NAMES[i] for i, value in \
+                                     enumerate(row) if value == multiplier] \
+                               for multiplier, key in MULTIPLIER_LISTS}
+        return type_data
+
+
+def load_fresh_snapshot(data_path=DATA_DIR):
+    # Returns the data directory's snapshot if it exists and is fresh,
+    # otherwise None
+    path = osp.join(data_path, SNAPSHOT_FILE)
+    if not osp.exists(path):
+        return None
+    try:
+        snapshot = DexSnapshot(path)
+    except ValueError:
+        return None
+    return snapshot if snapshot.is_fresh(data_path) else None
+
+
+def load_pokedex(data_path=DATA_DIR):
+    # Loads the pokedex and type data dicts, preferring a fresh snapshot over
+    # parsing the JSON files
+    snapshot = load_fresh_snapshot(data_path)
+    if snapshot is not None:
+        return snapshot.to_pokedex(), snapshot.to_type_data()
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        pokedex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        type_data = json.load(f_in)
+    return pokedex, type_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--out', help='path to write the snapshot to. ' + \
+                        'Defaults to {} in the data directory.'.format( \
+                        SNAPSHOT_FILE))
+    args = parser.parse_args()
+    print('Wrote {}.'.format(compile_snapshot(args.data, args.out)))
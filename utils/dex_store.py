@@ -0,0 +1,320 @@
+# Author:     Andrew Smith
+# File:       dex_store.py
+# Project:    Pokemon Team Builder
+
+'''
+dex_store.py: This file keeps the pokedex in an indexed SQLite database as an
+              alternative to pokedex.json, so a query like "steel types with
+              base speed over 90" is answered from the indexes and only loads
+              the mons that match instead of parsing the whole file.  Run it
+              directly to (re)build the store from the JSON files.
+
+Tables:
+    pokemon:    one row per mon in dex order, with its dex id, types, base
+                stats, base stat total, speed rank, alt form flag, and tier.
+                Every one of those but the types has an index.
+    mon_types:  (type, row) for every type of every mon, keyed by type so a
+                type filter is an index lookup
+    meta:       the type data as JSON and the stamps of the source files the
+                store was built from, if it was built from them
+
+Filters are the keyword arguments of eligibility.EligibilityIndex.mask, so the
+same filters can be pushed down into the store or applied after loading.
+'''
+
+import json
+import argparse
+import os
+import os.path as osp
+import sqlite3
+from type_functions import DATA_DIR, TYPE_INDICES
+from dex_snapshot import SOURCE_FILES, source_stamps
+from eligibility import stat_minimum
+
+STORE_FILE = 'pokedex.sqlite'
+STAT_COLUMNS = ('hp', 'atk', 'def', 'spa', 'spd', 'spe')
+
+# Rows inserted per executemany call while writing
+BATCH_ROWS = 1000
+
+SCHEMA = '''
+CREATE TABLE pokemon (
+    row INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    dex_id INTEGER NOT NULL,
+    type_1 TEXT NOT NULL,
+    type_2 TEXT,
+    hp INTEGER NOT NULL,
+    atk INTEGER NOT NULL,
+    def INTEGER NOT NULL,
+    spa INTEGER NOT NULL,
+    spd INTEGER NOT NULL,
+    spe INTEGER NOT NULL,
+    bst INTEGER NOT NULL,
+    speed_rank INTEGER NOT NULL,
+    alt_form INTEGER NOT NULL,
+    tier TEXT
+);
+CREATE TABLE mon_types (
+    type TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (type, row)
+) WITHOUT ROWID;
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# Created once the rows are in, which is quicker than keeping them up to date
+# through every insert
+INDEXES = ['CREATE INDEX pokemon_{0} ON pokemon ({0})'.format(column) for \
+           column in ('dex_id',) + STAT_COLUMNS + ('bst', 'speed_rank', \
+                                                   'alt_form')] + \
+          ['CREATE INDEX pokemon_tier ON pokemon (tier COLLATE NOCASE)']
+
+POKEMON_COLUMNS = ('name', 'dex_id', 'type_1', 'type_2') + STAT_COLUMNS + \
+                  ('bst', 'speed_rank', 'alt_form', 'tier')
+
+
+class StoreWriter:
+    # Writes pokedex entries to a new store one at a time, in the same way as
+    # pokedex_scraper.PokedexWriter.  Everything is inserted in one
+    # transaction in batches of BATCH_ROWS, into a temporary file that close()
+    # only moves into place once it is complete.  Leaving a with block on an
+    # exception calls abort() instead, which throws the whole write away.
+
+    def __init__(self, path, type_data=None, sources=None):
+        self.path = path
+        self.type_data = type_data
+        self.sources = sources
+        self.count = 0
+        self._temp_path = path + '.tmp'
+        if osp.exists(self._temp_path):
+            os.remove(self._temp_path)
+        self._connection = sqlite3.connect(self._temp_path, \
+                                           isolation_level=None)
+
+        # Nothing reads the temporary file before it is complete, so it
+        # doesn't need a journal
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._connection.executescript(SCHEMA)
+        self._connection.execute('BEGIN')
+        self._pokemon = []
+        self._types = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, name, entry):
+        types = entry['type']
+        stats = [int(stat) for stat in entry['stats']]
+        self._pokemon.append((self.count, name, entry['dex_id'], types[0], \
+                              types[1] if len(types) > 1 else None, *stats, \
+                              sum(stats), entry['speed_rank'], \
+                              int(bool(entry.get('alt_form', False))), \
+                              entry.get('tier')))
+        self._types.extend((type, self.count) for type in types)
+        self.count += 1
+        if len(self._pokemon) >= BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        self._connection.executemany('INSERT INTO pokemon (row, {}) VALUES ' \
+                                     '({})'.format(', '.join(POKEMON_COLUMNS), \
+                                     ', '.join('?' * (len(POKEMON_COLUMNS) + \
+                                                      1))), self._pokemon)
+        self._connection.executemany('INSERT INTO mon_types VALUES (?, ?)', \
+                                     self._types)
+        self._pokemon = []
+        self._types = []
+
+    def close(self):
+        self._flush()
+        for index in INDEXES:
+            self._connection.execute(index)
+        meta = {'type_data': self.type_data}
+        if self.sources is not None:
+            meta['sources'] = [int(stamp) for stamp in self.sources]
+        self._connection.executemany('INSERT INTO meta VALUES (?, ?)', \
+                                     [(key, json.dumps(value)) for key, \
+                                      value in meta.items()])
+        self._connection.execute('COMMIT')
+        self._connection.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        # Rolls back everything written and removes the temporary file, so a
+        # store already at path is left as it was
+        self._connection.execute('ROLLBACK')
+        self._connection.close()
+        os.remove(self._temp_path)
+
+
+def build_store(data_path=DATA_DIR, path=None):
+    # Builds the store for a data directory from its JSON files and returns
+    # its path
+    if path is None:
+        path = osp.join(data_path, STORE_FILE)
+    stamps = source_stamps(data_path)
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        pokedex = json.load(f_in)
+    with open(osp.join(data_path, 'type_data.json')) as f_in:
+        type_data = json.load(f_in)
+    with StoreWriter(path, type_data, stamps) as writer:
+        for name, entry in pokedex.items():
+            writer.write(name, entry)
+    return path
+
+
+class DexStore:
+    # Read access to a store written by StoreWriter
+
+    def __init__(self, path):
+        self.path = path
+        if not osp.exists(path):
+            raise OSError('No pokedex store at {}.'.format(path))
+        self._connection = sqlite3.connect(path)
+        meta = dict(self._connection.execute('SELECT key, value FROM meta'))
+        self.sources = json.loads(meta['sources']) if 'sources' in meta \
+                       else None
+        self._type_data = json.loads(meta.get('type_data', 'null'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM pokemon') \
+                               .fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def is_fresh(self, data_path):
+        # Whether the data files are unchanged since the store was built
+        try:
+            return self.sources == source_stamps(data_path).tolist()
+        except OSError:
+            return False
+
+    def type_data(self):
+        if self._type_data is None:
+            raise ValueError('The store at {} has no type data.'.format( \
+                             self.path))
+        return self._type_data
+
+    def _where(self, exclude_alt_forms=False, types=None, min_stats=None, \
+               tier=None):
+        # Returns the WHERE clause and parameters of the filters, with the
+        # same errors as EligibilityIndex.mask
+        clauses = []
+        params = []
+        for stat, minimum in (min_stats or {}).items():
+            minimum = stat_minimum(stat, minimum)
+            clauses.append('{} >= ?'.format(stat))
+            params.append(minimum)
+        if types:
+            types = [type.lower() for type in types]
+            for type in types:
+                if type not in TYPE_INDICES:
+                    raise ValueError('Unknown type {}.'.format(type))
+            clauses.append('row IN (SELECT row FROM mon_types WHERE type IN ' \
+                           '({}))'.format(', '.join('?' * len(types))))
+            params.extend(types)
+        if exclude_alt_forms:
+            clauses.append('alt_form = 0')
+        if tier is not None:
+            tiers = [row[0] for row in self._connection.execute( \
+                     'SELECT DISTINCT lower(tier) FROM pokemon WHERE tier ' \
+                     'IS NOT NULL')]
+            if not tiers:
+                raise ValueError('The dex has no tier data to filter on.')
+            if tier.lower() not in tiers:
+                raise ValueError('Unknown tier {}, choose from {}.'.format( \
+                                 tier, ', '.join(sorted(tiers))))
+            clauses.append('tier = ? COLLATE NOCASE')
+            params.append(tier)
+        return ' AND '.join(clauses), params
+
+    def _select(self, columns, keep=None, **filters):
+        # Runs a query for the mons passing the filters, plus the mons named
+        # in keep whether they pass or not, in dex order
+        where, params = self._where(**filters)
+        if where and keep:
+            where = '({}) OR name IN ({})'.format(where, \
+                                                  ', '.join('?' * len(keep)))
+            params.extend(keep)
+        query = 'SELECT {} FROM pokemon'.format(columns)
+        if where:
+            query += ' WHERE ' + where
+        return self._connection.execute(query + ' ORDER BY row', params)
+
+    def names(self, keep=None, **filters):
+        # Names of the mons passing the filters, in dex order
+        return [row[0] for row in self._select('name', keep, **filters)]
+
+    def pokedex(self, keep=None, **filters):
+        # Returns the pokedex.json dict of the mons passing the filters, plus
+        # the mons named in keep, in dex order.  Without filters it is the
+        # whole pokedex.
+        pokedex = {}
+        for row in self._select(', '.join(POKEMON_COLUMNS), keep, **filters):
+            name, dex_id, type_1, type_2 = row[:4]
+            entry = {'dex_id': dex_id, \
+                     'type': [type_1] if type_2 is None else \
+                             [type_1, type_2], \
+                     'stats': list(row[4:10]), \
+                     'alt_form': bool(row[12]), \
+                     'speed_rank': row[11]}
+            if row[13] is not None:
+                entry['tier'] = row[13]
+            pokedex[name] = entry
+        return pokedex
+
+
+def open_store(data_path=DATA_DIR, path=None):
+    # Returns the store of a data directory, building it from the JSON files
+    # first if it is missing or they changed since it was built.  A store
+    # written straight by the scraper has no source stamps, so it is only
+    # used as it is while it is newer than the JSON files, or if there are
+    # none.  path defaults to STORE_FILE in the data directory.
+    if path is None:
+        path = osp.join(data_path, STORE_FILE)
+    source_paths = [osp.join(data_path, file_name) for file_name in \
+                    SOURCE_FILES]
+    has_sources = all(osp.exists(source) for source in source_paths)
+    if osp.exists(path):
+        store = DexStore(path)
+        if not has_sources:
+            return store
+        if store.sources is None:
+            store_time = os.stat(path).st_mtime_ns
+            if all(os.stat(source).st_mtime_ns <= store_time for source in \
+                   source_paths):
+                return store
+        elif store.is_fresh(data_path):
+            return store
+        store.close()
+    build_store(data_path, path)
+    return DexStore(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--out', help='path to write the store to. ' + \
+                        'Defaults to {} in the data directory.'.format( \
+                        STORE_FILE))
+    args = parser.parse_args()
+    print('Wrote {}.'.format(build_store(args.data, args.out)))
@@ -0,0 +1,225 @@
+# Author:     Andrew Smith
+# File:       dex_updates.py
+# Project:    Pokemon Team Builder
+
+'''
+dex_updates.py: This file lets single Pokemon be added to, patched in, or
+                removed from the pokedex without rebuilding it.  Speed ranks
+                come from a sorted speed index and role statistics from running
+                sums, so an edit only costs a full pass over the dex when the
+                role scores actually have to be renormalized.
+'''
+
+import json
+import argparse
+import bisect
+import os.path as osp
+import numpy as np
+from type_functions import DATA_DIR, TYPE_INDICES
+from stats_analysis import stats_matrix_from_arrays, raw_role_data, \
+                           finish_role_data
+
+# Fields every entry needs
+REQUIRED_FIELDS = ('dex_id', 'type', 'stats')
+
+# Standard deviation the | PD | SD | PO | SO | columns are scaled to, as in
+# get_role_data
+ROLE_STD = 25
+
+
+class IncrementalDex:
+    # A pokedex dict plus the indices needed to keep it up to date one entry at
+    # a time.
+    #   _speeds:     every mon's base speed in ascending order, so a mon's
+    #                speed_rank (the number of mons strictly slower than it) is
+    #                a bisect away
+    #   _raw:        each mon's unstandardized | PD | SD | PO | SO | scores
+    #   _sums:       running sums of _raw and of its squares, for the means and
+    #                standard deviations used to standardize the scores
+    # PD and SD only depend on a mon's own stats, so their sums are always kept
+    # exact.  PO and SO also depend on the mon's speed rank as a fraction of
+    # the dex size, which shifts for many mons when one is added, removed, or
+    # changes speed.  Those edits mark the offensive columns stale and they are
+    # recomputed in one vectorized pass the next time they are needed.
+
+    def __init__(self, pokedex):
+        self.pokedex = {name: dict(entry) for name, entry in pokedex.items()}
+        self._speeds = sorted(entry['stats'][5] for entry in \
+                              self.pokedex.values())
+        self._raw = {}
+        self._renormalize()
+
+    def __len__(self):
+        return len(self.pokedex)
+
+    def __contains__(self, name):
+        return name in self.pokedex
+
+    def speed_rank(self, name):
+        # Number of mons strictly slower than this one, in O(log n)
+        return bisect.bisect_left(self._speeds, self.pokedex[name]['stats'][5])
+
+    def insert(self, name, entry):
+        # Adds a new mon.  entry needs 'dex_id', 'type', and 'stats', and
+        # 'alt_form' defaults to False.
+        if name in self.pokedex:
+            raise ValueError('{} is already in the pokedex.'.format(name))
+        entry = self._check_entry(entry)
+        bisect.insort(self._speeds, entry['stats'][5])
+        self.pokedex[name] = entry
+
+        # The dex got bigger, so every mon's speed fraction moved
+        self._offense_stale = True
+        self._add_raw(name)
+
+    def remove(self, name):
+        # Removes a mon
+        entry = self.pokedex[name]
+        self._remove_raw(name)
+        del self._speeds[bisect.bisect_left(self._speeds, entry['stats'][5])]
+        del self.pokedex[name]
+        self._offense_stale = True
+
+    def update(self, name, **fields):
+        # Patches fields of an existing mon, e.g. update('garchomp',
+        # stats=[108, 130, 95, 80, 85, 102])
+        old_speed = self.pokedex[name]['stats'][5]
+        entry = self._check_entry(dict(self.pokedex[name], **fields))
+        self._remove_raw(name)
+        if entry['stats'][5] != old_speed:
+            # Only mons between the old and new speed change rank, but that
+            # still moves their offensive scores
+            del self._speeds[bisect.bisect_left(self._speeds, old_speed)]
+            bisect.insort(self._speeds, entry['stats'][5])
+            self._offense_stale = True
+        self.pokedex[name] = entry
+        self._add_raw(name)
+
+    def _check_entry(self, entry):
+        entry = dict(entry)
+        missing = [field for field in REQUIRED_FIELDS if field not in entry]
+        if missing:
+            raise ValueError('Entry is missing {}.'.format(', '.join(missing)))
+        if len(entry['stats']) != 6:
+            raise ValueError('Expected 6 stats, got {}.'.format( \
+                             len(entry['stats'])))
+        if not 1 <= len(entry['type']) <= 2 or \
+           any(type not in TYPE_INDICES for type in entry['type']):
+            raise ValueError('Bad type list {}.'.format(entry['type']))
+        entry['type'] = sorted(entry['type'])
+        entry['stats'] = [int(stat) for stat in entry['stats']]
+        entry.setdefault('alt_form', False)
+        entry['speed_rank'] = -1
+        return entry
+
+    def _raw_scores(self, name):
+        # Raw role scores of one mon at its current speed rank
+        stats = stats_matrix_from_arrays(self.pokedex[name]['stats'], \
+                                         [self.speed_rank(name)], len(self))
+        return raw_role_data(stats)[0]
+
+    def _add_raw(self, name):
+        raw = self._raw_scores(name)
+        self._raw[name] = raw
+        self._sums += raw
+        self._square_sums += raw ** 2
+        self._roles = None
+
+    def _remove_raw(self, name):
+        raw = self._raw.pop(name)
+        self._sums -= raw
+        self._square_sums -= raw ** 2
+        self._roles = None
+
+    def _renormalize(self):
+        # Recomputes every raw score and the running sums from scratch
+        names = list(self.pokedex)
+        base_stats = [self.pokedex[name]['stats'] for name in names]
+        speed_ranks = np.searchsorted(self._speeds, [stats[5] for stats in \
+                                      base_stats], side='left')
+        raw = raw_role_data(stats_matrix_from_arrays(base_stats, speed_ranks))
+        self._raw = dict(zip(names, raw))
+        self._sums = raw.sum(axis=0)
+        self._square_sums = (raw ** 2).sum(axis=0)
+        self._offense_stale = False
+        self._roles = None
+
+    def role_stats(self):
+        # Returns the mean and standard deviation of the raw | PD | SD | PO |
+        # SO | scores, renormalizing first if an edit left them stale
+        if self._offense_stale:
+            self._renormalize()
+        num_mons = len(self)
+        mean_vec = self._sums / num_mons
+        std_vec = np.sqrt(np.maximum(self._square_sums / num_mons - \
+                                     mean_vec ** 2, 0))
+        return mean_vec, std_vec
+
+    def role_scores(self, name):
+        # Standardized | PD | SD | PO | SO | scores of one mon, in O(1) unless a
+        # renormalization is pending
+        mean_vec, std_vec = self.role_stats()
+        return ROLE_STD * (self._raw[name] - mean_vec) / std_vec
+
+    def roles(self):
+        # Returns the mon names and their full mx7 role matrix, as
+        # get_role_data would compute it for the current dex
+        mean_vec, std_vec = self.role_stats()
+        if self._roles is None:
+            names = list(self.pokedex)
+            raw = np.asarray([self._raw[name] for name in names])
+            self._roles = names, finish_role_data(ROLE_STD * (raw - mean_vec) \
+                                                  / std_vec)
+        return self._roles
+
+    def to_pokedex(self):
+        # Returns the pokedex dict with every speed_rank brought up to date
+        speeds = [entry['stats'][5] for entry in self.pokedex.values()]
+        for entry, rank in zip(self.pokedex.values(), \
+                               np.searchsorted(self._speeds, speeds).tolist()):
+            entry['speed_rank'] = rank
+        return self.pokedex
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--set', dest='name', type=str.lower, \
+                        help='pokemon to add or patch')
+    parser.add_argument('--stats', nargs=6, type=int, \
+                        help='HP, Atk, Def, SpA, SpD, and Spe base stats')
+    parser.add_argument('--types', nargs='+', type=str.lower, \
+                        help='one or two types')
+    parser.add_argument('--dex_id', type=int, help='national dex number')
+    parser.add_argument('--alt_form', action='store_true', \
+                        help='mark the pokemon as an alternate form')
+    parser.add_argument('--remove', nargs='+', type=str.lower, default=[], \
+                        help='pokemon to remove')
+    args = parser.parse_args()
+
+    with open(osp.join(args.data, 'pokedex.json')) as f_in:
+        dex = IncrementalDex(json.load(f_in))
+    for name in args.remove:
+        dex.remove(name)
+    if args.name is not None:
+        fields = {key: value for key, value in (('stats', args.stats), \
+                  ('type', args.types), ('dex_id', args.dex_id)) \
+                  if value is not None}
+        if args.alt_form:
+            fields['alt_form'] = True
+        if args.name in dex:
+            dex.update(args.name, **fields)
+        else:
+            # A new mon needs every field, not just the ones to patch
+            missing = [option for option, field in (('--dex_id', 'dex_id'), \
+                       ('--types', 'type'), ('--stats', 'stats')) \
+                       if field not in fields]
+            if missing:
+                parser.error('{} is a new pokemon, so --set needs {}.'.format( \
+                             args.name, ', '.join(missing)))
+            dex.insert(args.name, fields)
+        print('{} now has speed rank {}.'.format(args.name, \
+                                                 dex.speed_rank(args.name)))
+    with open(osp.join(args.data, 'pokedex.json'), 'w') as f_out:
+        json.dump(dex.to_pokedex(), f_out, indent=2)
@@ -0,0 +1,118 @@
+# Author:     Andrew Smith
+# File:       eligibility.py
+# Project:    Pokemon Team Builder
+
+'''
+eligibility.py: This file restricts which Pokemon a query may return.  The
+                masks and sorted arrays for every attribute are built once per
+                dex, so a query's filters are combined by intersecting masks
+                before anything is scored, and only the eligible rows are
+                scored afterwards.
+
+Filters are keyword arguments of EligibilityIndex.mask and rows:
+    exclude_alt_forms:  leave out alternate forms
+    types:              only mons with at least one of these types
+    min_stats:          {stat: value} of stats a mon needs at least, where
+                        stat is one of FILTER_STATS
+    tier:               only mons in this tier, if the dex has tier data
+'''
+
+import numpy as np
+from type_functions import TYPE_INDICES
+
+# Stats that can be filtered on, as columns of the dex matrix's stats.  None is
+# the base stat total.
+FILTER_STATS = {'hp': 0, 'atk': 1, 'def': 2, 'spa': 3, 'spd': 4, 'spe': 5, \
+                'bst': None}
+
+
+def stat_minimum(stat, minimum):
+    # Checks a min_stats entry and returns the minimum as an int, raising a
+    # ValueError for an unknown stat or a minimum that isn't a number
+    if stat not in FILTER_STATS:
+        raise ValueError('Unknown stat {}, choose from {}.'.format( \
+                         stat, ', '.join(FILTER_STATS)))
+    try:
+        return int(minimum)
+    except (TypeError, ValueError):
+        raise ValueError('Minimum {} of {} is not a number.'.format( \
+                         minimum, stat))
+
+
+class EligibilityIndex:
+    # Holds, for one dex matrix:
+    #   type_masks:   (18, N) array, type_masks[t] is which mons have type t
+    #   alt_forms:    which mons are alternate forms
+    #   tier_masks:   {tier: which mons are in it}, empty without tier data
+    # and every filterable stat sorted, so a minimum is a binary search that
+    # only touches the rows above it.
+
+    def __init__(self, dex_matrix):
+        self.dex_matrix = dex_matrix
+        self.type_masks = np.ascontiguousarray( \
+            dex_matrix.chart.type_mask[dex_matrix.combo_ids].T)
+        self.alt_forms = np.asarray(dex_matrix.alt_forms, dtype=bool)
+
+        self.tier_masks = {}
+        if dex_matrix.tiers is not None:
+            tiers = np.asarray([str(tier).lower() for tier in \
+                                dex_matrix.tiers])
+            for tier in np.unique(tiers):
+                self.tier_masks[tier] = tiers == tier
+
+        # _stat_order[stat] is the dex rows in ascending order of the stat and
+        # _stat_sorted[stat] the stat in that order
+        self._stat_order = {}
+        self._stat_sorted = {}
+        for stat, column in FILTER_STATS.items():
+            values = dex_matrix.stats.sum(axis=1) if column is None else \
+                     dex_matrix.stats[:, column]
+            order = np.argsort(values, kind='stable')
+            self._stat_order[stat] = order
+            self._stat_sorted[stat] = values[order]
+
+    def __len__(self):
+        return len(self.alt_forms)
+
+    def stat_rows(self, stat, minimum):
+        # Dex rows with the stat at least minimum, in ascending order of it
+        minimum = stat_minimum(stat, minimum)
+        start = np.searchsorted(self._stat_sorted[stat], minimum, 'left')
+        return self._stat_order[stat][start:]
+
+    def mask(self, exclude_alt_forms=False, types=None, min_stats=None, \
+             tier=None):
+        # Returns which dex rows pass every filter, or None when there are no
+        # filters so callers can keep their unrestricted path
+        masks = []
+
+        # A stat minimum only sets the rows that pass it
+        for stat, minimum in (min_stats or {}).items():
+            stat_mask = np.zeros(len(self), dtype=bool)
+            stat_mask[self.stat_rows(stat, minimum)] = True
+            masks.append(stat_mask)
+        if types:
+            try:
+                type_ids = [TYPE_INDICES[type.lower()] for type in types]
+            except KeyError as error:
+                raise ValueError('Unknown type {}.'.format(error.args[0]))
+            masks.append(self.type_masks[type_ids].any(axis=0))
+        if exclude_alt_forms:
+            masks.append(~self.alt_forms)
+        if tier is not None:
+            if not self.tier_masks:
+                raise ValueError('The dex has no tier data to filter on.')
+            tier_mask = self.tier_masks.get(tier.lower())
+            if tier_mask is None:
+                raise ValueError('Unknown tier {}, choose from {}.'.format( \
+                                 tier, ', '.join(sorted(self.tier_masks))))
+            masks.append(tier_mask)
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def rows(self, **filters):
+        # Returns the dex rows that pass every filter in dex order, or None
+        # when there are no filters
+        mask = self.mask(**filters)
+        return None if mask is None else np.flatnonzero(mask)
@@ -0,0 +1,134 @@
+# Author:     Andrew Smith
+# File:       page_fetcher.py
+# Project:    Pokemon Team Builder
+
+'''
+page_fetcher.py: This file fetches web pages for the scrapers through a local
+                 on-disk HTTP cache.  Cached pages are revalidated with their
+                 ETag and Last-Modified headers, so an unchanged page is not
+                 downloaded again, and in replay mode pages are only ever read
+                 from disk, which lets the scrapers run on saved fixtures with
+                 no network at all.
+
+Every page is stored in the cache directory as <slug>.html next to a
+<slug>.json holding its URL and validators, where the slug is the URL without
+its scheme and with every other character than letters, digits, '.', and '-'
+replaced by '_', e.g. pokemondb.net_pokedex_all.html.  A fixture is just a
+page saved under that name.
+'''
+
+import json
+import os
+import os.path as osp
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+
+
+def url_slug(url):
+    # File name stem a URL is cached under
+    return re.sub(r'[^A-Za-z0-9.-]', '_', re.sub(r'^[a-z]+://', '', url))
+
+
+class PageFetcher:
+    # Fetches pages as streams of byte chunks, revalidating them against the
+    # cache in cache_dir.  With replay set, only pages already in cache_dir
+    # can be fetched.  fetch_many runs up to max_workers fetches at once.
+
+    def __init__(self, cache_dir, replay=False, max_workers=8, timeout=30):
+        self.cache_dir = cache_dir
+        self.replay = replay
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'replayed': 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        stem = osp.join(self.cache_dir, url_slug(url))
+        return stem + '.html', stem + '.json'
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _session(self):
+        # requests is only needed when the network is used, so replaying
+        # fixtures works without it.  Sessions are not thread safe, so every
+        # thread gets its own.
+        if not hasattr(self._local, 'session'):
+            import requests
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _read_chunks(self, path):
+        with open(path, 'rb') as f_in:
+            for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+                yield chunk
+
+    def fetch(self, url):
+        # Yields the page's body in chunks as it arrives.  A downloaded page is
+        # only written to the cache once it has been read to the end.
+        page_path, meta_path = self._paths(url)
+        if self.replay:
+            if not osp.exists(page_path):
+                raise FileNotFoundError('No saved page for {} in {}.'.format( \
+                                        url, self.cache_dir))
+            self._count('replayed')
+            yield from self._read_chunks(page_path)
+            return
+
+        # Ask the server to skip the body if the cached copy is still current
+        headers = {}
+        if osp.exists(page_path) and osp.exists(meta_path):
+            with open(meta_path) as f_in:
+                meta = json.load(f_in)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with self._session().get(url, headers=headers, stream=True, \
+                                 timeout=self.timeout) as response:
+            if response.status_code == 304:
+                self._count('not_modified')
+                yield from self._read_chunks(page_path)
+                return
+            response.raise_for_status()
+
+            temp_path = '{}.{}.tmp'.format(page_path, threading.get_ident())
+            try:
+                with open(temp_path, 'wb') as f_out:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f_out.write(chunk)
+                        yield chunk
+                os.replace(temp_path, page_path)
+            finally:
+                if osp.exists(temp_path):
+                    os.remove(temp_path)
+
+            with open(meta_path, 'w') as f_out:
+                json.dump({'url': url, \
+                           'etag': response.headers.get('ETag'), \
+                           'last_modified': \
+                               response.headers.get('Last-Modified')}, f_out)
+        self._count('downloaded')
+
+    def fetch_bytes(self, url):
+        # Returns the whole body of a page
+        return b''.join(self.fetch(url))
+
+    def fetch_many(self, urls, handle=None):
+        # Fetches many pages at once and returns {url: handle(chunks)}.  handle
+        # gets each page's chunk stream and defaults to joining it, so a parser
+        # can consume pages as they stream in.
+        if handle is None:
+            handle = b''.join
+        urls = list(urls)
+        with ThreadPoolExecutor(max(1, min(self.max_workers, \
+                                           len(urls)))) as executor:
+            results = executor.map(lambda url: handle(self.fetch(url)), urls)
+            return dict(zip(urls, results))
@@ -0,0 +1,120 @@
+# Author:     Andrew Smith
+# File:       parallel_search.py
+# Project:    Pokemon Team Builder
+
+'''
+parallel_search.py: This file runs the team search on a pool of worker
+                    processes.  The type tables and the candidate pool are put
+                    in shared memory once, so the workers never load the JSON
+                    data themselves, and the search is split up by the first
+                    candidate picked for the team.
+'''
+
+import heapq
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from team_search import TEAM_SIZE, TeamSearch
+
+# Worker state, filled in by _init_worker in each worker process
+_worker = {}
+
+
+def share_arrays(arrays):
+    # Copies a dict of arrays into new shared memory blocks.  Returns the
+    # blocks, which the caller has to close and unlink, and a spec that
+    # attach_arrays can rebuild the arrays from in another process.
+    blocks = []
+    spec = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, \
+                                           size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def attach_arrays(spec):
+    # Maps the shared memory blocks described by a spec from share_arrays.
+    # The blocks are returned too since the arrays are only valid while their
+    # blocks stay open.
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(spec, team_size, open_slots, num_teams, shared_cutoff, \
+                 limits):
+    # Attaches the shared tables once per worker process
+    blocks, arrays = attach_arrays(spec)
+    _worker.update(arrays)
+    _worker['blocks'] = blocks
+    _worker['search'] = TeamSearch(None, team_size, synergy=arrays['synergy'], \
+                                   masks=arrays['masks'], **limits)
+    _worker['open_slots'] = open_slots
+    _worker['num_teams'] = num_teams
+    _worker['shared_cutoff'] = shared_cutoff
+
+
+def _run_part(first_picks):
+    # Searches the teams whose first pick is one of first_picks
+    search = _worker['search']
+    teams = search.search_pool(_worker['seed_combos'], \
+                               _worker['cand_combos'], _worker['capacity'], \
+                               _worker['open_slots'], _worker['num_teams'], \
+                               first_picks=first_picks, \
+                               shared_cutoff=_worker['shared_cutoff'])
+    return teams, search.stats
+
+
+def search_pool_parallel(synergy, seed_combos, cand_combos, capacity, \
+                         open_slots, num_teams=10, workers=None, \
+                         team_size=TEAM_SIZE, parts_per_worker=8, \
+                         masks=None, max_uncovered=None, max_stacked=None):
+    # Parallel version of TeamSearch.search_pool, where synergy is the type
+    # chart's pairwise synergy table and masks its weakness masks, which are
+    # only needed with max_uncovered or max_stacked.  Returns the same
+    # (score, picks) list plus the search counters summed over all parts.
+    if workers is None:
+        workers = mp.cpu_count()
+    num_candidates = len(cand_combos)
+
+    # Deal the first picks out round-robin so that every part gets a mix of
+    # cheap and expensive subtrees, with a few parts per worker to even out
+    # the load
+    num_parts = max(1, min(num_candidates, workers * parts_per_worker))
+    parts = [list(range(i, num_candidates, num_parts)) \
+             for i in range(num_parts)]
+
+    if masks is None:
+        masks = np.zeros((len(synergy), 4), dtype=np.uint32)
+    limits = {'max_uncovered': max_uncovered, 'max_stacked': max_stacked}
+    blocks, spec = share_arrays({'synergy': synergy, 'masks': masks, \
+                                 'seed_combos': np.asarray(seed_combos), \
+                                 'cand_combos': np.asarray(cand_combos), \
+                                 'capacity': np.asarray(capacity)})
+    shared_cutoff = mp.RawValue('d', float('inf'))
+    stats = {'nodes_expanded': 0, 'nodes_pruned': 0, 'leaves_evaluated': 0, \
+             'teams_filtered': 0}
+    teams = []
+    try:
+        with mp.Pool(workers, _init_worker, (spec, team_size, open_slots, \
+                     num_teams, shared_cutoff, limits)) as pool:
+            for part_teams, part_stats in pool.imap_unordered(_run_part, \
+                                                              parts):
+                teams.extend(part_teams)
+                for key in stats:
+                    stats[key] += part_stats[key]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # Merge the parts into the overall best teams
+    return heapq.nsmallest(num_teams, teams), stats
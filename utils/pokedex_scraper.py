@@ -13,197 +13,270 @@ As someone who is new to web scraping, it really saved my butt.
 '''
 # TODO: Add tier scraping support.
 
-import requests
-import lxml.html as lh
 import json
+import argparse
+import codecs
 import os
 import os.path as osp
-from bs4 import BeautifulSoup
-
-
-def scrape_pokedex():
-    # This void function takes Pokemon data from the pokemondb website and
-    # stores it as a dictionary
-
-    # Set the url to the full pokemondb pokedex
-    url = 'http://pokemondb.net/pokedex/all'
-
-    # Create a page to handle the contents of the website
-    page_info = requests.get(url)
-
-    # Store the contents of the website as element data
-    page_element_data = lh.fromstring(page_info.content)
+import tempfile
+from array import array
+from bisect import bisect_left
+from html.parser import HTMLParser
+from page_fetcher import PageFetcher
+
+# Data directory, relative to this file
+DATA_DIR = osp.join(osp.dirname(osp.abspath(__file__)), os.pardir, 'data')
+CACHE_DIR = osp.join(DATA_DIR, 'http_cache')
+POKEDEX_URL = 'http://pokemondb.net/pokedex/all'
+STAT_COLUMNS = ('HP', 'Attack', 'Defense', 'Sp. Atk', 'Sp. Def', 'Speed')
+
+
+class TableRowParser(HTMLParser):
+    # Incremental HTML parser that collects the text of each table row's cells
+    # as it is fed, so a page never has to be held in memory as a whole.
+    # Finished rows are appended to rows and should be taken off it between
+    # feeds.  A cell's text is all the text inside it, like lxml's
+    # text_content().
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        # Rows and cells are allowed to be left open in HTML, in which case
+        # the next one closes them
+        if tag == 'tr':
+            self.handle_endtag('tr')
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self.handle_endtag(tag)
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell))
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.handle_endtag('td')
+            self.rows.append(self._row)
+            self._row = None
+        elif tag == 'table':
+            self.handle_endtag('tr')
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def iter_table_rows(chunks):
+    # Yields the cell texts of every <tr> in a page given as a stream of byte
+    # chunks, as soon as each row has been read
+    parser = TableRowParser()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.rows
+        parser.rows.clear()
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.rows
+
+
+def scrape_rows(fetcher=None):
+    # Yields each Pokemon row of the pokemondb table as a dict keyed by column
+    # name, as the page is read.  The page is read through fetcher, a
+    # PageFetcher that defaults to the cache in the data directory.
+    if fetcher is None:
+        fetcher = PageFetcher(CACHE_DIR)
 
     # Parse data that is stored between <tr> tags in HTML
-    tr_elements = page_element_data.xpath('//tr')
-
-    # Create empty list for key names and all_pokemon dictionary for the pokedex
-    col_names = []
-    all_pokemon = {}
-
-    # For each row, store each first element (header) and an empty list
-    for th_tag in tr_elements[0]:
-        name = th_tag.text_content()
-        col_names.append(name)
-        all_pokemon[name] = []
-
-    # Since the first row is the header, iterate through remaining rows
-    for j in range(1,len(tr_elements)):
-        # pokemon_row is the j-th row
-        pokemon_row = tr_elements[j]
-
-        # If the row is not of size 10, the //tr data is not from our table
-        if len(pokemon_row) != 10:
-            print('Wrong table or bad data.')
-            break
-
-        # Iterate through each element of the row
-        for i, pokemon_row_element in enumerate(pokemon_row.iterchildren()):
-            data = pokemon_row_element.text_content()
+    rows = iter_table_rows(fetcher.fetch(POKEDEX_URL))
+    try:
+        # The first row is the header
+        col_names = next(rows)
+        for pokemon_row in rows:
+            # If the row is not of size 10, the //tr data is not from our table
+            if len(pokemon_row) != 10:
+                print('Wrong table or bad data.')
+                break
 
             # Convert any numerical value to an int
-            try:
-                data = int(data)
-            except:
-                pass
-
-            # Append the data to the empty list of the i-th column
-            all_pokemon[col_names[i]].append(data)
-
+            row = {}
+            for name, data in zip(col_names, pokemon_row):
+                try:
+                    data = int(data)
+                except:
+                    pass
+                row[name] = data
+            yield row
+    finally:
+        # Stop reading the page if the table ended early
+        rows.close()
+
+
+def scrape_pokedex(fetcher=None):
+    # This function takes Pokemon data from the pokemondb website and returns
+    # it as a dictionary of columns
+    all_pokemon = {}
+    for row in scrape_rows(fetcher):
+        for name, data in row.items():
+            all_pokemon.setdefault(name, []).append(data)
     return all_pokemon
 
 
-def build_pokedex(unformatted_dex, allow_megas=False):
-    # Takes in an undesirably-formatted dictionary and makes a better dictionary
-    # out of it and dumps the result as pokedex.json
-
-    # Create initial variables for the Pokemon dict
-    stats = [0, 0, 0, 0, 0, 0]
-    pokedex = {}
-    speed_dict = {}
-    j = 0
-    prev_id = 0
+def column_rows(unformatted_dex):
+    # Yields the rows of a dictionary of columns, like scrape_pokedex returns,
+    # as dicts keyed by column name
+    for values in zip(*unformatted_dex.values()):
+        yield dict(zip(unformatted_dex.keys(), values))
 
-    # This variable is less self-explanatory.  It is needed so that alternate
-    # forms don't overwrite the normal forms
-    alt_form = False
-    is_mega = False
-
-    # Iterate through all rows and store the Pokemon data in a dict
-    for i in range(len(unformatted_dex['#'])):
-        # Iterate through all keys for each row
-        for key in unformatted_dex.keys():
-            # Start checking key cases
-            if key == '#': # Number
-                id = int(unformatted_dex[key][i])
-                # Check if the previous id is the same as the current one.  This
-                # prevents undesirable stuff such as overwriting venusaur with
-                # mega venusaur's stats
-                if prev_id == id:
-                    alt_form = True
-                    continue
-                else:
-                    alt_form = False
-                prev_id = id
-
-            elif key == 'Name': # Name
-                # Checks if the pokemon is a mega and that megas shouldn't be
-                # stored in the dex since they no longer exist :(
-                name = unformatted_dex[key][i].lower()
-                if 'mega' in name or 'primal' in name and allow_megas == False:
-                    is_mega = True
-                    break
-                # not isalpha() avoids taking the first string in the split of
-                # Pokemon like Mr. mime and Type: null, who would just be 'mr.'
-                # and 'type:' if this check wasn't here
-                elif not name.isalpha() or alt_form:
-                    is_mega = False
-                    continue
-                else:
-                    name = name.split()[0]
-                    is_mega = False
-
-            elif key == 'Type': # Type
-                # Sorts the types in alphabetical order just for consistency
-                type = sorted(unformatted_dex[key][i].lower().split())
-
-            elif key == 'Total': # Total BST
-                # BST isn't needed for now
-                continue
 
-            # The next few cases just grab each Pokemon's stats
-            elif key == 'HP': # HP
-                stats[0] = int(unformatted_dex[key][i])
-            elif key == 'Attack': # Attack
-                stats[1] = int(unformatted_dex[key][i])
-            elif key == 'Defense': # Defense
-                stats[2] = int(unformatted_dex[key][i])
-            elif key == 'Sp. Atk': # Special Attack
-                stats[3] = int(unformatted_dex[key][i])
-            elif key == 'Sp. Def': # Special Defense
-                stats[4] = int(unformatted_dex[key][i])
-            elif key == 'Speed': # Speed
-                stats[5] = int(unformatted_dex[key][i])
-
-                # Get rid of Eternatus Eternamax because he doesn't exist for
-                # the players
-                if sum(stats) > 1000:
-                    break
-
-                # Add the Pokemon to the Pokedex
-                pokedex[name] = {}
-                pokedex[name]['dex_id'] = id
-                pokedex[name]['type'] = type
-                pokedex[name]['stats'] = stats
-                pokedex[name]['alt_form'] = alt_form
-                # speed_rank is initialized as -1 for all pokemon and
-                # only overwritten for non-alt forms later
-                pokedex[name]['speed_rank'] = -1
-                if not is_mega:
-                    speed_dict[name] = stats[5]
-
-                # This is necessary for some reason otherwise every Pokemon will
-                # have Eternatus's stats
-                stats = [0, 0, 0, 0, 0, 0]
-
-            # I know this one is entirely unnecessary, but I like having it here
-            # for readability
-            else:
+def parse_entries(rows, allow_megas=False):
+    # Takes the table rows one at a time and yields a (name, entry) tuple in
+    # the pokedex.json format for every Pokemon that should be in the dex.
+    # speed_rank is left as -1, since it depends on the whole dex.
+    prev_id = 0
+    for row in rows:
+        # An id repeated from the previous row is an alternate form.  This
+        # prevents undesirable stuff such as overwriting venusaur with mega
+        # venusaur's stats
+        id = int(row['#'])
+        alt_form = id == prev_id
+        prev_id = id
+
+        # Skips megas since they no longer exist :(
+        name = row['Name'].lower()
+        if 'mega' in name or 'primal' in name and allow_megas == False:
+            continue
+
+        # Get rid of Eternatus Eternamax because he doesn't exist for the
+        # players
+        stats = [int(row[key]) for key in STAT_COLUMNS]
+        if sum(stats) > 1000:
+            continue
+
+        # Sorts the types in alphabetical order just for consistency
+        yield name, {'dex_id': id, \
+                     'type': sorted(row['Type'].lower().split()), \
+                     'stats': stats, \
+                     'alt_form': alt_form, \
+                     'speed_rank': -1}
+
+
+class PokedexWriter:
+    # Writes pokedex entries to a file one at a time, either as the
+    # pokedex.json object (fmt='json') or one {"name": ..., ...} object per
+    # line (fmt='jsonl').  compact leaves out the indentation.  The file is
+    # written to a temporary path and only moved into place by close().
+    # Leaving a with block on an exception calls abort() instead, which
+    # removes the temporary file, the same as dex_store.StoreWriter.
+
+    def __init__(self, path, fmt='json', compact=False):
+        if fmt not in ('json', 'jsonl'):
+            raise ValueError('Unknown pokedex format {}.'.format(fmt))
+        self.path = path
+        self.fmt = fmt
+        self.compact = compact
+        self.count = 0
+        self._temp_path = path + '.tmp'
+        self._f_out = open(self._temp_path, 'w')
+        if fmt == 'json':
+            self._f_out.write('{')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, name, entry):
+        if self.fmt == 'jsonl':
+            self._f_out.write(json.dumps(dict(name=name, **entry)) + '\n')
+        elif self.compact:
+            self._f_out.write((',' if self.count else '') + json.dumps(name) + \
+                              ':' + json.dumps(entry, separators=(',', ':')))
+        else:
+            # Matches json.dump(pokedex, f_out, indent=2) byte for byte
+            self._f_out.write((',' if self.count else '') + '\n  ' + \
+                              json.dumps(name) + ': ' + json.dumps(entry, \
+                              indent=2).replace('\n', '\n  '))
+        self.count += 1
+
+    def close(self):
+        if self.fmt == 'json':
+            self._f_out.write('\n}' if self.count and not self.compact \
+                              else '}')
+        self._f_out.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        # Throws the partial file away, leaving any pokedex at path as it was
+        self._f_out.close()
+        os.remove(self._temp_path)
+
+
+def build_pokedex(rows, allow_megas=False, out_path=None, fmt='json', \
+                  compact=False, data_path=DATA_DIR):
+    # Takes the table rows (or the dictionary of columns from scrape_pokedex)
+    # and writes the pokedex to out_path, pokedex.json in the data directory by
+    # default, or a SQLite store from dex_store.py with fmt='sqlite', which
+    # gets the type data from type_data.json in the data directory.
+    # Entries are parsed and spooled to a temporary file in one pass while
+    # only their speeds are kept in memory, then written out with their speed
+    # ranks in a second pass over the spool.
+    if isinstance(rows, dict):
+        rows = column_rows(rows)
+    if out_path is None:
+        out_path = osp.join(data_path, 'pokedex.' + fmt)
+
+    # A name seen twice keeps its first position and its last entry, as it
+    # would in a dict
+    positions = {}
+    replaced = {}
+    speeds = array('l')
+    with tempfile.TemporaryFile('w+') as spool:
+        for name, entry in parse_entries(rows, allow_megas):
+            if name in positions:
+                replaced[name] = entry
+                speeds[positions[name]] = entry['stats'][5]
                 continue
-
-    speed_dict = {k : v for k, v in sorted(speed_dict.items(), \
-                  key=lambda item : item[1])}
-
-    # Find how many Pokemon each Pokemon outspeeds
-    # Initialize prev_speed as the lowest speed stat in the game
-    prev_speed = 5
-    mons = []
-    j = 0
-    count = 0
-    for i, mon in enumerate(speed_dict):
-        cur_speed = speed_dict[mon]
-
-        # Add the current mon to a list of other mons with the same speed
-        if cur_speed == prev_speed:
-            mons.append(mon)
-
+            positions[name] = len(speeds)
+            speeds.append(entry['stats'][5])
+            spool.write(json.dumps([name, entry]) + '\n')
+
+        # A Pokemon's speed rank is how many Pokemon it outspeeds, i.e. where
+        # its speed falls in the sorted speeds
+        sorted_speeds = array('l', sorted(speeds))
+        del positions, speeds
+
+        spool.seek(0)
+        if fmt == 'sqlite':
+            # Inserted in one transaction, with the type data alongside
+            from dex_store import StoreWriter
+            with open(osp.join(data_path, 'type_data.json')) as f_in:
+                writer = StoreWriter(out_path, json.load(f_in))
         else:
-            # Make all mons with the same score have the same rank
-            for repeat_mon in mons:
-                pokedex[repeat_mon]['speed_rank'] = j
-            mons = []
-            j = i
+            writer = PokedexWriter(out_path, fmt, compact)
 
-            # Add the current mon to the dictionary, otherwise it will get
-            # skipped
-            pokedex[mon]['speed_rank'] = j
-        prev_speed = cur_speed
+        # A failure part way through leaves the old pokedex in place
+        with writer:
+            for line in spool:
+                name, entry = json.loads(line)
+                entry = replaced.get(name, entry)
+                entry['speed_rank'] = bisect_left(sorted_speeds, \
+                                                  entry['stats'][5])
+                writer.write(name, entry)
+    return out_path
 
-    # Write the data to a JSON
-    with open(osp.join(os.pardir, 'data', 'pokedex.json'), 'w') as f_out:
-        json.dump(pokedex, f_out, indent=2)
 
 '''This is all WIP code, but it is garbage right now'''
+# from bs4 import BeautifulSoup
+#
 # def test():
 #     # This void function takes Pokemon data from smogon
 #
@@ -224,11 +297,36 @@ def build_pokedex(unformatted_dex, allow_megas=False):
 #     assert False
 
 
-def main():
-    pokedex = scrape_pokedex()
-    build_pokedex(pokedex)
+def main(cache_dir=CACHE_DIR, replay=False, out_path=None, fmt='json', \
+         compact=False, data_path=DATA_DIR):
+    fetcher = PageFetcher(cache_dir, replay)
+    out_path = build_pokedex(scrape_rows(fetcher), out_path=out_path, \
+                             fmt=fmt, compact=compact, data_path=data_path)
+    print('Pages downloaded: {downloaded}, unchanged: {not_modified}, ' \
+          'replayed: {replayed}.'.format(**fetcher.stats))
+    print('Wrote {}.'.format(out_path))
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory, which the ' + \
+                        'pokedex is written to and the type data read from')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, \
+                        help='directory of cached pages')
+    parser.add_argument('--replay', action='store_true', \
+                        help='only read pages already saved in the cache ' + \
+                        'directory and never touch the network')
+    parser.add_argument('--out', help='path to write the pokedex to. ' + \
+                        'Defaults to pokedex.json, pokedex.jsonl, or ' + \
+                        'pokedex.sqlite in the data directory.')
+    parser.add_argument('--format', dest='fmt', \
+                        choices=('json', 'jsonl', 'sqlite'), default='json', \
+                        help='write the pokedex as one JSON object, as one ' + \
+                        'JSON line per Pokemon, or as a SQLite store')
+    parser.add_argument('--compact', action='store_true', \
+                        help='write the JSON without indentation')
+    args = parser.parse_args()
+    main(args.cache_dir, args.replay, args.out, args.fmt, args.compact, \
+         args.data)
     # test()
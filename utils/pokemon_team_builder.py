@@ -0,0 +1,330 @@
+# Author:     Andrew Smith
+# File:       pokemon_team_builder.py
+# Project:    Pokemon Team Builder
+
+'''
+pokemon_team_builder.py: This file is the pokemon-team-builder command line
+                         tool, with one subcommand per job:
+    partner:  find the best partners for one or more Pokemon
+    team:     build teams around one to five Pokemon
+    roles:    write the role analysis of the dex, optionally with plots
+    similar:  find the Pokemon with the most similar roles to one
+    query:    list the Pokemon that pass some filters, from the SQLite store
+    damage:   list the Pokemon one OHKOs or 2HKOs and the ones that do it to it
+    scrape:   scrape the pokedex from pokemondb
+    compile:  compile the data directory's binary snapshot
+
+Only the argument parsing happens at startup.  Each subcommand imports what it
+needs when it runs, so a partner query never loads matplotlib or the scraping
+libraries, and --help doesn't even load NumPy.
+'''
+
+import argparse
+import os
+import os.path as osp
+import sys
+from result_writers import DEFAULT_FORMAT, WRITERS, result_count
+
+# Default location of the data directory, relative to this file.  The same as
+# type_functions.DATA_DIR, which isn't imported here to keep startup fast.
+DATA_DIR = osp.join(osp.dirname(osp.abspath(__file__)), os.pardir, 'data')
+
+# Modules only some subcommands need, which the partner query must not import
+LAZY_MODULES = ('matplotlib', 'requests', 'lxml', 'bs4', 'sqlite3', \
+                'team_pareto', 'stats_analysis', 'role_index', 'damage', \
+                'pokedex_scraper')
+
+
+def get_filters(args):
+    from run_team_builder import get_filters
+    return get_filters(args.exclude_alt_forms, args.min_speed, args.min_bst, \
+                       args.types, args.tier)
+
+
+def partner(args):
+    import run_team_builder
+    mons = args.mons
+    if args.mons_file is not None:
+        mons = mons + run_team_builder.read_mons(args.mons_file)
+    if not mons:
+        raise ValueError('no pokemon given, name some or use --mons_file.')
+    run_team_builder.main(args.data, args.results_path, mons, \
+                          find_partner_flag=True, \
+                          num_results=args.num_results, \
+                          tie_break=args.tie_break, cache_dir=args.cache_dir, \
+                          synergy_matrix_path=args.synergy_matrix, \
+                          profile=args.profile, scorer=args.scorer, \
+                          filters=get_filters(args), fmt=args.fmt, \
+                          store_path=args.store)
+
+
+def team(args):
+    import run_team_builder
+    run_team_builder.main(args.data, args.results_path, args.mons, \
+                          build_team_flag=True, num_results=args.num_results, \
+                          tie_break=args.tie_break, workers=args.workers, \
+                          cache_dir=args.cache_dir, profile=args.profile, \
+                          scorer=args.scorer, pareto=args.pareto, \
+                          max_uncovered=args.max_uncovered, \
+                          max_stacked=args.max_stacked, \
+                          filters=get_filters(args), fmt=args.fmt, \
+                          store_path=args.store)
+
+
+def roles(args):
+    import stats_analysis
+    results_path = args.results_path or stats_analysis.ROLES_PATH
+    stats_analysis.main(args.plot, args.data, results_path)
+    print('Wrote {}.'.format(results_path))
+
+
+def similar(args):
+    from role_index import load_role_index
+    from result_writers import open_writer
+    index = load_role_index(args.data, args.index_dir, args.type_weight)
+    mons = index.similar(args.mon, args.num_results)
+    with open_writer(args.results_path, args.fmt, \
+                     'Most similar to {}:'.format(args.mon)) as writer:
+        writer.write_all(((name,), {'distance': distance}) for name, \
+                         distance in mons)
+
+
+def query(args):
+    from dex_store import open_store
+    with open_store(args.data, args.store) as store:
+        pokedex = store.pokedex(**(get_filters(args) or {}))
+    max_len = max([len(name) for name in pokedex], default=0)
+    for name, entry in pokedex.items():
+        print('{}  {:<16}  {}'.format(name.ljust(max_len), \
+                                      '/'.join(entry['type']), \
+                                      ' '.join('{:>3}'.format(stat) for \
+                                               stat in entry['stats'])))
+    print('{} pokemon.'.format(len(pokedex)))
+
+
+def damage(args):
+    from damage import DamageCalculator
+    from dex_matrix import DexMatrix
+    from dex_snapshot import load_pokedex
+    from type_functions import TypeChart
+    pokedex, type_data = load_pokedex(args.data)
+    calculator = DamageCalculator(DexMatrix(pokedex, TypeChart(type_data)), \
+                                  args.power, args.category)
+    kos, koed_by = calculator.ko_lists(args.mon, args.hits, \
+                                       not args.possible, args.coverage)
+    label = {1: 'OHKOs', 2: '2HKOs'}.get(args.hits, \
+                                         '{}HKOs'.format(args.hits))
+    for title, mons in (('{} {}'.format(args.mon, label), kos), \
+                        ('{} {}'.format(label, args.mon), koed_by)):
+        print('{} ({}):'.format(title, len(mons)))
+        print('\n'.join('    ' + mon for mon in mons) if mons else '    none')
+
+
+def scrape(args):
+    import pokedex_scraper
+    pokedex_scraper.main(args.cache_dir or pokedex_scraper.CACHE_DIR, \
+                         args.replay, args.out, args.fmt, args.compact, \
+                         args.data)
+
+
+def compile_data(args):
+    from dex_snapshot import compile_snapshot
+    print('Wrote {}.'.format(compile_snapshot(args.data, args.out)))
+
+
+def add_filter_arguments(parser):
+    # Filter arguments shared by the partner, team, and query subcommands
+    parser.add_argument('--exclude_alt_forms', action='store_true', \
+                        help='leave alternate forms out of the results')
+    parser.add_argument('--min_speed', type=int, \
+                        help='only return pokemon with at least this base ' + \
+                        'speed')
+    parser.add_argument('--min_bst', type=int, \
+                        help='only return pokemon with at least this base ' + \
+                        'stat total')
+    parser.add_argument('--types', nargs='+', type=str.lower, \
+                        help='only return pokemon with at least one of ' + \
+                        'these types, e.g. --types steel fairy or steel,fairy')
+    parser.add_argument('--tier', \
+                        help='only return pokemon in this tier, if the dex ' + \
+                        'has tier data')
+
+
+def add_search_arguments(parser, all_results=True):
+    # Arguments shared by the partner and team subcommands.  all_results is
+    # whether --num_results can be all, which only partner searches allow.
+    parser.add_argument('--results_path', default='-', \
+                        help='path to the results file. Defaults to stdout.')
+    if all_results:
+        parser.add_argument('--num_results', type=result_count, default=10, \
+                            help='number of results to save, or all to ' + \
+                            'save every one')
+    else:
+        parser.add_argument('--num_results', type=int, default=10, \
+                            help='number of results to save')
+    parser.add_argument('--format', dest='fmt', choices=sorted(WRITERS), \
+                        default=DEFAULT_FORMAT, \
+                        help='format of the results')
+    parser.add_argument('--tie_break', \
+                        help='stat used to order pokemon with the same ' + \
+                        'types, highest first. Defaults to dex order.')
+    parser.add_argument('--scorer', default='l2', \
+                        help='how to score the type synergy of two pokemon')
+    parser.add_argument('--cache_dir', \
+                        help='directory to cache partner and team results in')
+    parser.add_argument('--profile', action='store_true', \
+                        help='print the wall time, CPU time, and peak ' + \
+                        'memory of every phase')
+    parser.add_argument('--store', \
+                        help='path to a SQLite pokedex store to load only ' + \
+                        'the pokemon passing the filters from')
+    add_filter_arguments(parser)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='pokemon-team-builder', \
+                                     description=__doc__, \
+                                     formatter_class= \
+                                     argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    partner_parser = subparsers.add_parser('partner', help='find ' + \
+                                           'partners for one or more pokemon')
+    partner_parser.add_argument('mons', nargs='*', type=str.lower, \
+                                help='pokemon to find partners for. Put ' + \
+                                'names with multiple words in quotes.')
+    partner_parser.add_argument('--mons_file', \
+                                help='file of more pokemon to find ' + \
+                                'partners for, one per line')
+    add_search_arguments(partner_parser)
+    partner_parser.add_argument('--synergy_matrix', \
+                                help='directory of a precomputed synergy ' + \
+                                'matrix to read partners from when it is ' + \
+                                'up to date')
+    partner_parser.set_defaults(run=partner)
+
+    team_parser = subparsers.add_parser('team', help='build teams around ' + \
+                                        'one to five pokemon')
+    team_parser.add_argument('mons', nargs='+', type=str.lower, \
+                             help='pokemon to build the team around')
+    add_search_arguments(team_parser, all_results=False)
+    team_parser.add_argument('--workers', type=int, default=1, \
+                             help='number of processes to split the ' + \
+                             'search over')
+    team_parser.add_argument('--max_uncovered', type=int, \
+                             help='only build teams with at most this many ' + \
+                             'uncovered weaknesses')
+    team_parser.add_argument('--max_stacked', type=int, \
+                             help='only build teams with at most this many ' + \
+                             'stacked weaknesses')
+    team_parser.add_argument('--pareto', action='store_true', \
+                             help='save the Pareto front of teams on type ' + \
+                             'synergy, role coverage, and power. Needs at ' + \
+                             'least two pokemon, since the search around ' + \
+                             'one takes minutes.')
+    team_parser.set_defaults(run=team)
+
+    roles_parser = subparsers.add_parser('roles', help='write the role ' + \
+                                         'analysis of the dex')
+    roles_parser.add_argument('--results_path', \
+                              help='path to the results file. Defaults to ' + \
+                              'dumps/roles.txt.')
+    roles_parser.add_argument('--plot', action='store_true', \
+                              help='also plot the stat distributions')
+    roles_parser.set_defaults(run=roles)
+
+    similar_parser = subparsers.add_parser('similar', help='find the ' + \
+                                           'pokemon with the most similar ' + \
+                                           'roles to one')
+    similar_parser.add_argument('mon', type=str.lower, \
+                                help='pokemon to find similar ones to')
+    similar_parser.add_argument('--results_path', default='-', \
+                                help='path to the results file. Defaults ' + \
+                                'to stdout.')
+    similar_parser.add_argument('--num_results', type=int, default=10, \
+                                help='number of similar pokemon to save')
+    similar_parser.add_argument('--format', dest='fmt', \
+                                choices=sorted(WRITERS), \
+                                default=DEFAULT_FORMAT, \
+                                help='format of the results')
+    similar_parser.add_argument('--type_weight', type=float, default=0, \
+                                help='how much sharing types counts, 0 ' + \
+                                'to compare roles only')
+    similar_parser.add_argument('--index_dir', \
+                                help='directory of the role index, built ' + \
+                                'there if it is missing or out of date. ' + \
+                                'Defaults to data/role_tree.')
+    similar_parser.set_defaults(run=similar)
+
+    query_parser = subparsers.add_parser('query', help='list the pokemon ' + \
+                                         'that pass some filters')
+    query_parser.add_argument('--store', \
+                              help='path to the SQLite pokedex store, ' + \
+                              'built there if it is missing or out of ' + \
+                              'date. Defaults to data/pokedex.sqlite.')
+    add_filter_arguments(query_parser)
+    query_parser.set_defaults(run=query)
+
+    damage_parser = subparsers.add_parser('damage', help='list the ' + \
+                                          'pokemon one KOs and the ones ' + \
+                                          'that KO it')
+    damage_parser.add_argument('mon', type=str.lower, \
+                               help='pokemon to check')
+    damage_parser.add_argument('--hits', type=int, default=1, \
+                               help='most hits a KO may take, 1 for ' + \
+                               'OHKOs and 2 for 2HKOs')
+    damage_parser.add_argument('--possible', action='store_true', \
+                               help='count KOs on the highest damage roll ' + \
+                               'instead of only guaranteed ones')
+    damage_parser.add_argument('--coverage', action='store_true', \
+                               help='give every pokemon a move of every ' + \
+                               'type instead of only its own types')
+    damage_parser.add_argument('--power', type=int, default=80, \
+                               help='base power of every move')
+    damage_parser.add_argument('--category', default='best', \
+                               choices=('physical', 'special', 'best'), \
+                               help='which attacking stat moves use')
+    damage_parser.set_defaults(run=damage)
+
+    scrape_parser = subparsers.add_parser('scrape', help='scrape the ' + \
+                                          'pokedex from pokemondb')
+    scrape_parser.add_argument('--cache_dir', \
+                               help='directory of cached pages. Defaults ' + \
+                               'to data/http_cache.')
+    scrape_parser.add_argument('--replay', action='store_true', \
+                               help='only read pages already saved in the ' + \
+                               'cache directory')
+    scrape_parser.add_argument('--out', help='path to write the pokedex to')
+    scrape_parser.add_argument('--format', dest='fmt', \
+                               choices=('json', 'jsonl', 'sqlite'), \
+                               default='json', \
+                               help='write the pokedex as one JSON object, ' + \
+                               'as one JSON line per Pokemon, or as a ' + \
+                               'SQLite store')
+    scrape_parser.add_argument('--compact', action='store_true', \
+                               help='write the JSON without indentation')
+    scrape_parser.set_defaults(run=scrape)
+
+    compile_parser = subparsers.add_parser('compile', help='compile the ' + \
+                                           'binary snapshot of the data ' + \
+                                           'directory')
+    compile_parser.add_argument('--out', help='path to write the snapshot ' + \
+                                'to. Defaults to the data directory.')
+    compile_parser.set_defaults(run=compile_data)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        args.run(args)
+    except (KeyError, ValueError, OSError) as error:
+        # Unknown Pokemon, scorers, and tie breaks, and missing files
+        sys.exit('pokemon-team-builder {}: error: {}'.format(args.command, \
+                                                             error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+# Author:     Andrew Smith
+# File:       profiling.py
+# Project:    Pokemon Team Builder
+
+'''
+profiling.py: This file records where a team builder run spends its time.
+              Code marks its phases with
+
+    with profiling.phase('load_data'):
+        ...
+
+              and while a Profiler is active every phase gets its wall time,
+              CPU time, and peak traced memory recorded, and calls to the type
+              functions are counted.  When no Profiler is active phase() hands
+              back a shared do-nothing context, so the markers can stay in.
+'''
+
+import json
+import cProfile
+import importlib
+import sys
+import tracemalloc
+from functools import wraps
+from contextlib import nullcontext
+from timeit import default_timer as timer
+from time import process_time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Methods whose calls are counted, as (module, class, method).  The module
+# level type functions delegate to the TypeChart methods, so counting those
+# counts both.  Calls made in worker processes are not counted.
+COUNTED = (('type_functions', 'TypeChart', 'get_wri'), \
+           ('type_functions', 'TypeChart', 'build_wri'), \
+           ('type_functions', 'TypeChart', 'type_synergy'), \
+           ('dex_matrix', 'DexMatrix', 'partner_scores'), \
+           ('signature_index', 'SignatureIndex', 'partner_scores'))
+
+_NULL_PHASE = nullcontext()
+
+
+class _Phase:
+    # Context manager that times one run of a phase
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit()
+        return False
+
+
+class Profiler:
+    # Records per-phase timings, call counts, and peak memory between start()
+    # and stop().  cprofile_path also dumps a cProfile of the whole run there.
+
+    def __init__(self, cprofile_path=None, counted=COUNTED):
+        self.cprofile_path = cprofile_path
+        self.counted = counted
+        self.phases = {}
+        self.counts = {}
+        self._stack = []
+        self._patched = []
+        self._cprofile = None
+        self._start = None
+        self.wall = self.cpu = 0.0
+
+    def start(self):
+        self._patch()
+        tracemalloc.start()
+        if self.cprofile_path is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = (timer(), process_time())
+
+    def stop(self):
+        self.wall = timer() - self._start[0]
+        self.cpu = process_time() - self._start[1]
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        self.peak_traced = max([self._peak()] + [phase['peak_mb'] * 2**20 \
+                               for phase in self.phases.values()])
+        tracemalloc.stop()
+        self._unpatch()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def _peak(self):
+        return tracemalloc.get_traced_memory()[1]
+
+    def _enter(self, name):
+        # Phases can nest, and a nested phase is recorded as parent/child.
+        # The traced peak is reset for every phase, so the parent's peak so
+        # far is kept on the stack.
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], self._peak())
+            name = self._stack[-1][0] + '/' + name
+        tracemalloc.reset_peak()
+        self._stack.append([name, timer(), process_time(), 0])
+
+    def _exit(self):
+        name, wall, cpu, peak = self._stack.pop()
+        wall = timer() - wall
+        cpu = process_time() - cpu
+        peak = max(peak, self._peak())
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], peak)
+        phase = self.phases.setdefault(name, {'calls': 0, 'wall_s': 0.0, \
+                                              'cpu_s': 0.0, 'peak_mb': 0.0})
+        phase['calls'] += 1
+        phase['wall_s'] += wall
+        phase['cpu_s'] += cpu
+        phase['peak_mb'] = max(phase['peak_mb'], peak / 2**20)
+
+    def _patch(self):
+        # Swaps every counted method for a wrapper that counts its calls
+        for module_name, class_name, method_name in self.counted:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            method = cls.__dict__[method_name]
+            key = '{}.{}'.format(class_name, method_name)
+            self.counts[key] = 0
+            setattr(cls, method_name, self._counter(key, method))
+            self._patched.append((cls, method_name, method))
+
+    def _counter(self, key, method):
+        counts = self.counts
+
+        @wraps(method)
+        def counted(*args, **kwargs):
+            counts[key] += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def _unpatch(self):
+        for cls, method_name, method in reversed(self._patched):
+            setattr(cls, method_name, method)
+        self._patched = []
+
+    def report(self):
+        # Returns the timings as a JSON-able dict
+        report = {'wall_s': self.wall, 'cpu_s': self.cpu, \
+                  'peak_traced_mb': self.peak_traced / 2**20, \
+                  'phases': self.phases, 'calls': self.counts}
+        if resource is not None:
+            # ru_maxrss is in KB on Linux and bytes on macOS
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            report['max_rss_mb'] = max_rss / (2**20 if sys.platform == \
+                                              'darwin' else 2**10)
+        return report
+
+    def save_report(self, path):
+        with open(path, 'w') as f_out:
+            json.dump(self.report(), f_out, indent=2)
+
+    def print_report(self, f_out=sys.stdout):
+        report = self.report()
+        width = max([len(name) for name in self.phases] + [5])
+        print('{}  {:>10}  {:>10}  {:>10}  {:>6}'.format('Phase'.ljust( \
+              width), 'wall (ms)', 'cpu (ms)', 'peak (MB)', 'calls'), \
+              file=f_out)
+        for name, phase in self.phases.items():
+            print('{}  {:10.2f}  {:10.2f}  {:10.2f}  {:6d}'.format( \
+                  name.ljust(width), phase['wall_s'] * 1e3, \
+                  phase['cpu_s'] * 1e3, phase['peak_mb'], phase['calls']), \
+                  file=f_out)
+        print('Total: {:.2f} ms wall, {:.2f} ms cpu, {:.2f} MB peak ' \
+              'traced'.format(report['wall_s'] * 1e3, report['cpu_s'] * 1e3, \
+                              report['peak_traced_mb']) + \
+              (', {:.1f} MB max RSS'.format(report['max_rss_mb']) \
+               if 'max_rss_mb' in report else ''), file=f_out)
+        for key, count in self.counts.items():
+            print('{}: {} calls'.format(key, count), file=f_out)
+
+
+_profiler = None
+
+
+def get_profiler():
+    # The active Profiler, or None
+    return _profiler
+
+
+def set_profiler(profiler):
+    # Makes a Profiler the active one, or turns profiling off with None
+    global _profiler
+    _profiler = profiler
+
+
+def phase(name):
+    # Context manager marking a phase of the active Profiler, or a shared
+    # do-nothing context if there isn't one
+    if _profiler is None:
+        return _NULL_PHASE
+    return _profiler.phase(name)
@@ -0,0 +1,150 @@
+# Author:     Andrew Smith
+# File:       result_cache.py
+# Project:    Pokemon Team Builder
+
+'''
+result_cache.py: This file contains an on-disk cache for partner and team
+                 results.  Entries are keyed on a hash of the query and stored
+                 under a hash of the data files, so editing pokedex.json or
+                 type_data.json makes the old entries unreachable, and they are
+                 cleared out the next time the cache is opened.
+'''
+
+import json
+import hashlib
+import os
+import os.path as osp
+import re
+import shutil
+import sys
+
+DATA_FILES = ('pokedex.json', 'type_data.json')
+STATS_FILE = 'stats.json'
+
+# Written into every entry directory, so only directories the cache made are
+# ever cleared out of cache_dir
+MARKER_FILE = '.result_cache'
+ENTRY_DIR_NAME = re.compile('[0-9a-f]{16}$')
+
+
+def hash_data_files(data_path):
+    # Returns a hash of the contents of the data files in a data directory
+    digest = hashlib.sha256()
+    for file_name in DATA_FILES:
+        with open(osp.join(data_path, file_name), 'rb') as f_in:
+            digest.update(hashlib.sha256(f_in.read()).digest())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Size-bounded LRU cache of query results.  Each entry is a JSON file named
+    # by the hash of its query, and its modification time is bumped on every
+    # hit so the least recently used entries can be evicted first.
+
+    def __init__(self, cache_dir, data_path, max_bytes=64 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.data_hash = hash_data_files(data_path)
+        self.entry_dir = osp.join(cache_dir, self.data_hash[:16])
+        os.makedirs(self.entry_dir, exist_ok=True)
+        open(osp.join(self.entry_dir, MARKER_FILE), 'a').close()
+
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, \
+                      'invalidations': 0}
+        stats_path = osp.join(cache_dir, STATS_FILE)
+        if osp.exists(stats_path):
+            with open(stats_path) as f_in:
+                self.stats.update(json.load(f_in))
+
+        # Anything cached against other versions of the data files is stale.
+        # Directories the cache didn't make are left alone, in case cache_dir
+        # holds anything else.
+        for name in os.listdir(cache_dir):
+            path = osp.join(cache_dir, name)
+            if path != self.entry_dir and ENTRY_DIR_NAME.match(name) and \
+               osp.isfile(osp.join(path, MARKER_FILE)):
+                self.stats['invalidations'] += sum(entry.endswith('.json') \
+                                                   for entry in \
+                                                   os.listdir(path))
+                shutil.rmtree(path)
+
+    def key(self, mode, params):
+        # Hashes a query.  params has to be JSON serializable.
+        query = json.dumps({'mode': mode, 'params': params}, sort_keys=True)
+        return hashlib.sha256(query.encode()).hexdigest()
+
+    def _path(self, key):
+        return osp.join(self.entry_dir, key + '.json')
+
+    def get(self, mode, params):
+        # Returns the cached result of a query, or None on a miss
+        path = self._path(self.key(mode, params))
+        try:
+            with open(path) as f_in:
+                result = json.load(f_in)
+        except (OSError, ValueError):
+            self.stats['misses'] += 1
+            return None
+        os.utime(path)
+        self.stats['hits'] += 1
+        return result
+
+    def put(self, mode, params, result):
+        # Stores the result of a query and evicts old entries if the cache is
+        # over its size limit
+        path = self._path(self.key(mode, params))
+
+        # Write to a temporary file first so a reader never sees half an entry
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f_out:
+            json.dump(result, f_out)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def get_or_compute(self, mode, params, compute):
+        # Returns the cached result of a query, computing and storing it with
+        # compute() on a miss
+        result = self.get(mode, params)
+        if result is None:
+            result = compute()
+            self.put(mode, params, result)
+        return result
+
+    def entries(self):
+        # Returns (modification time, size, path) for every entry
+        entries = []
+        for name in os.listdir(self.entry_dir):
+            if name.endswith('.json'):
+                path = osp.join(self.entry_dir, name)
+                info = os.stat(path)
+                entries.append((info.st_mtime, info.st_size, path))
+        return entries
+
+    def evict(self):
+        # Removes the least recently used entries until the cache fits
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.stats['evictions'] += 1
+
+    def save_stats(self):
+        # Persists the hit and miss counters so they add up across runs
+        with open(osp.join(self.cache_dir, STATS_FILE), 'w') as f_out:
+            json.dump(self.stats, f_out)
+
+    def print_stats(self, f_out=sys.stdout):
+        entries = self.entries()
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0
+        print('Cache {}: {} entries, {:.1f} KB of {:.1f} KB.'.format( \
+              self.cache_dir, len(entries), \
+              sum(size for _, size, _ in entries) / 2**10, \
+              self.max_bytes / 2**10), file=f_out)
+        print('{} hits, {} misses ({:.1%} hit rate), {} evictions, {} ' \
+              'invalidated.'.format(self.stats['hits'], self.stats['misses'], \
+                                    hit_rate, self.stats['evictions'], \
+                                    self.stats['invalidations']), file=f_out)
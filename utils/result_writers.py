@@ -0,0 +1,308 @@
+# Author:     Andrew Smith
+# File:       result_writers.py
+# Project:    Pokemon Team Builder
+
+'''
+result_writers.py: This file holds the output sinks for partner and team
+                   results.  Every writer takes results one at a time, best
+                   first, as (members, scores) where members is a tuple of mon
+                   names (one for a partner, the whole team for a team) and
+                   scores is a float or a dict of named scores, so a whole
+                   ranking can be streamed from a generator to disk through a
+                   buffered file without ever being held in memory.  The
+                   results of a batch of queries go to one writer with the
+                   mon each result answers as its query, and ranks restart
+                   with every query.
+
+The formats, picked by name from WRITERS:
+    text:    the fixed-width table for reading, one per query.  It needs the
+             longest name before it can write a row, so it is the only one
+             that keeps its rows until it is closed.
+    jsonl:   one {"query": ..., "rank": ..., "mon" or "team": ..., <scores>}
+             object per line, with query only for batches
+    csv:     a query, rank, mon or member_1 to member_n, and score columns
+             table, with query only for batches
+    binary:  fixed-size records of uint32 name ids and float64 scores,
+             described in BinaryWriter and read back by read_binary
+'''
+
+import csv
+import json
+import struct
+import sys
+
+DEFAULT_FORMAT = 'text'
+
+# Bytes buffered by every writer before they go to disk
+BUFFER_SIZE = 1 << 20
+
+WRITERS = {}
+
+
+def register(name):
+    # Decorator that adds a writer class to WRITERS under a name
+    def add(writer):
+        WRITERS[name] = writer
+        return writer
+    return add
+
+
+def result_count(arg):
+    # Parses a --num_results argument, where all is None for every result
+    return None if arg.lower() == 'all' else int(arg)
+
+
+def open_writer(path, fmt=DEFAULT_FORMAT, title=''):
+    # Returns a writer of the named format for path, where '-' is stdout.
+    # title describes the results, e.g. 'Results for garchomp:'.
+    try:
+        writer = WRITERS[fmt]
+    except KeyError:
+        raise ValueError('Unknown format {}, choose from {}.'.format(fmt, \
+                         ', '.join(sorted(WRITERS))))
+    return writer(path, title)
+
+
+class ResultWriter:
+    # Base class of the writers.  Subclasses set binary and implement
+    # _write_row(rank, members, scores, query), and can extend close().
+
+    binary = False
+
+    def __init__(self, path, title=''):
+        self.path = path
+        self.title = title
+        self.count = 0
+        self.fields = None
+        self.query = None
+        self._rank = 0
+        if path == '-':
+            # Anything already printed has to come before binary results
+            if self.binary:
+                sys.stdout.flush()
+            self._f_out = sys.stdout.buffer if self.binary else sys.stdout
+        elif self.binary:
+            self._f_out = open(path, 'wb', buffering=BUFFER_SIZE)
+        else:
+            self._f_out = open(path, 'w', buffering=BUFFER_SIZE, newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, members, scores, query=None):
+        # Writes the next best result, of query for a batch of queries
+        if not isinstance(scores, dict):
+            scores = {'score': scores}
+        if self.fields is None:
+            self.fields = tuple(scores)
+        if query != self.query:
+            self.query = query
+            self._rank = 0
+        self.count += 1
+        self._rank += 1
+        self._write_row(self._rank, tuple(members), scores, query)
+
+    def write_all(self, results):
+        # Writes every (members, scores) or (members, scores, query) result of
+        # an iterable in order and returns how many there were
+        for result in results:
+            self.write(*result)
+        return self.count
+
+    def close(self):
+        if self._f_out in (sys.stdout, sys.stdout.buffer):
+            self._f_out.flush()
+        else:
+            self._f_out.close()
+
+
+@register('text')
+class TextWriter(ResultWriter):
+    # The fixed-width table, one row per result and one table per query
+
+    # How each score is shown
+    FIELD_FORMATS = {'score': 'Score = {:.5f}', 'synergy': 'Synergy = {:.5f}', \
+                     'coverage': 'Coverage = {:.2f}', 'power': 'Power = {:.2f}', \
+                     'distance': 'Distance = {:.5f}'}
+
+    def __init__(self, path, title=''):
+        super().__init__(path, title)
+        # (query, rows) of every query in order
+        self._tables = []
+
+    def _write_row(self, rank, members, scores, query):
+        if rank == 1:
+            self._tables.append((query, []))
+        self._tables[-1][1].append((', '.join(members), scores))
+
+    def close(self):
+        tables = self._tables or [(None, [])]
+        for i, (query, rows) in enumerate(tables):
+            if i:
+                self._f_out.write('\n\n')
+            title = self.title if query is None else \
+                    'Results for {}:'.format(query)
+            self._write_table(title, rows)
+        if self.path == '-':
+            self._f_out.write('\n')
+        super().close()
+
+    def _write_table(self, title, rows):
+        # Find the longest label, used for prettier output
+        max_len = max([len(label) for label, _ in rows], default=0)
+        fields = self.fields or ('score',)
+        rule = '-' * (max_len + 9 + 22 * len(fields))
+
+        self._f_out.write(title + '\n')
+        self._f_out.write(rule)
+        self._f_out.write('\n')
+        for count, (label, scores) in enumerate(rows):
+            # Add more spaces to make the output prettier
+            spaces = ' ' * (max_len - len(label))
+            cells = ''.join('  {}\t|'.format(self.FIELD_FORMATS.get(field, \
+                            field + ' = {:.5f}').format(scores[field])) \
+                            for field in fields)
+            self._f_out.write('|  {}\t|  {}\t|{}\n'.format(count + 1, \
+                              label + spaces, cells))
+        self._f_out.write(rule)
+
+
+@register('jsonl')
+class JsonlWriter(ResultWriter):
+    # One JSON object per result
+
+    def _write_row(self, rank, members, scores, query):
+        row = {} if query is None else {'query': query}
+        row['rank'] = rank
+        if len(members) == 1:
+            row['mon'] = members[0]
+        else:
+            row['team'] = list(members)
+        row.update(scores)
+        self._f_out.write(json.dumps(row) + '\n')
+
+
+@register('csv')
+class CsvWriter(ResultWriter):
+    # A table with a header row, written when the first result fixes the
+    # number of members, the scores, and whether there is a query column
+
+    def __init__(self, path, title=''):
+        super().__init__(path, title)
+        self._writer = csv.writer(self._f_out, lineterminator='\n')
+        self._queries = False
+
+    def _write_row(self, rank, members, scores, query):
+        if self.count == 1:
+            self._queries = query is not None
+            member_columns = ['mon'] if len(members) == 1 else \
+                ['member_{}'.format(i + 1) for i in range(len(members))]
+            self._writer.writerow(['query'] * self._queries + ['rank'] + \
+                                  member_columns + list(self.fields))
+        self._writer.writerow([query] * self._queries + [rank] + \
+                              list(members) + [repr(float(scores[field])) \
+                                               for field in self.fields])
+
+
+@register('binary')
+class BinaryWriter(ResultWriter):
+    # Compact binary results:
+    #   MAGIC
+    #   uint32 length of a JSON header, then the header with the title, the
+    #          number of members per result, the score fields, and whether
+    #          results have queries
+    #   one record per result: the uint32 name id of its query for batches, a
+    #          uint32 name id per member, then a float64 per score field, all
+    #          little-endian
+    #   the JSON list of names, indexed by name id
+    #   uint64 offset of the names list
+    # The header is written with the first result, and the names, which are
+    # numbered in the order they first appear, once the writer is closed.
+
+    MAGIC = b'PTBRESULTS1\n'
+    binary = True
+
+    def __init__(self, path, title=''):
+        super().__init__(path, title)
+        self._name_ids = {}
+        self._record = None
+        self._offset = 0
+
+    def _write_header(self, num_members, queries=False):
+        header = json.dumps({'title': self.title, 'members': num_members, \
+                             'fields': list(self.fields or ()), \
+                             'queries': queries}).encode()
+        self._record = struct.Struct('<{}I{}d'.format(num_members + queries, \
+                                     len(self.fields or ())))
+        self._emit(self.MAGIC + struct.pack('<I', len(header)) + header)
+
+    def _emit(self, data):
+        self._f_out.write(data)
+        self._offset += len(data)
+
+    def _write_row(self, rank, members, scores, query):
+        if self._record is None:
+            self._write_header(len(members), query is not None)
+        if query is not None:
+            members = (query,) + members
+        ids = [self._name_ids.setdefault(mon, len(self._name_ids)) \
+               for mon in members]
+        self._emit(self._record.pack(*ids, *(scores[field] for field in \
+                                             self.fields)))
+
+    def close(self):
+        if self._record is None:
+            self._write_header(0)
+        names_offset = self._offset
+        self._emit(json.dumps(list(self._name_ids)).encode())
+        self._emit(struct.pack('<Q', names_offset))
+        super().close()
+
+
+def read_binary(path):
+    # Reads a file from BinaryWriter.  Returns the header dict, the names, an
+    # (R, members) array of name ids, an (R, fields) array of scores, and the
+    # R name ids of the queries, or None if the results have no queries.
+    # NumPy is only needed here, so the writers stay quick to import.
+    import numpy as np
+    with open(path, 'rb') as f_in:
+        data = f_in.read()
+    magic = BinaryWriter.MAGIC
+    if not data.startswith(magic):
+        raise ValueError('{} is not a binary results file.'.format(path))
+    header_length, = struct.unpack_from('<I', data, len(magic))
+    start = len(magic) + 4
+    header = json.loads(data[start:start + header_length])
+    start += header_length
+
+    names_offset, = struct.unpack_from('<Q', data, len(data) - 8)
+    names = json.loads(data[names_offset:len(data) - 8])
+    queries = header.get('queries', False)
+    record = np.dtype([('query', '<u4', (int(queries),)), \
+                       ('ids', '<u4', (header['members'],)), \
+                       ('scores', '<f8', (len(header['fields']),))])
+    if record.itemsize == 0:
+        # Nothing was written
+        records = np.zeros(0, dtype=record)
+    else:
+        records = np.frombuffer(data[start:names_offset], dtype=record)
+    query_ids = records['query'][:, 0] if queries else None
+    return header, names, records['ids'], records['scores'], query_ids
+
+
+def iter_binary(path):
+    # Yields the results of a binary results file in order, the same as they
+    # were written: (members, scores), or (members, scores, query) for batches
+    header, names, ids, scores, query_ids = read_binary(path)
+    if query_ids is not None:
+        query_ids = query_ids.tolist()
+    for i, (row_ids, row_scores) in enumerate(zip(ids.tolist(), \
+                                                  scores.tolist())):
+        result = (tuple(names[j] for j in row_ids), \
+                  dict(zip(header['fields'], row_scores)))
+        if query_ids is not None:
+            result += (names[query_ids[i]],)
+        yield result
@@ -0,0 +1,254 @@
+# Author:     Andrew Smith
+# File:       role_index.py
+# Project:    Pokemon Team Builder
+
+'''
+role_index.py: This file holds a KD-tree over the role data of every Pokemon,
+               so the mons most similar to one, e.g. replacements for a team
+               member, are found by visiting a few leaves of the tree instead
+               of scanning the dex.  The tree is built once and saved next to
+               the data, and is rebuilt when the data files change.  Run it
+               directly to build it for a data directory.
+
+A mon's point is its | PD | SD | PO | SO | ODB | PSB | BSR | row of
+stats_analysis.get_role_data, with every column standardized to a mean of 0
+and a standard deviation of 1 so no role outweighs another.  With a type weight
+the mon's types are appended as 18 more columns, 1 for each type it has times
+the weight, so a mon sharing no types with another is that much further away.
+
+Files written to the output directory:
+    role_tree.npz        the points and the tree
+    role_tree_meta.json  mon names, the standardization, the type weight, and
+                         the data files the tree was built from
+'''
+
+import json
+import argparse
+import os
+import os.path as osp
+import numpy as np
+from type_functions import DATA_DIR, TYPE_INDICES, NUM_TYPES
+from dex_snapshot import load_pokedex, source_stamps
+from stats_analysis import make_stats_matrix, get_role_data
+
+TREE_FILE = 'role_tree.npz'
+META_FILE = 'role_tree_meta.json'
+
+# Most points in a leaf of the tree
+LEAF_SIZE = 32
+
+# Relative slack on the pruning bound, so rounding in the bound never drops a
+# point that ties with the k-th nearest
+TOLERANCE = 1e-9
+
+
+def role_points(pokedex, type_weight=0):
+    # Returns the N x 7 standardized role points of a dex in dex order, with
+    # the 18 type columns appended when type_weight isn't 0, and the mean and
+    # standard deviation every role column was standardized with
+    stats_matrix, _ = make_stats_matrix(pokedex)
+    roles = get_role_data(stats_matrix)
+    mean = roles.mean(axis=0)
+    std = roles.std(axis=0)
+    std[std == 0] = 1
+    points = (roles - mean) / std
+    if type_weight:
+        types = np.zeros((len(pokedex), NUM_TYPES))
+        for i, entry in enumerate(pokedex.values()):
+            types[i, [TYPE_INDICES[type] for type in entry['type']]] = \
+                type_weight
+        points = np.concatenate((points, types), axis=1)
+    return np.ascontiguousarray(points), mean, std
+
+
+def build_tree(points, leaf_size=LEAF_SIZE):
+    # Builds a KD-tree by splitting every node at the median of its widest
+    # dimension.  Returns a dict of arrays:
+    #   order:        dex rows in tree order, so every node is a contiguous
+    #                 range [start, end) of it
+    #   points:       the points in tree order
+    #   start, end:   range of every node, node 0 being the root
+    #   left, right:  children of every node, -1 for leaves
+    #   dim, split:   dimension a node is split on and the value it is split
+    #                 at, where the left child's points are at most the value
+    #                 and the right child's at least it
+    points = np.asarray(points, dtype=float)
+    order = np.arange(len(points))
+    nodes = []
+
+    def build(start, end):
+        node = len(nodes)
+        nodes.append([start, end, -1, -1, 0, 0.0])
+        if end - start > leaf_size:
+            block = points[order[start:end]]
+            dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            middle = (start + end) // 2
+            split = np.argpartition(block[:, dim], middle - start)
+            order[start:end] = order[start:end][split]
+            nodes[node][4:] = [dim, points[order[middle], dim]]
+            nodes[node][2] = build(start, middle)
+            nodes[node][3] = build(middle, end)
+        return node
+
+    build(0, len(points))
+    start, end, left, right, dim, split = zip(*nodes)
+    return {'order': order, 'points': points[order], \
+            'start': np.asarray(start), 'end': np.asarray(end), \
+            'left': np.asarray(left), 'right': np.asarray(right), \
+            'dim': np.asarray(dim), 'split': np.asarray(split)}
+
+
+def build_role_index(pokedex, out_path, type_weight=0, leaf_size=LEAF_SIZE, \
+                     stamps=None):
+    # Writes the role tree of a dex.  stamps are the source file stamps
+    # recorded for freshness checks.
+    os.makedirs(out_path, exist_ok=True)
+    points, mean, std = role_points(pokedex, type_weight)
+    np.savez(osp.join(out_path, TREE_FILE), **build_tree(points, leaf_size))
+    meta = {'names': list(pokedex), 'type_weight': type_weight, \
+            'mean': mean.tolist(), 'std': std.tolist()}
+    if stamps is not None:
+        meta['sources'] = [int(stamp) for stamp in stamps]
+    with open(osp.join(out_path, META_FILE), 'w') as f_out:
+        json.dump(meta, f_out)
+
+
+class RoleIndex:
+    # Read-only view of a tree written by build_role_index
+
+    def __init__(self, path):
+        self.path = path
+        with open(osp.join(path, META_FILE)) as f_in:
+            meta = json.load(f_in)
+        self.names = meta['names']
+        self.type_weight = meta['type_weight']
+        self.mean = np.asarray(meta['mean'])
+        self.std = np.asarray(meta['std'])
+        self.sources = meta.get('sources')
+        self.name_indices = {name: i for i, name in enumerate(self.names)}
+        with np.load(osp.join(path, TREE_FILE)) as tree:
+            for name in ('order', 'points', 'start', 'end', 'left', 'right', \
+                         'dim', 'split'):
+                setattr(self, name, tree[name])
+
+        # Plain lists are quicker to index one node at a time than arrays
+        self._start = self.start.tolist()
+        self._end = self.end.tolist()
+        self._left = self.left.tolist()
+        self._right = self.right.tolist()
+        self._dim = self.dim.tolist()
+        self._split = self.split.tolist()
+        self._positions = np.empty_like(self.order)
+        self._positions[self.order] = np.arange(len(self.order))
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_fresh(self, data_path):
+        # Whether the data files are unchanged since the tree was built
+        try:
+            return self.sources == source_stamps(data_path).tolist()
+        except OSError:
+            return False
+
+    def point(self, mon):
+        return self.points[self._positions[self.name_indices[mon]]]
+
+    def nearest(self, point, k=10, exclude=None):
+        # Returns the dex rows of the k points nearest to point and their
+        # distances, nearest first with ties in dex order, leaving out the row
+        # exclude.  The search goes down the side of every split the point is
+        # on first, and only crosses a split if the box on the other side is
+        # no further than the k-th nearest point found so far.  The distance
+        # to that box is kept up to date one coordinate at a time, so the
+        # only NumPy work is scoring the points of the leaves visited.
+        point = np.asarray(point, dtype=float)
+        coordinates = point.tolist()
+        state = {'rows': np.zeros(0, dtype=self.order.dtype), \
+                 'distances': np.zeros(0), 'kth': np.inf}
+
+        def visit(node, bound, offsets):
+            left = self._left[node]
+            if left < 0:
+                self._merge_leaf(node, point, k, exclude, state)
+                return
+            dim = self._dim[node]
+            offset = coordinates[dim] - self._split[node]
+            near, far = (left, self._right[node]) if offset <= 0 else \
+                        (self._right[node], left)
+            visit(near, bound, offsets)
+
+            # The far box is further by the offset along dim
+            previous = offsets[dim]
+            bound += offset * offset - previous * previous
+            if bound <= state['kth'] * (1 + TOLERANCE):
+                offsets[dim] = offset
+                visit(far, bound, offsets)
+                offsets[dim] = previous
+
+        visit(0, 0.0, [0.0] * len(coordinates))
+        return state['rows'], np.sqrt(state['distances'])
+
+    def _merge_leaf(self, node, point, k, exclude, state):
+        # Merges the points of a leaf closer than the k-th nearest so far
+        # into the k nearest
+        start, end = self._start[node], self._end[node]
+        distances = ((self.points[start:end] - point) ** 2).sum(axis=1)
+        rows = self.order[start:end]
+        keep = distances <= state['kth']
+        if exclude is not None:
+            keep &= rows != exclude
+        if not keep.any():
+            return
+        rows = np.concatenate((state['rows'], rows[keep]))
+        distances = np.concatenate((state['distances'], distances[keep]))
+        best = np.lexsort((rows, distances))[:k]
+        state['rows'], state['distances'] = rows[best], distances[best]
+        if len(best) == k:
+            state['kth'] = distances[best[-1]]
+
+    def similar(self, mon, k=10):
+        # Returns the k mons most similar to mon as (name, distance) tuples,
+        # most similar first
+        row = self.name_indices[mon]
+        rows, distances = self.nearest(self.point(mon), k, exclude=row)
+        return [(self.names[i], float(distance)) for i, distance in \
+                zip(rows.tolist(), distances)]
+
+
+def load_role_index(data_path=DATA_DIR, path=None, type_weight=0):
+    # Returns the role index of a data directory, from path if the tree saved
+    # there is fresh and has the same type weight, otherwise after building
+    # and saving it there.  path defaults to role_tree in the data directory.
+    if path is None:
+        path = osp.join(data_path, 'role_tree')
+    if osp.exists(osp.join(path, META_FILE)):
+        index = RoleIndex(path)
+        if index.is_fresh(data_path) and index.type_weight == type_weight:
+            return index
+    stamps = source_stamps(data_path)
+    pokedex, _ = load_pokedex(data_path)
+    build_role_index(pokedex, path, type_weight, stamps=stamps)
+    return RoleIndex(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--out', help='directory to write the tree to. ' + \
+                        'Defaults to role_tree in the data directory.')
+    parser.add_argument('--type_weight', type=float, default=0, \
+                        help='weight of the type columns, 0 for roles only')
+    parser.add_argument('--leaf_size', type=int, default=LEAF_SIZE, \
+                        help='most mons in a leaf of the tree')
+    args = parser.parse_args()
+
+    out_path = args.out or osp.join(args.data, 'role_tree')
+    stamps = source_stamps(args.data)
+    pokedex, type_data = load_pokedex(args.data)
+    build_role_index(pokedex, out_path, args.type_weight, args.leaf_size, \
+                     stamps)
+    print('Wrote the role tree of {} mons to {}.'.format(len(pokedex), \
+                                                         out_path))
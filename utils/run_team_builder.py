@@ -6,11 +6,20 @@
 run_team_builder.py: This file is the main execution file.
 '''
 
-import json
 import argparse
-import os
-import os.path as osp
-from type_functions import type_synergy
+import sys
+import numpy as np
+from type_functions import TypeChart, set_chart
+from dex_matrix import DexMatrix
+from signature_index import SignatureIndex, TIE_BREAKS
+from result_cache import ResultCache
+from dex_snapshot import load_fresh_snapshot, load_pokedex
+from synergy_matrix import SynergyMatrix
+from scorers import DEFAULT_SCORER, SCORERS
+from eligibility import EligibilityIndex
+from result_writers import DEFAULT_FORMAT, WRITERS, open_writer, \
+                           result_count
+import profiling
 
 def parse_arguments():
     # Void that creates some arguments to be passed into the main function
@@ -32,95 +41,500 @@ def parse_arguments():
                         ' Use one for find_partner and one or more for' + \
                         'build_team. Put pokemon multiple words in its name' + \
                         'in quotes.')
+    parser.add_argument('--mons_file', \
+                        help='file of pokemon to use as well as --mons, one ' + \
+                        'per line.  find_partner finds partners for all of ' + \
+                        'them in one batch.')
+    parser.add_argument('--num_results', type=result_count, default=10, \
+                        help='number of partners or teams to save, or all ' + \
+                        'to save every partner. Teams need a number.')
+    parser.add_argument('--format', dest='fmt', choices=sorted(WRITERS), \
+                        default=DEFAULT_FORMAT, \
+                        help='format of the results file')
+    parser.add_argument('--tie_break', choices=sorted(TIE_BREAKS), \
+                        help='stat used to order pokemon with the same ' + \
+                        'types, highest first. Defaults to dex order.')
+    parser.add_argument('--scorer', choices=sorted(SCORERS), \
+                        default=DEFAULT_SCORER, \
+                        help='how to score the type synergy of two pokemon')
+    parser.add_argument('--exclude_alt_forms', action='store_true', \
+                        help='leave alternate forms out of the results')
+    parser.add_argument('--min_speed', type=int, \
+                        help='only return pokemon with at least this base ' + \
+                        'speed')
+    parser.add_argument('--min_bst', type=int, \
+                        help='only return pokemon with at least this base ' + \
+                        'stat total')
+    parser.add_argument('--types', nargs='+', type=str.lower, \
+                        help='only return pokemon with at least one of ' + \
+                        'these types, e.g. --types steel fairy or steel,fairy')
+    parser.add_argument('--tier', \
+                        help='only return pokemon in this tier, if the dex ' + \
+                        'has tier data')
+    parser.add_argument('--max_uncovered', type=int, \
+                        help='only build teams with at most this many ' + \
+                        'types that a member is weak to and no member ' + \
+                        'resists or is immune to')
+    parser.add_argument('--max_stacked', type=int, \
+                        help='only build teams with at most this many ' + \
+                        'types that three or more members are weak to')
+    parser.add_argument('--pareto', action='store_true', \
+                        help='make build_team save the Pareto front of ' + \
+                        'teams on type synergy, role coverage, and power ' + \
+                        'instead of the best teams by type synergy alone. ' + \
+                        'Needs at least two mons, since the search around ' + \
+                        'one takes minutes.')
+    parser.add_argument('--workers', type=int, default=1, \
+                        help='number of processes to split build_team over')
+    parser.add_argument('--cache_dir', \
+                        help='directory to cache partner and team results in')
+    parser.add_argument('--cache_size', type=float, default=64, \
+                        help='maximum size of the result cache in MB')
+    parser.add_argument('--cache_stats', action='store_true', \
+                        help='print the result cache hit and miss statistics')
+    parser.add_argument('--store', \
+                        help='path to a SQLite pokedex store to load the ' + \
+                        'data from, built from the data directory if it ' + \
+                        'is missing or out of date. Filters are applied ' + \
+                        'while loading.')
+    parser.add_argument('--synergy_matrix', \
+                        help='directory of a precomputed synergy matrix to ' + \
+                        'read partners from when it is up to date')
+    parser.add_argument('--profile', action='store_true', \
+                        help='print the wall time, CPU time, and peak memory ' + \
+                        'of every phase and the type function call counts')
+    parser.add_argument('--profile_report', \
+                        help='path to write the profile as JSON. Implies ' + \
+                        '--profile.')
+    parser.add_argument('--profile_dump', \
+                        help='path to write a cProfile dump of the run to. ' + \
+                        'Implies --profile.')
     args = parser.parse_args()
+    if args.build_team_flag and args.num_results is None:
+        parser.error('--num_results all only works with find_partner_flag.')
     return args
 
-def load_data(data_path):
+def get_filters(exclude_alt_forms=False, min_speed=None, min_bst=None, \
+                types=None, tier=None):
+    # Collects the query filters into the keyword arguments of
+    # EligibilityIndex.rows, or None when there are none
+    min_stats = {}
+    if min_speed is not None:
+        min_stats['spe'] = min_speed
+    if min_bst is not None:
+        min_stats['bst'] = min_bst
+    if types:
+        types = [type for arg in types for type in arg.split(',') if type]
+    filters = {'exclude_alt_forms': exclude_alt_forms, 'types': types or None, \
+               'min_stats': min_stats or None, 'tier': tier}
+    filters = {key: value for key, value in filters.items() if value}
+    return filters or None
+
+def read_mons(path):
+    # Reads a file of pokemon names, one per line, skipping blank lines and
+    # lines starting with #
+    with open(path, 'r') as f_in:
+        return [line.strip().lower() for line in f_in \
+                if line.strip() and not line.lstrip().startswith('#')]
+
+def load_data(data_path, store_path=None, filters=None, keep=None):
     # This function takes in a data path as the argument and loads the pokemon
-    # and type data jsons
-    print('Loading data...')
-
-    # Loads the pokedex data
-    with open(osp.join(data_path, 'pokedex.json')) as f_in:
-        pokemon = json.load(f_in)
-
-    # Loads type data (weaknesses, resistances, immunities)
-    with open(osp.join(data_path, 'type_data.json')) as f_in:
-        types = json.load(f_in)
-
-    print('Finished loading data.')
-    return pokemon, types
-
-def save_results(path_string, scores, mon):
-    # Takes the results from the team builder or partner finder function and
-    # writes the results to a text file
-
-    # Find the longest string in the scores dict, used for prettier output
-    max_len = 0
-    for key in scores.keys():
-        if len(key) > max_len:
-            max_len = len(key)
-
-    # Open the user-specified file and write the scores output
-    with open(path_string, 'w') as f_out:
-        f_out.write('Results for {}:\n'.format(mon))
-        f_out.write('-' * (max_len + 31))
-        f_out.write('\n')
-        for count, pokemon in enumerate(scores):
-            f_out.write('|  {}\t|'.format(count + 1))
-            # Add more spaces to make the output prettier
-            spaces = ' ' * (max_len - len(pokemon))
-            f_out.write('  {}\t|'.format(pokemon + spaces))
-            # Write the scores to 6 sig figs
-            f_out.write('  Score = {:.5f}\t|\n'.format(scores[pokemon]))
-        f_out.write('-' * (max_len + 31))
+    # and type data jsons.  With a store path they are read from that SQLite
+    # store instead, and only the pokemon passing the filters from
+    # get_filters are loaded, along with the ones named in keep.  Also returns
+    # the dex matrix built straight from the snapshot's columns when the
+    # snapshot is up to date, and None otherwise.
+    print('Loading data...', file=sys.stderr)
+
+    # Loads the pokedex and type data (weaknesses, resistances, immunities),
+    # from the compiled snapshot if it is up to date and the JSON otherwise
+    snapshot = None
+    with profiling.phase('load_pokedex'):
+        if store_path is not None:
+            from dex_store import open_store
+            with open_store(data_path, store_path) as store:
+                pokemon = store.pokedex(keep, **(filters or {}))
+                types = store.type_data()
+        else:
+            snapshot = load_fresh_snapshot(data_path)
+            if snapshot is not None:
+                pokemon = snapshot.to_pokedex()
+                types = snapshot.to_type_data()
+            else:
+                pokemon, types = load_pokedex(data_path)
+
+    # Build the type chart once so every type_synergy call is a table lookup
+    with profiling.phase('type_chart'):
+        set_chart(TypeChart(types))
+
+    dex_matrix = None
+    if snapshot is not None:
+        with profiling.phase('dex_matrix'):
+            dex_matrix = DexMatrix.from_snapshot(snapshot)
+
+    print('Finished loading data.', file=sys.stderr)
+    return pokemon, types, dex_matrix
+
+def get_dex_matrix(dex, scorer=DEFAULT_SCORER, dex_matrix=None):
+    # Returns the dex matrix of the loaded dex for a scorer.  dex_matrix is
+    # the one load_data built from the snapshot, if it did, whose arrays are
+    # shared instead of building them again from the dex.
+    if dex_matrix is None:
+        return DexMatrix(dex, scorer=scorer)
+    if dex_matrix.scorer != scorer:
+        return dex_matrix.with_scorer(scorer)
+    return dex_matrix
+
+def save_results(path_string, results, title, fmt=DEFAULT_FORMAT):
+    # Takes the results from the team builder or partner finder function as
+    # (members, scores) tuples, best first, and streams them to a file in the
+    # chosen format from result_writers.py.  Returns how many were written.
+    with open_writer(path_string, fmt, title) as writer:
+        return writer.write_all(results)
+
+def test(dex, results_path, dex_matrix=None):
+    # Runs a quick check of the whole pipeline on the loaded dex: a dex matrix
+    # from the snapshot has to match the one built from the dex, the first
+    # mon's partners from the signature index have to score the same as
+    # scoring it against every mon directly, and a team is built around the
+    # first two mons
+    mons = list(dex)[:2]
+    print('Testing with {}.'.format(', '.join(mons)), file=sys.stderr)
+    if dex_matrix is not None:
+        expected_matrix = DexMatrix(dex)
+        for column in ('names', 'combo_ids', 'stats', 'alt_forms', 'tiers'):
+            if not np.array_equal(getattr(dex_matrix, column), \
+                                  getattr(expected_matrix, column)):
+                raise AssertionError('The snapshot dex matrix has different ' \
+                                     '{} from the dex.'.format(column))
+    dex_matrix = get_dex_matrix(dex, dex_matrix=dex_matrix)
+    expected = dex_matrix.find_partners(mons[0])
+    found = SignatureIndex(dex_matrix).find_partners(mons[0])
+    for (_, expected_score), (_, found_score) in zip(expected, found):
+        if abs(expected_score - found_score) > 1e-9:
+            raise AssertionError('Signature index partners of {} score {} ' \
+                                 'instead of {}.'.format(mons[0], found_score, \
+                                                         expected_score))
+    build_team(mons, dex, results_path, dex_matrix=dex_matrix)
+    print('Test passed.', file=sys.stderr)
     return
 
-def find_partner(mon, dex, results_path):
+def partner_index(dex, scorer=DEFAULT_SCORER, tie_break=None, filters=None, \
+                  dex_matrix=None):
+    # Returns the signature index partners are found with and the dex rows
+    # that pass the filters, or None without filters
+    with profiling.phase('index'):
+        index = SignatureIndex(get_dex_matrix(dex, scorer, dex_matrix), \
+                               tie_break)
+    rows = None
+    if filters:
+        with profiling.phase('filter'):
+            rows = EligibilityIndex(index.dex_matrix).rows(**filters)
+    return index, rows
+
+def find_partner(mon, dex, results_path, num_partners=10, tie_break=None, \
+                 cache=None, synergy_matrix=None, scorer=DEFAULT_SCORER, \
+                 filters=None, fmt=DEFAULT_FORMAT, dex_matrix=None):
     # This function takes in a single pokemon as a string and finds a partner
-    # that covers its flaws
-    print('Searching for a partner for {}.'.format(mon))
+    # that covers its flaws, optionally only among the pokemon that pass the
+    # filters from get_filters.  num_partners=None saves every partner.
+    print('Searching for a partner for {}.'.format(mon), file=sys.stderr)
+    title = 'Results for {}:'.format(mon)
+    if num_partners is None:
+        # Stream the whole ranking straight to the file
+        index, rows = partner_index(dex, scorer, tie_break, filters, \
+                                    dex_matrix)
+        with profiling.phase('save_results'):
+            count = save_results(results_path, (((name,), score) for name, \
+                                 score in index.iter_partners(mon, rows)), \
+                                 title, fmt)
+        print('Saved {} partners.'.format(count), file=sys.stderr)
+        return
+
+    params = {'mon': mon, 'k': num_partners, 'tie_break': tie_break, \
+              'scorer': scorer}
+    if filters:
+        params['filters'] = filters
+    partners = cache.get('find_partner', params) if cache else None
+
+    # Read the mon's row of the precomputed matrix if there is one, which
+    # keeps ties in dex order
+    if partners is None and synergy_matrix is not None and \
+       tie_break is None and synergy_matrix.scorer == scorer and not filters:
+        with profiling.phase('synergy_matrix'):
+            partners = synergy_matrix.find_partners(mon, k=num_partners)
+
+    # Otherwise score the mon against every type signature in the dex at once
+    # and keep only the best few mons
+    if partners is None:
+        with profiling.phase('index'):
+            index = SignatureIndex(get_dex_matrix(dex, scorer, dex_matrix), \
+                                   tie_break)
+        if filters:
+            # Only the eligible mons' signatures are scored
+            with profiling.phase('filter'):
+                rows = EligibilityIndex(index.dex_matrix).rows(**filters)
+            with profiling.phase('scoring'):
+                partners = index.find_partners(mon, num_partners, rows)
+        else:
+            with profiling.phase('scoring'):
+                scores = index.partner_scores(mon)
+            with profiling.phase('sort'):
+                partners = index.best_partners(scores, k=num_partners)
+        if cache:
+            cache.put('find_partner', params, partners)
+
+    # Save results and end the function
+    with profiling.phase('save_results'):
+        save_results(results_path, (((name,), score) for name, score in \
+                                    partners), title, fmt)
+    return
+
+def find_partners(mons, dex, results_path, num_partners=10, tie_break=None, \
+                  cache=None, synergy_matrix=None, scorer=DEFAULT_SCORER, \
+                  filters=None, fmt=DEFAULT_FORMAT, dex_matrix=None):
+    # Batch version of find_partner for many pokemon.  Every pokemon that the
+    # cache and synergy matrix don't answer is scored in one pass over the
+    # dex, and all of the partners are saved to one results file with the
+    # pokemon they are for as the query.
+    mons = list(dict.fromkeys(mons))
+    print('Searching for partners for {} pokemon.'.format(len(mons)), \
+          file=sys.stderr)
+    title = 'Results for {}:'.format(', '.join(mons))
+    if num_partners is None:
+        # Stream every ranking straight to the file, one mon after another
+        index, rows = partner_index(dex, scorer, tie_break, filters, \
+                                    dex_matrix)
+        with profiling.phase('save_results'):
+            count = save_results(results_path, (((name,), score, mon) \
+                                 for mon in mons for name, score in \
+                                 index.iter_partners(mon, rows)), title, fmt)
+        print('Saved {} partners.'.format(count), file=sys.stderr)
+        return
+
+    # Look up every distinct mon in the cache, then the synergy matrix
     partners = {}
+    params = {}
+    for mon in mons:
+        params[mon] = {'mon': mon, 'k': num_partners, 'tie_break': tie_break, \
+                       'scorer': scorer}
+        if filters:
+            params[mon]['filters'] = filters
+        found = cache.get('find_partner', params[mon]) if cache else None
+        if found is None and synergy_matrix is not None and \
+           tie_break is None and synergy_matrix.scorer == scorer and \
+           not filters:
+            with profiling.phase('synergy_matrix'):
+                found = synergy_matrix.find_partners(mon, k=num_partners)
+        if found is not None:
+            partners[mon] = found
+
+    # Score the rest against every type signature in the dex at once
+    missing = [mon for mon in mons if mon not in partners]
+    if missing:
+        index, rows = partner_index(dex, scorer, tie_break, filters, \
+                                    dex_matrix)
+        with profiling.phase('scoring'):
+            found = index.find_partners_batch(missing, num_partners, rows)
+        for mon, mon_partners in zip(missing, found):
+            partners[mon] = mon_partners
+            if cache:
+                cache.put('find_partner', params[mon], mon_partners)
+
+    # Save results and end the function
+    with profiling.phase('save_results'):
+        save_results(results_path, (((name,), score, mon) for mon in mons \
+                                    for name, score in partners[mon]), \
+                     title, fmt)
+    return
 
-    # Iterate through the pokedex dict and calculate the type synergy of each
-    # pair
-    for count, pokemon in enumerate(dex.keys()):
-        partners[pokemon] = type_synergy(dex[mon]['type'], dex[pokemon]['type'])
-        if count % 150 == 0:
-            print('Done with {} Pokemon.'.format(count))
+def build_team(mons, dex, results_path, num_teams=10, tie_break=None, \
+               workers=1, cache=None, scorer=DEFAULT_SCORER, \
+               max_uncovered=None, max_stacked=None, filters=None, \
+               fmt=DEFAULT_FORMAT, dex_matrix=None):
+    # This function takes in one to five pokemon and finds the teams of six
+    # that they fit best into, optionally limiting the teams' weaknesses and
+    # filling the open slots only with pokemon that pass the filters
+    if num_teams is None:
+        raise ValueError('build_team needs a number of teams to save.')
+    print('Building a team around {}.'.format(', '.join(mons)), \
+          file=sys.stderr)
+    params = {'mons': mons, 'k': num_teams, 'tie_break': tie_break, \
+              'scorer': 'pairwise_' + scorer}
+    if max_uncovered is not None or max_stacked is not None:
+        params['max_uncovered'] = max_uncovered
+        params['max_stacked'] = max_stacked
+    if filters:
+        params['filters'] = filters
+    teams = cache.get('build_team', params) if cache else None
 
-    # Sort the dictionary by type synergy value
-    partners = {k : v for k, v in sorted(partners.items(), \
-                key=lambda item: item[1])}
+    # Search over type signatures, since mons with the same types are
+    # interchangeable for scoring
+    if teams is None:
+        with profiling.phase('index'):
+            index = SignatureIndex(get_dex_matrix(dex, scorer, dex_matrix), \
+                                   tie_break)
+        rows = None
+        if filters:
+            with profiling.phase('filter'):
+                rows = EligibilityIndex(index.dex_matrix).rows(**filters)
+            print('{} of {} pokemon pass the filters.'.format(len(rows), \
+                  len(dex)), file=sys.stderr)
+        print('Searching {} type signatures ({:.1f} mons each).'.format( \
+              len(index), index.collapse_ratio), file=sys.stderr)
+        with profiling.phase('search'):
+            teams = index.search_teams(mons, num_teams=num_teams, \
+                                       workers=workers, \
+                                       max_uncovered=max_uncovered, \
+                                       max_stacked=max_stacked, rows=rows)
 
-    # Take only the first 10 items of the dictionary
-    partners_new = {}
-    for count, pokemon in enumerate(partners.keys()):
-        partners_new[pokemon] = partners[pokemon]
-        if count == 9:
-            break
+        # Report how much of the search space the bounds cut away
+        print('Expanded {} nodes, pruned {} subtrees and evaluated {} full ' \
+              'teams.'.format(index.stats['nodes_expanded'], \
+                              index.stats['nodes_pruned'], \
+                              index.stats['leaves_evaluated']), \
+              file=sys.stderr)
+        if index.stats['teams_filtered']:
+            print('Filtered out {} teams and partial teams by their ' \
+                  'weaknesses.'.format(index.stats['teams_filtered']), \
+                  file=sys.stderr)
+        if cache:
+            cache.put('build_team', params, teams)
 
     # Save results and end the function
-    save_results(results_path, partners_new, mon)
+    with profiling.phase('save_results'):
+        save_results(results_path, teams, 'Results for {}:'.format( \
+                     ', '.join(mons)), fmt)
+    return
+
+def build_pareto_team(mons, dex, results_path, scorer=DEFAULT_SCORER, \
+                      filters=None, fmt=DEFAULT_FORMAT, dex_matrix=None):
+    # This function takes in two to five pokemon and finds every team of six
+    # around them that no other team beats on type synergy, role coverage,
+    # and power at once, optionally only among the pokemon that pass the
+    # filters.  The search needs the role analysis, so it is only
+    # imported here to keep the other modes quick to start.
+    from team_pareto import ParetoTeamSearch, role_features
+    print('Building the Pareto front of teams around {}.'.format( \
+          ', '.join(mons)), file=sys.stderr)
+    with profiling.phase('index'):
+        dex_matrix = get_dex_matrix(dex, scorer, dex_matrix)
+        search = ParetoTeamSearch(dex_matrix, role_features(dex))
+    rows = None
+    if filters:
+        with profiling.phase('filter'):
+            rows = EligibilityIndex(dex_matrix).rows(**filters)
+    with profiling.phase('search'):
+        front = search.search(mons, rows)
+
+    # Report how much of the search space the bounds cut away
+    print('Kept {} of {} candidates, expanded {} nodes, pruned {} subtrees ' \
+          'and evaluated {} full teams.'.format( \
+          search.stats['candidates_kept'], search.stats['candidates'], \
+          search.stats['nodes_expanded'], search.stats['nodes_pruned'], \
+          search.stats['leaves_evaluated']), file=sys.stderr)
+    print('Found {} teams on the Pareto front.'.format(len(front)), \
+          file=sys.stderr)
+
+    with profiling.phase('save_results'):
+        save_results(results_path, front, 'Pareto front for {}:'.format( \
+                     ', '.join(mons)), fmt)
     return
 
 def main(data, results_path, mons=[], test_flag=False, \
-         find_partner_flag=False, build_team_flag=False):
+         find_partner_flag=False, build_team_flag=False, num_results=10, \
+         tie_break=None, workers=1, cache_dir=None, cache_size=64, \
+         cache_stats=False, synergy_matrix_path=None, profile=False, \
+         profile_report=None, profile_dump=None, scorer=DEFAULT_SCORER, \
+         pareto=False, max_uncovered=None, max_stacked=None, filters=None, \
+         fmt=DEFAULT_FORMAT, store_path=None):
     # Main execution function.  Check each flag and execute the chosen one.
-    if test_flag is True:
-        test(dex)
-    elif find_partner_flag is True:
-        dex, type_data = load_data(data)
-        find_partner(mons[0], dex, results_path)
-    elif build_team_flag is True:
-        dex, type_data = load_data(data)
-        build_team(mons, dex)
-    else:
-        print("No option selected.  Please choose test, find_partner, or ", \
-              "build team.\n")
+    profiler = None
+    if profile or profile_report is not None or profile_dump is not None:
+        profiler = profiling.Profiler(profile_dump)
+        profiling.set_profiler(profiler)
+        profiler.start()
+
+    # Stop the profiler even if the run fails, so it never outlives main
+    try:
+        cache = None
+        if cache_dir is not None:
+            cache = ResultCache(cache_dir, data, int(cache_size * 2**20))
+
+        # A store only loads the pokemon that pass the filters, plus the ones
+        # asked about, unless the results depend on the whole dex: the usage
+        # scorer weighs types by how common they are, and the Pareto search
+        # ranks roles against every mon
+        load_filters = None
+        if store_path is not None and scorer != 'usage' and not pareto:
+            load_filters = filters
+
+        if test_flag is True:
+            with profiling.phase('load_data'):
+                dex, type_data, dex_matrix = load_data(data, store_path)
+            test(dex, results_path, dex_matrix)
+        elif find_partner_flag is True:
+            with profiling.phase('load_data'):
+                dex, type_data, dex_matrix = load_data(data, store_path, \
+                                                       load_filters, mons)
+            synergy_matrix = None
+            if synergy_matrix_path is not None:
+                synergy_matrix = SynergyMatrix(synergy_matrix_path)
+                if not synergy_matrix.is_fresh(data):
+                    print('Synergy matrix is out of date, ignoring it.', \
+                          file=sys.stderr)
+                    synergy_matrix = None
+            with profiling.phase('find_partner'):
+                if len(mons) > 1:
+                    find_partners(mons, dex, results_path, num_results, \
+                                  tie_break, cache, synergy_matrix, scorer, \
+                                  filters, fmt, dex_matrix)
+                else:
+                    find_partner(mons[0], dex, results_path, num_results, \
+                                 tie_break, cache, synergy_matrix, scorer, \
+                                 filters, fmt, dex_matrix)
+        elif build_team_flag is True:
+            with profiling.phase('load_data'):
+                dex, type_data, dex_matrix = load_data(data, store_path, \
+                                                       load_filters, mons)
+            with profiling.phase('build_team'):
+                if pareto:
+                    build_pareto_team(mons, dex, results_path, scorer, \
+                                      filters, fmt, dex_matrix)
+                else:
+                    build_team(mons, dex, results_path, num_results, \
+                               tie_break, workers, cache, scorer, \
+                               max_uncovered, max_stacked, filters, fmt, \
+                               dex_matrix)
+        elif not cache_stats:
+            print("No option selected.  Please choose test, find_partner, " \
+                  "or ", "build team.\n", file=sys.stderr)
+
+        if cache is not None:
+            cache.save_stats()
+            if cache_stats:
+                cache.print_stats(sys.stderr)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiling.set_profiler(None)
+
+    if profiler is not None:
+        profiler.print_report(sys.stderr)
+        if profile_report is not None:
+            profiler.save_report(profile_report)
     return
 
 if __name__ == '__main__':
     args = parse_arguments()
-    main(args.data, args.results_path, args.mons, args.test_flag, \
-         args.find_partner_flag, args.build_team_flag)
+    mons = args.mons or []
+    if args.mons_file is not None:
+        mons = mons + read_mons(args.mons_file)
+    main(args.data, args.results_path, mons, args.test_flag, \
+         args.find_partner_flag, args.build_team_flag, args.num_results, \
+         args.tie_break, args.workers, args.cache_dir, args.cache_size, \
+         args.cache_stats, args.synergy_matrix, args.profile, \
+         args.profile_report, args.profile_dump, args.scorer, args.pareto, \
+         args.max_uncovered, args.max_stacked, \
+         get_filters(args.exclude_alt_forms, args.min_speed, args.min_bst, \
+                     args.types, args.tier), args.fmt, args.store)
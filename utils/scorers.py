@@ -0,0 +1,98 @@
+# Author:     Andrew Smith
+# File:       scorers.py
+# Project:    Pokemon Team Builder
+
+'''
+scorers.py: This file holds the scoring kernels that turn the element-wise
+            product of two mons' weaknesses, resistances, and immunities into
+            a type synergy score.  Lower is better for every scorer.
+
+Every kernel takes an array of products with the 18 attacking types on the last
+axis, e.g. (M, 18) for one mon against M partners or (M, K, 18) for every pair
+of two sets, and reduces that axis, so a whole batch is scored in one call.
+Kernels also take an (18,) array of attacking type weights, which only the
+usage scorer uses.
+'''
+
+import numpy as np
+from numpy.linalg import norm
+
+DEFAULT_SCORER = 'l2'
+
+# An immunity makes a product 0, which the log scorer counts as this much
+LOG_FLOOR = 1/16
+
+# What the shared weakness scorer adds for every attacking type that the pair
+# takes at least x4 from between them
+SHARED_WEAKNESS_PENALTY = 4
+
+SCORERS = {}
+
+
+def register(name):
+    # Decorator that adds a kernel to SCORERS under a name
+    def add(kernel):
+        SCORERS[name] = kernel
+        return kernel
+    return add
+
+
+def get_scorer(name):
+    # Returns the kernel registered under a name
+    try:
+        return SCORERS[name]
+    except KeyError:
+        raise ValueError('Unknown scorer {}, choose from {}.'.format(name, \
+                         ', '.join(sorted(SCORERS))))
+
+
+@register('l1')
+def l1(products, weights=None):
+    # Total multiplier over all attacking types
+    return products.sum(axis=-1)
+
+
+@register('l2')
+def l2(products, weights=None):
+    # The original type_synergy score
+    return norm(products, axis=-1)
+
+
+@register('linf')
+def linf(products, weights=None):
+    # Only the single worst attacking type counts
+    return products.max(axis=-1)
+
+
+@register('log')
+def log_sum(products, weights=None):
+    # Sum of the log multipliers, so a x2 weakness and a x1/2 resistance cancel
+    # out
+    return np.log2(np.maximum(products, LOG_FLOOR)).sum(axis=-1)
+
+
+@register('shared_weakness')
+def shared_weakness(products, weights=None):
+    # The L2 score plus a penalty for every attacking type whose product is
+    # at least 4, i.e. that both mons are weak to, or that one is weak to x4
+    # and the other takes neutral damage from
+    return norm(products, axis=-1) + \
+           SHARED_WEAKNESS_PENALTY * (products >= 4).sum(axis=-1)
+
+
+@register('usage')
+def usage(products, weights=None):
+    # The L2 score with every attacking type weighted by how common it is, so
+    # weaknesses to popular types count for more
+    if weights is None:
+        return norm(products, axis=-1)
+    return np.sqrt((products * products * weights).sum(axis=-1))
+
+
+def usage_weights(type_counts):
+    # Attacking type weights from how many mons have each type, scaled to a
+    # mean of 1 so the usage scorer stays on the L2 scale
+    type_counts = np.asarray(type_counts, dtype=float)
+    if not type_counts.any():
+        return np.ones(len(type_counts))
+    return type_counts / type_counts.mean()
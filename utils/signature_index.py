@@ -0,0 +1,261 @@
+# Author:     Andrew Smith
+# File:       signature_index.py
+# Project:    Pokemon Team Builder
+
+'''
+signature_index.py: This file groups the dex by type signature (the sorted type
+                    list of a mon).  Type scoring only depends on the
+                    signature, so partners and teams are scored once per
+                    signature and then expanded back to concrete Pokemon.
+'''
+
+from itertools import combinations, islice, product
+import numpy as np
+from team_search import TEAM_SIZE, TeamSearch
+from parallel_search import search_pool_parallel
+
+# Stats that can be used to order mons sharing a signature, best first.  None
+# keeps dex order.
+TIE_BREAKS = {'bst': None, 'hp': 0, 'atk': 1, 'def': 2, 'spa': 3, 'spd': 4, \
+              'spe': 5}
+
+# Most bytes of weakness products a batch of partner queries builds at once
+BATCH_BYTES = 64 * 2**20
+
+
+class SignatureIndex:
+    # Index from type signatures to the dex rows that have them.
+    #   signatures:   rows of the chart's combination tables present in the dex
+    #   signature_of: position in signatures of every dex row
+    #   wri:          (S, 18) weaknesses, resistances, and immunities of each
+    #                 signature
+
+    def __init__(self, dex_matrix, tie_break=None):
+        self.dex_matrix = dex_matrix
+        self.signatures, self.signature_of, counts = \
+            np.unique(dex_matrix.combo_ids, return_inverse=True, \
+                      return_counts=True)
+        self.wri = dex_matrix.chart.wri[self.signatures]
+        self.stats = {}
+
+        # Rank every dex row by the tie break (then dex order) and store each
+        # signature's members in that order
+        num_mons = len(dex_matrix)
+        rows = np.arange(num_mons)
+        key = self._tie_break_key(tie_break)
+        by_rank = rows if key is None else np.lexsort((rows, -key))
+        self.rank = np.empty(num_mons, dtype=np.intp)
+        self.rank[by_rank] = rows
+        grouped = by_rank[np.argsort(self.signature_of[by_rank], \
+                                     kind='stable')]
+        self._members = np.split(grouped, np.cumsum(counts)[:-1])
+
+    def _tie_break_key(self, tie_break):
+        # Returns the per-mon value to order by, higher first
+        if tie_break is None:
+            return None
+        if tie_break not in TIE_BREAKS:
+            raise ValueError('Unknown tie break {}, choose from {}.'.format( \
+                             tie_break, ', '.join(TIE_BREAKS)))
+        stats = self.dex_matrix.stats
+        if TIE_BREAKS[tie_break] is None:
+            return stats.sum(axis=1)
+        return stats[:, TIE_BREAKS[tie_break]]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @property
+    def collapse_ratio(self):
+        # How many dex rows there are per signature
+        return len(self.dex_matrix) / len(self.signatures)
+
+    def members(self, signature):
+        # Dex rows of a signature (a position in signatures), best first
+        return self._members[signature]
+
+    def partner_scores(self, mon):
+        # Returns the type synergy of a mon with every signature in the dex
+        signature = self.signature_of[self.dex_matrix.index(mon)]
+        return self.dex_matrix.kernel(self.wri[signature] * self.wri, \
+                                      self.dex_matrix.weights)
+
+    def find_partners(self, mon, k=10, rows=None):
+        # Returns the k best partners of a mon as (name, score) tuples, best
+        # first, scoring each signature once.  rows optionally restricts the
+        # partners to those dex rows, e.g. from an EligibilityIndex.
+        if rows is None:
+            return self.best_partners(self.partner_scores(mon), k)
+
+        rows = np.asarray(rows, dtype=np.intp)
+        return self._best_rows(rows, self._row_scores(mon, rows), k)
+
+    def find_partners_batch(self, mons, k=10, rows=None, \
+                            max_bytes=BATCH_BYTES):
+        # Returns the find_partners results of many mons, in the same order.
+        # Every distinct signature among the mons is scored against every
+        # signature in the dex (or of rows) in one broadcasted kernel call per
+        # chunk of query signatures, with chunks sized so the products take at
+        # most max_bytes, and mons sharing a signature share their result.
+        query_signatures = self.signature_of[[self.dex_matrix.index(mon) \
+                                              for mon in mons]]
+        unique, inverse = np.unique(query_signatures, return_inverse=True)
+        targets = self.wri
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            target_signatures, row_signatures = np.unique( \
+                self.signature_of[rows], return_inverse=True)
+            targets = self.wri[target_signatures]
+
+        chunk_size = max(1, max_bytes // max(1, targets.nbytes))
+        results = []
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            scores = self.dex_matrix.kernel(self.wri[chunk][:, None, :] * \
+                                            targets[None, :, :], \
+                                            self.dex_matrix.weights)
+            for signature_scores in scores:
+                if rows is None:
+                    results.append(self.best_partners(signature_scores, k))
+                else:
+                    results.append(self._best_rows(rows, signature_scores[ \
+                                                   row_signatures], k))
+        return [results[i] for i in inverse]
+
+    def _best_rows(self, rows, row_scores, k):
+        # Returns the k best of some dex rows as (name, score) tuples, given
+        # the score of each row
+
+        # Keep everything scoring at most the k-th best, then order those by
+        # score and tie break
+        best = np.arange(len(rows))
+        if 0 < k < len(rows):
+            best = np.flatnonzero(row_scores <= \
+                                  np.partition(row_scores, k - 1)[k - 1])
+        best = best[np.lexsort((self.rank[rows[best]], row_scores[best]))][:k]
+
+        names = self.dex_matrix.names
+        return [(names[row], float(score)) for row, score in \
+                zip(rows[best].tolist(), row_scores[best].tolist())]
+
+    def _row_scores(self, mon, rows):
+        # Scores a mon against some dex rows, only scoring the signatures of
+        # those rows, so the fewer rows the less work there is
+        signatures, row_signatures = np.unique(self.signature_of[rows], \
+                                               return_inverse=True)
+        signature = self.signature_of[self.dex_matrix.index(mon)]
+        scores = self.dex_matrix.kernel(self.wri[signature] * \
+                                        self.wri[signatures], \
+                                        self.dex_matrix.weights)
+        return scores[row_signatures]
+
+    def iter_partners(self, mon, rows=None):
+        # Yields every partner of a mon, or of the given dex rows, as (name,
+        # score) tuples in the same order as find_partners, for writing out a
+        # whole ranking without building it in memory
+        names = self.dex_matrix.names
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            row_scores = self._row_scores(mon, rows)
+            for position in np.lexsort((self.rank[rows], row_scores)).tolist():
+                yield names[rows[position]], float(row_scores[position])
+            return
+
+        # Walk the signatures best first, merging the members of signatures
+        # with the same score by rank
+        scores = self.partner_scores(mon)
+        order = np.argsort(scores, kind='stable')
+        bounds = np.flatnonzero(np.diff(scores[order])) + 1
+        for group in np.split(order, bounds):
+            group_rows = np.concatenate([self._members[signature] \
+                                         for signature in group])
+            score = float(scores[group[0]])
+            for row in group_rows[np.argsort(self.rank[group_rows], \
+                                             kind='stable')].tolist():
+                yield names[row], score
+
+    def best_partners(self, scores, k=10):
+        # Returns the k best mons as (name, score) tuples, best first, given
+        # the score of every signature from partner_scores
+
+        # Take whole signatures, best first, until there are k mons and the
+        # next signature scores worse than the last one taken
+        rows = []
+        last_score = None
+        for signature in np.argsort(scores, kind='stable'):
+            if len(rows) >= k and scores[signature] > last_score:
+                break
+            rows.extend(self._members[signature])
+            last_score = scores[signature]
+        rows = np.asarray(rows, dtype=np.intp)
+        row_scores = scores[self.signature_of[rows]]
+        rows = rows[np.lexsort((self.rank[rows], row_scores))][:k]
+
+        names = self.dex_matrix.names
+        return [(names[row], float(scores[self.signature_of[row]])) \
+                for row in rows]
+
+    def search_teams(self, seeds, num_teams=10, team_size=TEAM_SIZE, \
+                     workers=1, max_uncovered=None, max_stacked=None, \
+                     rows=None):
+        # Searches for the best teams around the seeds over signatures rather
+        # than mons, then expands the best signature teams into up to num_teams
+        # (team, score) tuples, best first.  workers > 1 splits the search over
+        # a pool of processes.  max_uncovered and max_stacked limit the teams'
+        # weaknesses, which only depend on the signatures.  rows optionally
+        # restricts the mons that fill the open slots to those dex rows.
+        search = TeamSearch(self.dex_matrix, team_size, \
+                            max_uncovered=max_uncovered, \
+                            max_stacked=max_stacked)
+        seed_ids = search.check_seeds(seeds)
+
+        # A signature can fill as many slots as it has eligible mons that
+        # aren't seeds
+        eligible = None
+        if rows is None:
+            capacity = np.asarray([len(members) for members in self._members])
+        else:
+            eligible = np.zeros(len(self.dex_matrix), dtype=bool)
+            eligible[rows] = True
+            capacity = np.bincount(self.signature_of[rows], \
+                                   minlength=len(self.signatures))
+        eligible_seeds = [row for row in seed_ids if eligible is None or \
+                          eligible[row]]
+        np.subtract.at(capacity, self.signature_of[eligible_seeds], 1)
+        pool = np.flatnonzero(capacity > 0)
+        pool_args = (self.dex_matrix.combo_ids[seed_ids], \
+                     self.signatures[pool], capacity[pool], \
+                     team_size - len(seeds), num_teams)
+        if workers > 1 and team_size - len(seeds) > 1:
+            teams, self.stats = search_pool_parallel(search.synergy, \
+                *pool_args, workers=workers, team_size=team_size, \
+                masks=search.masks, max_uncovered=max_uncovered, \
+                max_stacked=max_stacked)
+        else:
+            teams = search.search_pool(*pool_args)
+            self.stats = search.stats
+
+        results = []
+        for score, picks in teams:
+            expanded = self._expand_team(seed_ids, pool[list(picks)], \
+                                         eligible)
+            for team in islice(expanded, num_teams - len(results)):
+                results.append((tuple(seeds) + team, score))
+            if len(results) == num_teams:
+                break
+        return results
+
+    def _expand_team(self, seed_ids, signatures, eligible=None):
+        # Yields every team of mon names for a list of picked signatures,
+        # choosing the best ranked non-seed members of each signature first.
+        # eligible optionally masks which members may be chosen.
+        names = self.dex_matrix.names
+        seed_ids = set(seed_ids)
+        unique, repeats = np.unique(signatures, return_counts=True)
+        choices = [combinations([row for row in self._members[signature] \
+                                 if row not in seed_ids and \
+                                 (eligible is None or eligible[row])], \
+                                repeat) \
+                   for signature, repeat in zip(unique, repeats)]
+        for picked in product(*choices):
+            yield tuple(names[row] for group in picked for row in group)
@@ -8,89 +8,109 @@ stats_analysis.py: This file performs an elementary statistical analysis on all
                    such as stat averages and standard deviation.
 '''
 
-import json
 import os
 import os.path as osp
 import numpy as np
-from numpy.linalg import norm
-from math import sqrt, exp
-import matplotlib.pyplot as plt
+from dex_snapshot import load_pokedex
+from type_functions import DATA_DIR
+
+# Where main writes the role data, relative to this file
+ROLES_PATH = osp.join(osp.dirname(osp.abspath(__file__)), os.pardir, 'dumps', \
+                      'roles.txt')
 
 
 def make_stats_matrix(pokedex):
     # Creates an mx6 matrix of Pokemon stats where m is the number of Pokemon in
     # the pokedex and counts the number of mons
     num_mons = len(pokedex)
-    prev_id = 0
-    stats_matrix = []
-    for count, mon in enumerate(pokedex.keys()):
-        # Make the first 5 indices the normal stats and set the sixth to
-        # the speed rank
-        stat_list = pokedex[mon]['stats'][:5]
-        stat_list.append((pokedex[mon]['speed_rank'] + 1) / num_mons)
-        stats_matrix.append(stat_list)
-    stats_matrix = np.asarray(stats_matrix)
+    base_stats = np.asarray([pokedex[mon]['stats'] for mon in pokedex], \
+                            dtype=float).reshape(num_mons, 6)
+    speed_ranks = np.asarray([pokedex[mon]['speed_rank'] for mon in pokedex], \
+                             dtype=float)
+    return stats_matrix_from_arrays(base_stats, speed_ranks), num_mons
+
+
+def stats_matrix_from_arrays(base_stats, speed_ranks, num_mons=None):
+    # Array version of make_stats_matrix that takes an mx6 matrix of base stats
+    # and the speed rank of each mon.  The first 5 columns are the normal stats
+    # and the sixth is the speed rank as a fraction of the number of mons in
+    # the dex, which defaults to the number of rows.
+    if num_mons is None:
+        num_mons = len(speed_ranks)
+    base_stats = np.asarray(base_stats, dtype=float).reshape(-1, 6)
+    speed_ranks = np.asarray(speed_ranks, dtype=float)
+    stats_matrix = np.empty((len(speed_ranks), 6))
 
     # Fixes the stats matrix to more accurately reflect the in-game stats of
-    # Pokemon at level 100 (see the PDF for a deeper explanation)
-    for stat_index, row in enumerate(stats_matrix.T):
-        # Change base HP to (HP * 2 + 141)
-        if stat_index == 0:
-            stats_matrix[:, stat_index] = row * 2 + 141
-        # Change every stat except HP and Speed to (stat * 2 + 36)
-        elif stat_index < 5:
-            stats_matrix[:, stat_index] = row * 2 + 36
+    # Pokemon at level 100 (see the PDF for a deeper explanation).  Base HP
+    # becomes (HP * 2 + 141) and every stat except HP and Speed becomes
+    # (stat * 2 + 36).
+    stats_matrix[:, 0] = base_stats[:, 0] * 2 + 141
+    stats_matrix[:, 1:5] = base_stats[:, 1:5] * 2 + 36
+    stats_matrix[:, 5] = (speed_ranks + 1) / num_mons
 
-    return stats_matrix, num_mons
+    return stats_matrix
 
 
 def get_role_data(stats_matrix):
     # This function takes in a corrected mx6 stats matrix and uses it to find
     # each Pokemon's strengths, i.e. physical/special durability,
-    # physical/special offensiveness, etc.
-    num_mons = max(stats_matrix.shape)
-    phys_dur = stats_matrix[:, 0] * stats_matrix[:, 2]
-    spec_dur = stats_matrix[:, 0] * stats_matrix[:, 4]
-    phys_off = stats_matrix[:, 1] * ((stats_matrix[:, 1] * \
-               sigmoid(stats_matrix[:, 5]) + 450) / (stats_matrix[:, 1] * \
-               (1 - sigmoid(stats_matrix[:, 5])) + 450))
-    spec_off = stats_matrix[:, 3] * ((stats_matrix[:, 3] * \
-               sigmoid(stats_matrix[:, 5]) + 450) / (stats_matrix[:, 3] * \
-               (1 - sigmoid(stats_matrix[:, 5])) + 450))
-
-    phys_dur = np.reshape(phys_dur, (num_mons, 1))
-    spec_dur = np.reshape(spec_dur, (num_mons, 1))
-    phys_off = np.reshape(phys_off, (num_mons, 1))
-    spec_off = np.reshape(spec_off, (num_mons, 1))
+    # physical/special offensiveness, etc.  The input is not modified.
+
+    # Standardize the stats so the later calculations are more consistent
+    stat_rankings = standard_score(raw_role_data(stats_matrix), new_std=25)
+    return finish_role_data(stat_rankings)
+
+
+def raw_role_data(stats_matrix):
+    # Returns the unstandardized | PD | SD | PO | SO | columns for a corrected
+    # mx6 stats matrix.  Each row only depends on the same row of the input.
+    num_mons = stats_matrix.shape[0]
+    hp, atk, dfn, spa, spd = (stats_matrix[:, i] for i in range(5))
+
+    # The original loop version of sigmoid overwrote its input, so each of the
+    # four calls below used to see the previous call's output.  Apply it that
+    # many times explicitly so the scores stay the same.
+    speed_1 = sigmoid(stats_matrix[:, 5])
+    speed_2 = sigmoid(speed_1)
+    speed_3 = sigmoid(speed_2)
+    speed_4 = sigmoid(speed_3)
 
     # | PD | SD | PO | SO |
-    stat_rankings = np.concatenate((phys_dur, spec_dur, phys_off, spec_off), \
-                                    axis=1)
+    # Column-major so the per-column statistics below read contiguous memory
+    stat_rankings = np.empty((num_mons, 4), order='F')
+    stat_rankings[:, 0] = hp * dfn
+    stat_rankings[:, 1] = hp * spd
+    stat_rankings[:, 2] = atk * ((atk * speed_1 + 450) / \
+                                 (atk * (1 - speed_2) + 450))
+    stat_rankings[:, 3] = spa * ((spa * speed_3 + 450) / \
+                                 (spa * (1 - speed_4) + 450))
+    return stat_rankings
 
-    # Standardize the stats so the later calculations are more consistent
-    stat_rankings = standard_score(stat_rankings, new_std=25)
+
+def finish_role_data(stat_rankings):
+    # Takes the standardized | PD | SD | PO | SO | columns and appends the
+    # | ODB | PSB | BSR | columns to them
+    num_mons = stat_rankings.shape[0]
 
     # Find the overall rankings and then normalize them
-    overall_bst_ranking = np.asarray([sum(row) for row in stat_rankings])
-    overall_bst_ranking = np.reshape(overall_bst_ranking, (num_mons, 1))
+    overall_bst_ranking = stat_rankings.sum(axis=1, keepdims=True)
     overall_bst_ranking = min_max_data(overall_bst_ranking, b=num_mons)
 
-    # Create a list for the biases
-    biases = []
-    for i, row in enumerate(stat_rankings):
-        # Subtract the max offensiveness stat from the max durability stat. A
-        # more negative score means a pokemon is more offensively biased and a
-        # more positive score means it is defensively biased
-        off_dur_bias = (max(row[:2]) - max(row[2:]))
-
-        # Find the difference between the special stats and the physical stats.
-        # A more negative score means a pokemon is specially biased and a more
-        # positive score means it is physicall biased
-        phys_spec_bias = row[0] + row[2] - (row[1] + row[3])
-        biases.append([off_dur_bias, phys_spec_bias])
+    # Subtract the max offensiveness stat from the max durability stat. A more
+    # negative score means a pokemon is more offensively biased and a more
+    # positive score means it is defensively biased.
+    # Find the difference between the special stats and the physical stats. A
+    # more negative score means a pokemon is specially biased and a more
+    # positive score means it is physicall biased
+    biases = np.empty((num_mons, 2), order='F')
+    biases[:, 0] = stat_rankings[:, :2].max(axis=1) - \
+                   stat_rankings[:, 2:].max(axis=1)
+    biases[:, 1] = stat_rankings[:, 0] + stat_rankings[:, 2] - \
+                   (stat_rankings[:, 1] + stat_rankings[:, 3])
 
     # Normalize the biases to have a mean of 0 and standard deviation of 5
-    biases = standard_score(np.asarray(biases), new_std=5)
+    biases = standard_score(biases, new_std=5)
 
     # Concatenate the biases to the rankings
     stat_rankings = np.concatenate((stat_rankings, biases, \
@@ -101,53 +121,38 @@ def get_role_data(stats_matrix):
 
 def get_mean_std(data_matrix, samples):
     # This function takes in a matrix of mxn size and computes the standard
-    # deviation and mean of the data.
-
-    # Transposes the data_matrix so that the rows are the stats and then sums
-    # them and divides by the number of samples to find the average
-    mean_vec = np.asarray([sum(row) / samples for row in data_matrix.T])
-
-    # Does the same thing as above but finds standard deviation instead
-    std_vec = np.asarray([sqrt(norm(row - mean_vec[i])**2 / samples) for \
-                         i, row in enumerate(data_matrix.T)])
-
+    # deviation and mean of each column.
+    mean_vec = data_matrix.sum(axis=0) / samples
+    std_vec = np.sqrt(((data_matrix - mean_vec) ** 2).sum(axis=0) / samples)
     return mean_vec, std_vec
 
 
 def min_max_data(data_matrix, a=1, b=100):
-    # This function takes in a matrix and normalizes the data by using the
-    # min-max method
-    data_matrix = data_matrix.T
-    for i, row in enumerate(data_matrix):
-        data_matrix[i, :] = a + ((row - min(row)) * (b - a)) / \
-                            (max(row) - min(row))
-
-    return data_matrix.T
+    # This function takes in a matrix and returns a copy with each column
+    # normalized by the min-max method
+    col_min = data_matrix.min(axis=0)
+    col_max = data_matrix.max(axis=0)
+    return a + ((data_matrix - col_min) * (b - a)) / (col_max - col_min)
 
 
 def standard_score(data_matrix, new_mean=0, new_std=1):
     # This function takes in a stats matrix and standardizes it based on
     # (X - mu) / sigma then returns the mxn matrix
-
-    # Get the mean and standard deviation
-    mean_vec, std_vec = get_mean_std(data_matrix, max(data_matrix.shape))
-
-    standard_matrix = np.asarray([(new_mean + new_std * ((row - mean_vec[i]) / \
-                                  std_vec[i])) for i, row in \
-                                  enumerate(data_matrix.T)])
-    return standard_matrix.T
+    mean_vec, std_vec = get_mean_std(data_matrix, data_matrix.shape[0])
+    return new_mean + new_std * ((data_matrix - mean_vec) / std_vec)
 
 
 def sigmoid(x, shift=0.45, stretch=5.5):
     # This function is a shifted sigmoid function that is modified to fit into
-    # [0, 1] so that it can be used on the speed ranking of each mon.
-    for i in range(max(x.shape)):
-        x[i] = 1 / (1 + exp(-(stretch * (x[i] - shift))))
-    return x
+    # [0, 1] so that it can be used on the speed ranking of each mon.  Returns
+    # a new array.
+    return 1 / (1 + np.exp(-(stretch * (x - shift))))
 
 
 def plot_stats(stats_matrix, binwidth=6):
-    # Creates a distribution plot for all stats
+    # Creates a distribution plot for all stats.  matplotlib is only imported
+    # here, since it takes longer to import than everything else combined.
+    import matplotlib.pyplot as plt
     stat_names = ['HP', 'Attack', 'Defense', 'Sp. Attack', 'Sp. Defense', \
                   'Speed']
 
@@ -206,13 +211,13 @@ def save_results(path_string, pokedex, data_matrix):
     return
 
 
-def main(do_plot=False):
-    with open(osp.join(os.pardir, 'data', 'pokedex.json')) as f_in:
-        pokedex = json.load(f_in)
+def main(do_plot=False, data_path=DATA_DIR, results_path=ROLES_PATH):
+    pokedex, type_data = load_pokedex(data_path)
     stats_matrix, num_mons = make_stats_matrix(pokedex)
     mean_vec, std_vec = get_mean_std(stats_matrix, num_mons)
     roles = get_role_data(stats_matrix)
-    save_results('../dumps/roles.txt', pokedex, roles)
+    os.makedirs(osp.dirname(osp.abspath(results_path)), exist_ok=True)
+    save_results(results_path, pokedex, roles)
     if do_plot:
         standard_matrix = standard_score(stats_matrix)
         plot_stats(standard_matrix)
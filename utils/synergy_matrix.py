@@ -0,0 +1,134 @@
+# Author:     Andrew Smith
+# File:       synergy_matrix.py
+# Project:    Pokemon Team Builder
+
+'''
+synergy_matrix.py: This file precomputes the type synergy of every pair of
+                   Pokemon in the dex and stores it as a memory-mapped float32
+                   matrix, along with the best partners of every mon.  Partner
+                   queries then only read one row from disk.  Run it directly
+                   to build the matrix for a data directory.
+
+Files written to the output directory:
+    synergy.npy        N x N float32 type synergy of every pair
+    synergy_topk.npy   N x k int32 best partners of every mon, best first
+    synergy_meta.json  mon names, the scorer, and the data files the matrix
+                       was built from
+'''
+
+import json
+import argparse
+import os
+import os.path as osp
+import numpy as np
+from type_functions import DATA_DIR, TypeChart
+from scorers import DEFAULT_SCORER, SCORERS
+from dex_matrix import DexMatrix
+from dex_snapshot import load_pokedex, source_stamps
+
+MATRIX_FILE = 'synergy.npy'
+TOP_K_FILE = 'synergy_topk.npy'
+META_FILE = 'synergy_meta.json'
+
+
+def build_synergy_matrix(dex_matrix, out_path, k=10, block_size=1024, \
+                         stamps=None):
+    # Writes the synergy matrix of a dex in blocks of block_size rows, so no
+    # more than block_size x N scores are held in memory at once.  stamps are
+    # the source file stamps recorded for freshness checks.
+    os.makedirs(out_path, exist_ok=True)
+    num_mons = len(dex_matrix)
+    k = min(k, num_mons)
+    matrix = np.lib.format.open_memmap(osp.join(out_path, MATRIX_FILE), \
+                                       mode='w+', dtype=np.float32, \
+                                       shape=(num_mons, num_mons))
+    top_k = np.lib.format.open_memmap(osp.join(out_path, TOP_K_FILE), \
+                                      mode='w+', dtype=np.int32, \
+                                      shape=(num_mons, k))
+
+    # The synergy of two mons only depends on their type signatures, so every
+    # block is a gather from the signature synergy table of the dex's scorer
+    synergy = dex_matrix.synergy
+    combo_ids = dex_matrix.combo_ids
+    for start in range(0, num_mons, block_size):
+        stop = min(start + block_size, num_mons)
+        block = synergy[combo_ids[start:stop]][:, combo_ids]
+        matrix[start:stop] = block
+
+        # A stable sort keeps ties in dex order, the same as find_partners
+        top_k[start:stop] = np.argsort(block, axis=1, kind='stable')[:, :k]
+    matrix.flush()
+    top_k.flush()
+
+    meta = {'names': dex_matrix.names, 'k': k, 'scorer': dex_matrix.scorer}
+    if stamps is not None:
+        meta['sources'] = [int(stamp) for stamp in stamps]
+    with open(osp.join(out_path, META_FILE), 'w') as f_out:
+        json.dump(meta, f_out)
+
+
+class SynergyMatrix:
+    # Read-only view of a matrix written by build_synergy_matrix
+
+    def __init__(self, path):
+        self.path = path
+        with open(osp.join(path, META_FILE)) as f_in:
+            meta = json.load(f_in)
+        self.names = meta['names']
+        self.k = meta['k']
+        self.scorer = meta.get('scorer', DEFAULT_SCORER)
+        self.sources = meta.get('sources')
+        self.name_indices = {name: i for i, name in enumerate(self.names)}
+        self.matrix = np.load(osp.join(path, MATRIX_FILE), mmap_mode='r')
+        self.top_k = np.load(osp.join(path, TOP_K_FILE), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_fresh(self, data_path):
+        # Whether the data files are unchanged since the matrix was built
+        try:
+            return self.sources == source_stamps(data_path).tolist()
+        except OSError:
+            return False
+
+    def row(self, mon):
+        # Type synergy of a mon with every mon in the dex
+        return self.matrix[self.name_indices[mon]]
+
+    def find_partners(self, mon, k=10):
+        # Returns the k best partners of a mon as (name, score) tuples, best
+        # first.  Only reads the mon's row of the top-k table and the scores it
+        # points at unless more partners are asked for than were stored.
+        index = self.name_indices[mon]
+        if k <= self.k:
+            partners = self.top_k[index, :k]
+        else:
+            partners = np.argsort(self.matrix[index], kind='stable')[:k]
+        scores = self.matrix[index, partners]
+        return [(self.names[partner], float(score)) for partner, score in \
+                zip(partners.tolist(), scores)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--out', help='directory to write the matrix to. ' + \
+                        'Defaults to synergy in the data directory.')
+    parser.add_argument('--k', type=int, default=10, \
+                        help='number of best partners to store for each mon')
+    parser.add_argument('--block_size', type=int, default=1024, \
+                        help='number of rows to compute at a time')
+    parser.add_argument('--scorer', choices=sorted(SCORERS), \
+                        default=DEFAULT_SCORER, help='type synergy scorer')
+    args = parser.parse_args()
+
+    out_path = args.out or osp.join(args.data, 'synergy')
+    stamps = source_stamps(args.data)
+    pokedex, type_data = load_pokedex(args.data)
+    dex_matrix = DexMatrix(pokedex, TypeChart(type_data), args.scorer)
+    build_synergy_matrix(dex_matrix, out_path, args.k, args.block_size, stamps)
+    print('Wrote the {0} x {0} synergy matrix to {1}.'.format( \
+          len(dex_matrix), out_path))
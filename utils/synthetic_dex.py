@@ -0,0 +1,87 @@
+# Author:     Andrew Smith
+# File:       synthetic_dex.py
+# Project:    Pokemon Team Builder
+
+'''
+synthetic_dex.py: This file generates fake pokedexes of any size in the
+                  pokedex.json format, for benchmarking.  Types are drawn from
+                  the type signature frequencies of the real dex and stats from
+                  a log-normal fit to the real base stats, so the fake dexes
+                  look like the real one at scale.
+'''
+
+import json
+import argparse
+import os
+import os.path as osp
+import shutil
+import numpy as np
+from type_functions import DATA_DIR
+
+
+def fit_dex(pokedex):
+    # Returns the type signature frequencies and the mean and covariance of the
+    # log base stats of a real dex
+    signatures = {}
+    for entry in pokedex.values():
+        signature = tuple(entry['type'])
+        signatures[signature] = signatures.get(signature, 0) + 1
+    log_stats = np.log(np.asarray([entry['stats'] for entry in \
+                                   pokedex.values()], dtype=float))
+    return signatures, log_stats.mean(axis=0), np.cov(log_stats, rowvar=False)
+
+
+def generate_dex(num_mons, seed=0, data_path=DATA_DIR, alt_form_rate=0.1):
+    # Returns a pokedex dict of num_mons fake mons, fit to the real dex in
+    # data_path.  The same seed always gives the same dex.
+    with open(osp.join(data_path, 'pokedex.json')) as f_in:
+        signatures, mean, cov = fit_dex(json.load(f_in))
+    rng = np.random.default_rng(seed)
+
+    signature_list = list(signatures)
+    counts = np.asarray([signatures[signature] for signature in \
+                         signature_list], dtype=float)
+    picks = rng.choice(len(signature_list), size=num_mons, \
+                       p=counts / counts.sum())
+    stats = np.exp(rng.multivariate_normal(mean, cov, size=num_mons))
+    stats = np.clip(np.rint(stats), 1, 255).astype(int)
+    alt_forms = rng.random(num_mons) < alt_form_rate
+
+    # Speed rank is the number of mons strictly slower than each one
+    speeds = stats[:, 5]
+    speed_ranks = np.searchsorted(np.sort(speeds), speeds, side='left')
+
+    pokedex = {}
+    width = len(str(num_mons))
+    for i in range(num_mons):
+        pokedex['synthmon {:0{}d}'.format(i, width)] = { \
+            'dex_id': i + 1, \
+            'type': list(signature_list[picks[i]]), \
+            'stats': stats[i].tolist(), \
+            'alt_form': bool(alt_forms[i]), \
+            'speed_rank': int(speed_ranks[i])}
+    return pokedex
+
+
+def write_data_dir(pokedex, out_path, data_path=DATA_DIR):
+    # Writes a data directory with a pokedex.json for the given dex and a copy
+    # of the real type_data.json
+    os.makedirs(out_path, exist_ok=True)
+    with open(osp.join(out_path, 'pokedex.json'), 'w') as f_out:
+        json.dump(pokedex, f_out, indent=2)
+    shutil.copy(osp.join(data_path, 'type_data.json'), out_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the real data directory')
+    parser.add_argument('--out', required=True, \
+                        help='data directory to write the fake dex to')
+    parser.add_argument('--num_mons', type=int, default=10000, \
+                        help='number of fake pokemon')
+    parser.add_argument('--seed', type=int, default=0, \
+                        help='random seed')
+    args = parser.parse_args()
+    write_data_dir(generate_dex(args.num_mons, args.seed, args.data), \
+                   args.out, args.data)
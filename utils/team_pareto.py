@@ -0,0 +1,300 @@
+# Author:     Andrew Smith
+# File:       team_pareto.py
+# Project:    Pokemon Team Builder
+
+'''
+team_pareto.py: This file contains the multi-objective team search.  Instead of
+                folding everything into one score, it keeps type synergy, role
+                coverage, and raw power as separate objectives and returns the
+                Pareto front: every team that no other team beats on one
+                objective without losing on another.
+
+The objectives, with the direction that is better:
+    synergy:   the team_search score, the sum of the type synergy of every pair
+               of members (lower)
+    coverage:  the sum over PD, SD, PO, and SO of the team's best score in that
+               role from stats_analysis, so a team with a strong member in every
+               role beats one that stacks a single role (higher)
+    power:     the team's mean BST ranking from stats_analysis, as a
+               percentage of the dex size (higher)
+Internally every objective is minimized, so coverage and power are negated.
+
+The exact front can hold many teams that differ in the last decimal places.
+With a resolution, a team is only added if it beats every team on the front by
+more than the resolution on some objective, which keeps the front small and the
+search fast while every team on the exact front stays within the resolution of
+one that is returned.
+
+The search needs at least MIN_SEEDS seeds.  With a single seed the bounds cut
+too little of the five open slots: on the full dex it takes minutes, against
+seconds for two seeds.
+'''
+
+import numpy as np
+from team_search import TEAM_SIZE
+from stats_analysis import make_stats_matrix, get_role_data
+
+OBJECTIVES = ('synergy', 'coverage', 'power')
+
+# Columns of get_role_data used as features: | PD | SD | PO | SO | BSR |
+FEATURE_COLUMNS = [0, 1, 2, 3, 6]
+NUM_ROLES = 4
+
+# Fewest seed mons the search takes, since one leaves too much to search
+MIN_SEEDS = 2
+
+# Default resolution of the synergy, coverage, and power objectives
+RESOLUTION = (0.05, 1.0, 0.5)
+
+# Number of points checked against the front at a time by dominated
+BLOCK_SIZE = 16
+
+# Objectives closer than this are treated as equal, since the same team score
+# summed in a different order can differ in the last bits
+TOLERANCE = 1e-9
+
+
+def role_features(pokedex):
+    # Returns the N x 5 | PD | SD | PO | SO | BSR | feature matrix of a dex,
+    # in dex order, with BSR as a percentage of the dex size
+    stats_matrix, num_mons = make_stats_matrix(pokedex)
+    features = get_role_data(stats_matrix)[:, FEATURE_COLUMNS]
+    features[:, -1] *= 100 / num_mons
+    return features
+
+
+def dominated(front, points, slack=0):
+    # Returns which points are weakly dominated by some point of the front,
+    # i.e. are no better than it by more than slack on any objective
+    if len(front) == 0:
+        return np.zeros(len(points), dtype=bool)
+    if len(points) <= 2 * BLOCK_SIZE:
+        return _dominated(front, points, slack)
+
+    # Most points are dominated, so check blocks of them by their best value
+    # on every objective first and only look at single points in the blocks
+    # that survive
+    block_starts = np.arange(0, len(points), BLOCK_SIZE)
+    block_best = np.minimum.reduceat(points, block_starts, axis=0)
+    result = np.repeat(_dominated(front, block_best, slack), \
+                       BLOCK_SIZE)[:len(points)]
+    unsure = np.flatnonzero(~result)
+    result[unsure] = _dominated(front, points[unsure], slack)
+    return result
+
+
+def _dominated(front, points, slack):
+    return (front[None, :, :] <= points[:, None, :] + slack + \
+            TOLERANCE).all(axis=2).any(axis=1)
+
+
+def pareto_mask(points, slack=0):
+    # Returns which points no other point dominates.  Of a group of points
+    # within slack of each other only the first is kept.
+    keep = np.ones(len(points), dtype=bool)
+    for i in np.lexsort(points.T[::-1]):
+        if keep[i]:
+            # Anything i is no worse than on every objective is dominated
+            beaten = (points[i] <= points + slack + TOLERANCE).all(axis=1)
+            beaten[i] = False
+            keep &= ~beaten
+    return keep
+
+
+class ParetoTeamSearch:
+    # Branch-and-bound search for the Pareto front of teams that contain a set
+    # of seed mons.  Every node gets a bound on each objective that no
+    # completion of it can beat:
+    #   synergy:   the TeamSearch bound
+    #   coverage:  the smaller of the best score in each role among the picks
+    #              and every candidate still available, and the picks'
+    #              coverage plus the largest gains any of the candidates still
+    #              available would add to it on their own (coverage is a sum of
+    #              maxima, so a mon never adds more than that)
+    #   power:     the picks plus the strongest candidates still available
+    # and a node whose bounds are dominated by a team already on the front is
+    # cut along with everything below it.  Candidates are searched in order of
+    # power, strongest first, so the power bound is a prefix sum and the
+    # coverage bound a suffix maximum.
+
+    def __init__(self, dex_matrix, features, team_size=TEAM_SIZE, \
+                 resolution=RESOLUTION):
+        self.dex_matrix = dex_matrix
+        self.synergy = dex_matrix.synergy
+        self.features = np.asarray(features, dtype=float)
+        self.team_size = team_size
+        self.resolution = np.asarray(resolution, dtype=float)
+        self.stats = {}
+
+    def prune_candidates(self, candidates, open_slots):
+        # Drops every candidate that open_slots others with the same type
+        # signature beat on every feature.  Swapping it for one of those that
+        # isn't on the team keeps the synergy and can only raise the coverage
+        # and power, so it can't be on the front.
+        candidates = np.asarray(candidates, dtype=np.intp)
+        combo_ids = self.dex_matrix.combo_ids[candidates]
+        keep = np.ones(len(candidates), dtype=bool)
+        order = np.argsort(combo_ids, kind='stable')
+        bounds = np.flatnonzero(np.diff(combo_ids[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group) <= open_slots:
+                continue
+            group_features = self.features[candidates[group]]
+
+            # beats[i, j]: i is at least as good as j everywhere, and better
+            # somewhere or equal and earlier in the dex
+            no_worse = (group_features[:, None, :] >= \
+                        group_features[None, :, :]).all(axis=2)
+            equal = (group_features[:, None, :] == \
+                     group_features[None, :, :]).all(axis=2)
+            earlier = np.arange(len(group))[:, None] < \
+                      np.arange(len(group))[None, :]
+            beats = no_worse & (~equal | earlier)
+            keep[group[beats.sum(axis=0) >= open_slots]] = False
+        return candidates[keep]
+
+    def search(self, seeds, candidates=None):
+        # Returns the Pareto front as (team, objectives) tuples sorted by
+        # synergy, where each team is a tuple of mon names starting with the
+        # seeds and objectives is a dict of OBJECTIVES with coverage and power
+        # back to higher is better.  candidates optionally restricts which dex
+        # rows may fill the open slots.
+        if not MIN_SEEDS <= len(seeds) < self.team_size:
+            raise ValueError('The Pareto search needs between {} and {} ' \
+                             'seed Pokemon, got {}.'.format(MIN_SEEDS, \
+                             self.team_size - 1, len(seeds)))
+        seed_ids = [self.dex_matrix.index(mon) for mon in seeds]
+        if len(set(seed_ids)) != len(seed_ids):
+            raise ValueError('Seed Pokemon must be unique.')
+        open_slots = self.team_size - len(seeds)
+
+        if candidates is None:
+            candidates = np.arange(len(self.dex_matrix))
+        candidates = np.setdiff1d(np.asarray(candidates, dtype=np.intp), \
+                                  seed_ids)
+        num_candidates = len(candidates)
+        candidates = self.prune_candidates(candidates, open_slots)
+        self.stats = {'candidates': num_candidates, \
+                      'candidates_kept': len(candidates), \
+                      'nodes_expanded': 0, 'nodes_pruned': 0, \
+                      'leaves_evaluated': 0}
+        if len(candidates) < open_slots:
+            return []
+
+        # Strongest first, then dex order
+        candidates = candidates[np.lexsort((candidates, \
+                                            -self.features[candidates, -1]))]
+        self._cand_combos = self.dex_matrix.combo_ids[candidates]
+        self._roles = self.features[candidates, :NUM_ROLES]
+        self._power = self.features[candidates, -1] / self.team_size
+
+        # _power_sums[p] is the total power of the candidates before p, and
+        # _role_suffix[p] the best score in each role from p onward
+        self._power_sums = np.concatenate(([0], np.cumsum(self._power)))
+        self._role_suffix = np.maximum.accumulate(self._roles[::-1])[::-1]
+        self._role_suffix = np.vstack((self._role_suffix, \
+                                       np.full(NUM_ROLES, -np.inf)))
+
+        unique_combos = np.unique(self._cand_combos)
+        combo_min_link = np.zeros(len(self.synergy))
+        combo_min_link[unique_combos] = \
+            self.synergy[np.ix_(unique_combos, unique_combos)].min(axis=1)
+        self._min_link = combo_min_link[self._cand_combos]
+
+        seed_combos = self.dex_matrix.combo_ids[seed_ids]
+        links = self.synergy[seed_combos][:, self._cand_combos].sum(axis=0)
+        score = self.synergy[np.ix_(seed_combos, seed_combos)].sum() / 2 - \
+                self.synergy[seed_combos, seed_combos].sum() / 2
+        seed_features = self.features[seed_ids]
+        self._front = np.empty((0, len(OBJECTIVES)))
+        self._front_picks = []
+        self._front_version = 0
+        self._expand((), score, links, seed_features[:, :NUM_ROLES].max( \
+                     axis=0), seed_features[:, -1].sum() / self.team_size, 0, \
+                     open_slots)
+
+        names = self.dex_matrix.names
+        results = []
+        for index in np.lexsort(self._front.T[::-1]):
+            synergy, coverage, power = self._front[index].tolist()
+            team = tuple(seeds) + tuple(names[candidates[p]] for p in \
+                                        self._front_picks[index])
+            results.append((team, {'synergy': synergy, \
+                                   'coverage': -coverage, 'power': -power}))
+        return results
+
+    def _insert(self, points, picks, positions):
+        # Adds the teams of picks plus one of positions, scored by points,
+        # that nothing on the front dominates, and drops the front teams they
+        # dominate
+        new = np.flatnonzero(~dominated(self._front, points, self.resolution))
+        if len(new) == 0:
+            return
+        new = new[pareto_mask(points[new], self.resolution)]
+        old = ~dominated(points[new], self._front)
+        self._front = np.vstack((self._front[old], points[new]))
+        self._front_picks = [pick for pick, is_old in \
+                             zip(self._front_picks, old) if is_old] + \
+                            [picks + (positions[i],) for i in new.tolist()]
+        self._front_version += 1
+
+    def _expand(self, picks, score, links, role_max, power, start, open_slots):
+        # picks are the pool positions chosen so far, score is the synergy of
+        # the seeds plus picks, links[p] is the synergy candidate p would add
+        # by joining them, role_max is their best score in each role, and
+        # power is their total power.  Only positions from start onward may be
+        # picked.
+        self.stats['nodes_expanded'] += 1
+
+        # The last open slot, so every remaining candidate completes a team
+        if open_slots == 1:
+            points = np.empty((len(links) - start, len(OBJECTIVES)))
+            points[:, 0] = score + links[start:]
+            points[:, 1] = -np.maximum(role_max, \
+                                       self._roles[start:]).sum(axis=1)
+            points[:, 2] = -(power + self._power[start:])
+            self.stats['leaves_evaluated'] += len(points)
+            self._insert(points, picks, range(start, len(links)))
+            return
+
+        # Children are the positions that leave enough candidates after them
+        # for the other open slots
+        stop = len(links) - open_slots + 1
+        if stop <= start:
+            return
+        positions = np.arange(start, stop)
+        costs = links[start:] + (open_slots - 1) / 2 * self._min_link[start:]
+        rest = np.partition(costs, open_slots - 2)[:open_slots - 1].sum()
+
+        bounds = np.empty((len(positions), len(OBJECTIVES)))
+        bounds[:, 0] = score + rest + costs[:len(positions)]
+        gains = np.maximum(self._roles[start:] - role_max, 0).sum(axis=1)
+        top_gains = -np.partition(-gains, open_slots - 2)[:open_slots - \
+                                                          1].sum()
+        bounds[:, 1] = -np.minimum(np.maximum(np.maximum(role_max, \
+            self._roles[positions]), self._role_suffix[positions + 1]).sum( \
+            axis=1), role_max.sum() + gains[:len(positions)] + top_gains)
+        bounds[:, 2] = -(power + self._power_sums[positions + open_slots] - \
+                         self._power_sums[positions])
+        order = np.argsort(bounds[:, 0], kind='stable')
+        cut = dominated(self._front, bounds[order], self.resolution)
+        version = self._front_version
+
+        for count, offset in enumerate(order.tolist()):
+            # The front grows while the children are searched, so check the
+            # rest of them again whenever it has changed
+            if self._front_version != version:
+                cut[count:] = dominated(self._front, bounds[order[count:]], \
+                                        self.resolution)
+                version = self._front_version
+            if cut[count]:
+                self.stats['nodes_pruned'] += 1
+                continue
+            position = positions[offset]
+            child_links = links + \
+                self.synergy[self._cand_combos[position], self._cand_combos]
+            self._expand(picks + (position,), score + links[position], \
+                         child_links, np.maximum(role_max, \
+                                                 self._roles[position]), \
+                         power + self._power[position], position + 1, \
+                         open_slots - 1)
@@ -0,0 +1,276 @@
+# Author:     Andrew Smith
+# File:       team_search.py
+# Project:    Pokemon Team Builder
+
+'''
+team_search.py: This file contains the team building search.  Given one to five
+                seed Pokemon, it finds the best ways to fill the rest of the
+                team using a branch-and-bound search over the dex.
+
+The score of a team is the sum of the type synergy of every pair of members
+under the dex matrix's scorer, so a team of two scores the same as
+type_synergy.  Like type_synergy, lower is better.
+
+The search can also be limited to teams with at most max_uncovered uncovered
+weaknesses and max_stacked stacked weaknesses, as defined in type_masks.py.
+Those are checked with bit masks before any team is scored, and since a stacked
+weakness can't go away by adding mons, whole subtrees are skipped once a pick
+exceeds max_stacked.
+'''
+
+import heapq
+import numpy as np
+from dex_matrix import top_k
+from type_masks import add_members, popcount, team_state, \
+                       uncovered_weaknesses, stacked_weaknesses
+
+TEAM_SIZE = 6
+
+
+class TeamSearch:
+    # Branch-and-bound search for the lowest scoring teams that contain a set
+    # of seed mons.  The search walks combinations of candidates in dex order.
+    # With r open slots, picking candidate c adds its links to the mons already
+    # on the team plus its links to the other r - 1 new mons.  Each of those
+    # new links is at least the larger of the two mons' smallest link to any
+    # candidate, so a completion adds at least the sum over its members of
+    #
+    #   links(c) + (r - 1) / 2 * min_link(c)
+    #
+    # and the r smallest of those give a bound no completion of the node can
+    # beat.  Any node whose bound is no better than the worst team kept so far
+    # is cut along with everything below it.
+
+    def __init__(self, dex_matrix, team_size=TEAM_SIZE, synergy=None, \
+                 masks=None, max_uncovered=None, max_stacked=None):
+        # synergy and masks, the chart's tables, can be passed instead of a dex
+        # matrix when only search_pool is needed, e.g. in a worker process
+        self.dex_matrix = dex_matrix
+        self.synergy = dex_matrix.synergy if synergy is None else synergy
+        self.masks = masks
+        if masks is None and dex_matrix is not None:
+            self.masks = dex_matrix.chart.masks
+        self.team_size = team_size
+        self.max_uncovered = max_uncovered
+        self.max_stacked = max_stacked
+        self.stats = {}
+
+    @property
+    def filtered(self):
+        # Whether the search is limited by the weakness masks
+        return self.max_uncovered is not None or self.max_stacked is not None
+
+    def team_weaknesses(self, team):
+        # Returns the uncovered and stacked weakness masks of a team given as
+        # a list of mon names
+        combo_ids = [self.dex_matrix.combo_ids[self.dex_matrix.index(mon)] \
+                     for mon in team]
+        state = team_state(self.masks[combo_ids])
+        return int(uncovered_weaknesses(state)), int(stacked_weaknesses(state))
+
+    def team_score(self, team):
+        # Scores a complete or partial team given as a list of mon names
+        combo_ids = [self.dex_matrix.combo_ids[self.dex_matrix.index(mon)] \
+                     for mon in team]
+        return sum(self.synergy[combo_ids[i], combo_ids[j]] \
+                   for i in range(len(combo_ids)) \
+                   for j in range(i + 1, len(combo_ids)))
+
+    def search(self, seeds, num_teams=10, candidates=None):
+        # Returns up to num_teams (team, score) tuples, best first, where each
+        # team is a tuple of mon names starting with the seeds.  candidates
+        # optionally restricts which dex rows may fill the open slots.
+        seed_ids = self.check_seeds(seeds)
+
+        # Every row that isn't a seed is a candidate for the open slots
+        if candidates is None:
+            candidates = np.arange(len(self.dex_matrix))
+        candidates = np.setdiff1d(np.asarray(candidates, dtype=np.intp), \
+                                  seed_ids)
+        teams = self.search_pool(self.dex_matrix.combo_ids[seed_ids], \
+                                 self.dex_matrix.combo_ids[candidates], \
+                                 np.ones(len(candidates), dtype=np.intp), \
+                                 self.team_size - len(seeds), num_teams)
+        names = self.dex_matrix.names
+        return [(tuple(seeds) + tuple(names[candidates[p]] for p in picks), \
+                score) for score, picks in teams]
+
+    def check_seeds(self, seeds):
+        # Checks the seeds and returns their dex rows
+        if not 1 <= len(seeds) < self.team_size:
+            raise ValueError('Team search needs between 1 and {} seed ' \
+                             'Pokemon, got {}.'.format(self.team_size - 1, \
+                                                       len(seeds)))
+        seed_ids = [self.dex_matrix.index(mon) for mon in seeds]
+        if len(set(seed_ids)) != len(seed_ids):
+            raise ValueError('Seed Pokemon must be unique.')
+        return seed_ids
+
+    def search_pool(self, seed_combos, cand_combos, capacity, open_slots, \
+                    num_teams=10, first_picks=None, shared_cutoff=None):
+        # Runs the search over a pool of candidates given by their rows in the
+        # type chart's combination tables.  capacity[p] is how many slots
+        # candidate p may fill, so a pool of type signatures can hand out the
+        # same signature more than once.  Returns up to num_teams
+        # (score, picks) tuples, best first, where picks are pool positions in
+        # ascending order.
+        #
+        # first_picks restricts the search to teams whose first (lowest) pick
+        # is one of the given positions, which splits the search into disjoint
+        # parts.  shared_cutoff is a multiprocessing value that the parts share:
+        # once a part has num_teams teams, nothing scoring worse than its worst
+        # can make the overall results, so every part prunes against it.
+        self.stats = {'nodes_expanded': 0, 'nodes_pruned': 0, \
+                      'leaves_evaluated': 0, 'teams_filtered': 0}
+        self._heap = []
+        self._num_teams = num_teams
+        self._shared_cutoff = shared_cutoff
+        self._cand_combos = np.asarray(cand_combos, dtype=np.intp)
+        self._capacity = np.asarray(capacity, dtype=np.intp)
+        if self._capacity.sum() < open_slots or num_teams <= 0:
+            return []
+
+        # Smallest synergy each candidate can have with any other candidate,
+        # used for the links between mons that haven't been picked yet
+        unique_combos = np.unique(self._cand_combos)
+        combo_min_link = np.zeros(len(self.synergy))
+        combo_min_link[unique_combos] = \
+            self.synergy[np.ix_(unique_combos, unique_combos)].min(axis=1)
+        self._min_link = combo_min_link[self._cand_combos]
+
+        seed_combos = np.asarray(seed_combos, dtype=np.intp)
+        links = self.synergy[seed_combos][:, self._cand_combos].sum(axis=0)
+        score = self.synergy[np.ix_(seed_combos, seed_combos)].sum() / 2 - \
+                self.synergy[seed_combos, seed_combos].sum() / 2
+
+        # Weakness state of the seeds, carried down the search as mons are
+        # picked
+        state = None
+        if self.filtered:
+            self._cand_masks = self.masks[self._cand_combos]
+            state = team_state(self.masks[seed_combos])
+        self._expand((), score, links, 0, self._capacity[0], open_slots, \
+                     first_picks, state)
+
+        return [(float(score), picks) for score, picks in \
+                sorted((-neg_score, picks) for neg_score, picks in self._heap)]
+
+    def _threshold(self):
+        # Score a new team has to beat to make it into the results
+        if len(self._heap) < self._num_teams:
+            threshold = float('inf')
+        else:
+            threshold = -self._heap[0][0]
+        if self._shared_cutoff is not None:
+            threshold = min(threshold, self._shared_cutoff.value)
+        return threshold
+
+    def _push(self, score, picks):
+        # The heap stores negated scores so the worst kept team is on top
+        if len(self._heap) < self._num_teams:
+            heapq.heappush(self._heap, (-score, picks))
+        else:
+            heapq.heapreplace(self._heap, (-score, picks))
+
+        # Lower the shared cutoff if this part's worst kept team beats it.  A
+        # racing write can only leave the cutoff too high, which prunes less
+        # but never drops a team that belongs in the results.
+        if self._shared_cutoff is not None and \
+           len(self._heap) == self._num_teams and \
+           -self._heap[0][0] < self._shared_cutoff.value:
+            self._shared_cutoff.value = -self._heap[0][0]
+
+    def _passes(self, states, final):
+        # Which of an array of weakness states are within the limits.  Only
+        # stacked weaknesses are checked before the team is complete, since
+        # later picks can still cover a weakness.
+        passes = np.ones(states.shape[:-1], dtype=bool)
+        if self.max_stacked is not None:
+            passes &= popcount(stacked_weaknesses(states)) <= self.max_stacked
+        if final and self.max_uncovered is not None:
+            passes &= popcount(uncovered_weaknesses(states)) <= \
+                      self.max_uncovered
+        return passes
+
+    def _expand(self, picks, score, links, start, start_capacity, open_slots, \
+                only=None, state=None):
+        # picks are the pool positions chosen so far, score is the score of the
+        # seeds plus picks, and links[p] is the synergy candidate p would add by
+        # joining them.  Only positions from start onward may be picked, and
+        # start itself only start_capacity more times, so that every
+        # combination is visited once.  only optionally restricts the children
+        # to a set of positions.  state is the weakness state of the seeds plus
+        # picks when the search is filtered.
+        self.stats['nodes_expanded'] += 1
+        if state is not None:
+            child_states = add_members(state, self._cand_masks[start:])
+
+        # The last open slot, so every remaining candidate completes a team
+        if open_slots == 1:
+            leaf_scores = score + links[start:]
+            if only is not None:
+                # Positions outside of only can never beat the threshold
+                allowed = np.zeros(len(leaf_scores), dtype=bool)
+                allowed[np.asarray(only, dtype=np.intp) - start] = True
+                leaf_scores[~allowed] = np.inf
+            if state is not None:
+                # Teams outside the weakness limits are dropped before they are
+                # ranked
+                rejected = ~self._passes(child_states, True) & \
+                           np.isfinite(leaf_scores)
+                self.stats['teams_filtered'] += int(rejected.sum())
+                leaf_scores[rejected] = np.inf
+            self.stats['leaves_evaluated'] += \
+                int(np.isfinite(leaf_scores).sum())
+            best = top_k(leaf_scores, self._num_teams)
+            for position in best:
+                if leaf_scores[position] >= self._threshold():
+                    break
+                self._push(leaf_scores[position], picks + (start + position,))
+            return
+
+        # How many more times each remaining candidate can be picked, capped at
+        # the number of open slots
+        counts = np.minimum(self._capacity[start:], open_slots)
+        counts[0] = min(start_capacity, open_slots)
+        if counts.sum() < open_slots:
+            return
+        costs = links[start:] + (open_slots - 1) / 2 * self._min_link[start:]
+
+        # Whatever the child is, the other open slots add at least the smallest
+        # costs of the remaining candidates
+        remaining = np.repeat(costs, np.minimum(counts, open_slots - 1))
+        rest = np.partition(remaining, open_slots - 2)[:open_slots - 1].sum()
+        child_bounds = score + rest + costs
+        order = np.argsort(child_bounds, kind='stable')
+        if only is not None:
+            allowed = np.zeros(len(order), dtype=bool)
+            allowed[np.asarray(only, dtype=np.intp) - start] = True
+            order = order[allowed[order]]
+        if state is not None:
+            passes = self._passes(child_states, False)
+            self.stats['teams_filtered'] += int((~passes[order]).sum())
+            order = order[passes[order]]
+        for count, offset in enumerate(order):
+            # Children are visited best bound first, so once one child is cut
+            # all the ones after it are too
+            if child_bounds[offset] >= self._threshold():
+                self.stats['nodes_pruned'] += len(order) - count
+                break
+            position = start + offset
+
+            # Stay on this candidate if it can fill another slot, otherwise
+            # move past it
+            if counts[offset] > 1:
+                child_start, child_capacity = position, counts[offset] - 1
+            elif position + 1 < len(links):
+                child_start = position + 1
+                child_capacity = self._capacity[child_start]
+            else:
+                continue
+            child_links = links + \
+                self.synergy[self._cand_combos[position], self._cand_combos]
+            self._expand(picks + (position,), score + links[position], \
+                         child_links, child_start, child_capacity, \
+                         open_slots - 1, None, None if state is None else \
+                         child_states[offset])
@@ -0,0 +1,260 @@
+# Author:     Andrew Smith
+# File:       team_server.py
+# Project:    Pokemon Team Builder
+
+'''
+team_server.py: This file runs the team builder as a long-running server that
+                keeps the dex and type tables loaded between queries.  Requests
+                are JSON objects, one per line, read from stdin or from a local
+                socket, and each gets a JSON line back:
+
+    {"id": 1, "mode": "find_partner", "mons": ["garchomp"], "k": 10}
+    {"id": 2, "mode": "build_team", "mons": ["garchomp", "toxapex"]}
+    {"id": 3, "mode": "find_partner", "mons": ["garchomp"], "scorer": "linf"}
+    {"id": 4, "mode": "find_partner", "mons": ["garchomp"],
+     "filters": {"exclude_alt_forms": true, "min_stats": {"spe": 100},
+                 "types": ["steel", "fairy"]}}
+    {"id": 5, "mode": "stats"}
+
+filters are the keyword arguments of EligibilityIndex.rows, and restrict the
+partners or the mons that fill the open slots of a team.
+
+The data files are checked before every request and reloaded only when they
+have changed on disk.
+'''
+
+import json
+import argparse
+import sys
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+import numpy as np
+from type_functions import DATA_DIR, TypeChart
+from dex_matrix import DexMatrix
+from signature_index import SignatureIndex
+from eligibility import EligibilityIndex
+from dex_snapshot import load_fresh_snapshot, load_pokedex, source_stamps
+from scorers import DEFAULT_SCORER
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyTracker:
+    # Keeps the most recent request latencies for each mode and reports their
+    # percentiles
+
+    def __init__(self, window=10000):
+        self.window = window
+        self._latencies = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, seconds):
+        with self._lock:
+            if mode not in self._latencies:
+                self._latencies[mode] = deque(maxlen=self.window)
+                self._counts[mode] = 0
+            self._latencies[mode].append(seconds)
+            self._counts[mode] += 1
+
+    def summary(self):
+        # Returns {mode: {'count': n, 'p50_ms': ..., ...}}
+        with self._lock:
+            latencies = {mode: np.asarray(values) for mode, values in \
+                         self._latencies.items()}
+            counts = dict(self._counts)
+        summary = {}
+        for mode, values in latencies.items():
+            summary[mode] = {'count': counts[mode]}
+            for percentile, value in zip(PERCENTILES, \
+                                         np.percentile(values, PERCENTILES)):
+                summary[mode]['p{}_ms'.format(percentile)] = value * 1e3
+        return summary
+
+
+class TeamServer:
+    # Answers partner and team requests against a dex that stays loaded
+
+    def __init__(self, data_path=DATA_DIR, workers=1):
+        self.data_path = data_path
+        self.workers = workers
+        self.latency = LatencyTracker()
+        self._reload_lock = threading.Lock()
+        self._stamps = None
+        self._indices = {}
+        self._eligibility = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        # Reloads the data files if they have changed since the last load.
+        # Requests already running keep the tables they started with.
+        stamps = source_stamps(self.data_path)
+        if self._stamps is not None and np.array_equal(stamps, self._stamps):
+            return False
+        with self._reload_lock:
+            if self._stamps is not None and \
+               np.array_equal(stamps, self._stamps):
+                return False
+            # Straight from the snapshot's columns when it is up to date
+            snapshot = load_fresh_snapshot(self.data_path)
+            if snapshot is not None:
+                dex_matrix = DexMatrix.from_snapshot(snapshot, \
+                    TypeChart(snapshot.to_type_data()))
+            else:
+                pokedex, type_data = load_pokedex(self.data_path)
+                dex_matrix = DexMatrix(pokedex, TypeChart(type_data))
+            self._indices = {(None, DEFAULT_SCORER): \
+                             SignatureIndex(dex_matrix)}
+            self._eligibility = EligibilityIndex(dex_matrix)
+            self._stamps = stamps
+        return True
+
+    def index(self, tie_break=None, scorer=DEFAULT_SCORER):
+        # Signature index for a tie break and scorer, built the first time it
+        # is asked for
+        indices = self._indices
+        if (tie_break, scorer) not in indices:
+            dex_matrix = indices[None, DEFAULT_SCORER].dex_matrix
+            if scorer != DEFAULT_SCORER:
+                dex_matrix = dex_matrix.with_scorer(scorer)
+            indices[tie_break, scorer] = SignatureIndex(dex_matrix, tie_break)
+        return indices[tie_break, scorer]
+
+    def eligibility(self, index):
+        # Eligibility index of a signature index's dex, which is the shared one
+        # unless the data was reloaded after the signature index was taken
+        eligibility = self._eligibility
+        if eligibility.dex_matrix.names is not index.dex_matrix.names:
+            eligibility = EligibilityIndex(index.dex_matrix)
+        return eligibility
+
+    def handle(self, request):
+        # Answers one request dict and returns the response dict
+        start = timer()
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': 'Bad request: expected a JSON ' \
+                    'object, not {}.'.format(type(request).__name__)}
+        mode = None
+        response = {'id': None}
+        try:
+            mode = request.get('mode')
+            response['id'] = request.get('id')
+            self.reload_if_changed()
+            index = self.index(request.get('tie_break'), \
+                               request.get('scorer', DEFAULT_SCORER))
+            mons = [mon.lower() for mon in request.get('mons', [])]
+            k = int(request.get('k', 10))
+            rows = None
+            if request.get('filters'):
+                rows = self.eligibility(index).rows(**request['filters'])
+            if mode == 'find_partner':
+                response['result'] = index.find_partners(mons[0], k, rows)
+            elif mode == 'build_team':
+                response['result'] = index.search_teams( \
+                    mons, k, workers=request.get('workers', self.workers), \
+                    rows=rows)
+            elif mode == 'stats':
+                response['result'] = self.latency.summary()
+            else:
+                raise ValueError('Unknown mode {}.'.format(mode))
+            response['ok'] = True
+        except Exception as error:
+            # Every request gets a response, so no error may escape to the
+            # thread answering it
+            response['ok'] = False
+            response['error'] = '{}: {}'.format(type(error).__name__, error)
+        elapsed = timer() - start
+        self.latency.record(mode if isinstance(mode, str) else None, elapsed)
+        response['latency_ms'] = elapsed * 1e3
+        return response
+
+    def handle_line(self, line):
+        # Answers one JSON line and returns the JSON response line
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return json.dumps({'ok': False, 'error': 'Bad request: {}'.format( \
+                               error)})
+        return json.dumps(self.handle(request))
+
+    def serve_lines(self, lines, write, threads=4):
+        # Answers an iterable of request lines concurrently, calling write
+        # with each response line as it finishes
+        write_lock = threading.Lock()
+
+        def answer(line):
+            response = self.handle_line(line)
+            with write_lock:
+                write(response)
+
+        with ThreadPoolExecutor(threads) as executor:
+            for line in lines:
+                if line.strip():
+                    executor.submit(answer, line)
+
+    def print_latency(self, f_out=sys.stderr):
+        for mode, summary in self.latency.summary().items():
+            print('{}: {} requests, '.format(mode, summary['count']) + \
+                  ', '.join('p{} = {:.3f} ms'.format(percentile, \
+                            summary['p{}_ms'.format(percentile)]) \
+                            for percentile in PERCENTILES), file=f_out)
+
+
+def serve_stdin(server, threads=4):
+    # Reads requests from stdin until EOF and writes responses to stdout
+    def write(response):
+        sys.stdout.write(response + '\n')
+        sys.stdout.flush()
+
+    server.serve_lines(sys.stdin, write, threads)
+
+
+def serve_socket(server, address):
+    # Serves requests on a unix socket path or a localhost TCP port.  Every
+    # connection gets its own thread and can send any number of request lines.
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    response = server.handle_line(line.decode('utf-8'))
+                    self.wfile.write(response.encode('utf-8') + b'\n')
+
+    if isinstance(address, int):
+        socket_server = socketserver.ThreadingTCPServer(('127.0.0.1', \
+                                                         address), Handler)
+    else:
+        socket_server = socketserver.ThreadingUnixStreamServer(address, Handler)
+    socket_server.daemon_threads = True
+    with socket_server:
+        socket_server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default=DATA_DIR, \
+                        help='path to the data directory')
+    parser.add_argument('--socket', help='unix socket path to listen on')
+    parser.add_argument('--port', type=int, \
+                        help='localhost TCP port to listen on')
+    parser.add_argument('--threads', type=int, default=4, \
+                        help='number of requests to answer at once on stdin')
+    parser.add_argument('--workers', type=int, default=1, \
+                        help='number of processes for each build_team request')
+    args = parser.parse_args()
+
+    server = TeamServer(args.data, args.workers)
+    print('Loaded {} Pokemon.'.format(len(server.index().dex_matrix)), \
+          file=sys.stderr)
+    try:
+        if args.socket is not None or args.port is not None:
+            serve_socket(server, args.socket if args.socket is not None \
+                         else args.port)
+        else:
+            serve_stdin(server, args.threads)
+    except KeyboardInterrupt:
+        pass
+    server.print_latency()
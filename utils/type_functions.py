@@ -9,63 +9,157 @@ type_functions.py: This file contains functions that handle the encoding and
 
 import json
 import numpy as np
-from numpy.linalg import norm
+from itertools import combinations
 import os
 import os.path as osp
+from scorers import DEFAULT_SCORER, get_scorer
+from type_masks import wri_masks
+
+# Default location of the data directory, relative to this file rather than the
+# current working directory
+DATA_DIR = osp.join(osp.dirname(osp.abspath(__file__)), os.pardir, 'data')
+
+# Dictionary for what index each type has
+TYPE_INDICES = {'bug': 0, 'dark': 1, 'dragon': 2, 'electric': 3, \
+                'fairy': 4, 'fighting': 5, 'fire': 6, 'flying': 7, \
+                'ghost': 8, 'grass': 9, 'ground': 10, 'ice': 11, \
+                'normal': 12, 'poison': 13, 'psychic': 14, 'rock': 15, \
+                'steel': 16, 'water': 17}
+TYPE_NAMES = sorted(TYPE_INDICES, key=TYPE_INDICES.get)
+NUM_TYPES = len(TYPE_NAMES)
+
+
+class TypeChart:
+    # Holds the type chart in memory so that it only has to be loaded and
+    # parsed once.  On creation it precomputes:
+    #   matrix:   18x18 array, matrix[d, a] is the damage multiplier of an
+    #             attack of type a against a mon with the single type d
+    #   combos:   every sorted single/dual type signature (171 of them)
+    #   wri:      (171, 18) array with the weaknesses, resistances, and
+    #             immunities of each signature
+    #   masks:    (171, 4) array with the weak, double_weak, resist, and
+    #             immune bit masks of each signature, see type_masks.py
+    #   synergy:  (171, 171) array with the type synergy of each pair of
+    #             signatures under the default scorer.  Tables for the other
+    #             scorers are built by synergy_table when first asked for.
+
+    def __init__(self, type_data):
+        self.matrix = np.ones((NUM_TYPES, NUM_TYPES))
+        for type, row in zip(TYPE_NAMES, self.matrix):
+            # Change all weaknesses to 2, for x2 damage
+            for weakness in type_data[type]['weaknesses']:
+                row[TYPE_INDICES[weakness]] = 2
+            # Change all resistances to 1/2, for x1/2 damage
+            for resistance in type_data[type]['resistances']:
+                row[TYPE_INDICES[resistance]] = 1/2
+            # Change all immunities to 0, for x0 damage
+            for immunity in type_data[type]['immunities']:
+                row[TYPE_INDICES[immunity]] = 0
+
+        # Single types first, then every dual type in alphabetical order
+        self.combos = [(type,) for type in TYPE_NAMES] + \
+                      list(combinations(TYPE_NAMES, 2))
+        self.combo_indices = {combo: i for i, combo in enumerate(self.combos)}
+
+        # pair_table[i, j] is the combination of types i and j in either order,
+        # and pair_table[i, 18] is type i on its own
+        self.pair_table = np.empty((NUM_TYPES, NUM_TYPES + 1), dtype=np.intp)
+        for i, combo in enumerate(self.combos):
+            first = TYPE_INDICES[combo[0]]
+            second = TYPE_INDICES[combo[1]] if len(combo) == 2 else NUM_TYPES
+            self.pair_table[first, second] = i
+            if second < NUM_TYPES:
+                self.pair_table[second, first] = i
+        self.wri = np.asarray([np.prod([self.matrix[TYPE_INDICES[type]] \
+                               for type in combo], axis=0) \
+                               for combo in self.combos])
+        self.masks = wri_masks(self.wri)
+
+        # type_mask[i, t] is whether signature i has type t
+        self.type_mask = np.zeros((len(self.combos), NUM_TYPES), dtype=bool)
+        for i, combo in enumerate(self.combos):
+            self.type_mask[i, [TYPE_INDICES[type] for type in combo]] = True
+
+        # Pairwise synergy of every combination, i.e. the 2-norm of the
+        # element-wise product of the two wri vectors
+        self._tables = {}
+        self.synergy = self.synergy_table()
+
+        # Plain python copies so the list-returning functions don't have to
+        # convert on every call
+        self._matrix_lists = self.matrix.tolist()
+        self._wri_lists = self.wri.tolist()
+        self._synergy_lists = self.synergy.tolist()
+
+    @classmethod
+    def from_file(cls, data_path=DATA_DIR):
+        # Loads type_data.json from the given data directory
+        with open(osp.join(data_path, 'type_data.json')) as f_in:
+            return cls(json.load(f_in))
+
+    def synergy_table(self, scorer=DEFAULT_SCORER, weights=None):
+        # Returns the (171, 171) synergy of every pair of signatures under a
+        # scorer, scoring all of the pairs in one batch the first time
+        key = (scorer, None if weights is None else \
+               np.asarray(weights, dtype=float).tobytes())
+        if key not in self._tables:
+            self._tables[key] = get_scorer(scorer)(self.wri[:, None, :] * \
+                                                   self.wri[None, :, :], \
+                                                   weights)
+        return self._tables[key]
+
+    def combo_index(self, types):
+        # Returns the row of a type list in the combination tables
+        return self.combo_indices[tuple(sorted(types))]
+
+    def get_wri(self, type):
+        return list(self._matrix_lists[TYPE_INDICES[type]])
+
+    def build_wri(self, types):
+        return list(self._wri_lists[self.combo_index(types)])
+
+    def type_synergy(self, types_1, types_2, scorer=DEFAULT_SCORER, \
+                     weights=None):
+        if scorer == DEFAULT_SCORER and weights is None:
+            return self._synergy_lists[self.combo_index(types_1)] \
+                                      [self.combo_index(types_2)]
+        return float(self.synergy_table(scorer, weights) \
+                     [self.combo_index(types_1), self.combo_index(types_2)])
+
+
+_chart = None
+
+
+def get_chart():
+    # Returns the shared type chart, loading it the first time it is needed
+    global _chart
+    if _chart is None:
+        _chart = TypeChart.from_file()
+    return _chart
+
+
+def set_chart(chart):
+    # Replaces the shared type chart, e.g. with one loaded from a different
+    # data directory
+    global _chart
+    _chart = chart
 
 
 def get_wri(type):
     # Takes in a single type and returns the weaknesses, resistances, and
     # immunities for it.
-
-    # Load the type data
-    with open(osp.join(os.pardir, 'data', 'type_data.json')) as f_in:
-        data = json.load(f_in)
-
-    # Dictionary for what index each type has
-    type_indices = {'bug': 0, 'dark': 1, 'dragon': 2, 'electric': 3, \
-                    'fairy': 4, 'fighting': 5, 'fire': 6, 'flying': 7, \
-                    'ghost': 8, 'grass': 9, 'ground': 10, 'ice': 11, \
-                    'normal': 12, 'poison': 13, 'psychic': 14, 'rock': 15, \
-                    'steel': 16, 'water': 17}
-
-    # Create neutral type list
-    full_type_wri = [1 for i in range(18)]
-
-    # Change all weaknesses to 2, for x2 damage
-    for weakness in data[type]['weaknesses']:
-        full_type_wri[type_indices[weakness]] = 2
-
-    # Change all resistances to 1/2, for x1/2 damage
-    for resistance in data[type]['resistances']:
-        full_type_wri[type_indices[resistance]] = 1/2
-
-    # Change all immunities to 0, for x0 damage
-    for immunity in data[type]['immunities']:
-        full_type_wri[type_indices[immunity]] = 0
-
-    return full_type_wri # A list of the weaknesses and resistances
+    return get_chart().get_wri(type) # A list of the weaknesses and resistances
 
 
 def build_wri(types):
     # Takes in the type list as an argument and returns the weaknesses,
     # resistances, and immunities of the Pokemon as a list.
-    if len(types) == 2:
-        return [x*y for x, y in zip(get_wri(types[0]), \
-                get_wri(types[1]))]
-    else:
-        return get_wri(types[0])
-
-
-def type_synergy(types_1, types_2):
-    # Takes in two type lists, performs element-wise multiplication on them, and
-    # finds the 2-norm of the resulting vector
+    return get_chart().build_wri(types)
 
-    # Find the weaknesses, resistances, and immunities vector of the two mons
-    # together
-    wri = np.asarray([x*y for x, y in zip(build_wri(types_1), \
-                      build_wri(types_2))])
 
-    # Return the norm of the wri vector, which we want to minimize
-    return norm(wri) # TODO: Test other orders of norms, blow up with common
-                     # weaknesses
+def type_synergy(types_1, types_2, scorer=DEFAULT_SCORER):
+    # Takes in two type lists, performs element-wise multiplication on their
+    # weaknesses, resistances, and immunities, and returns the score of the
+    # resulting vector, which we want to minimize.  The default scorer is the
+    # 2-norm, and the others are in scorers.py.
+    return get_chart().type_synergy(types_1, types_2, scorer)
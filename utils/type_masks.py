@@ -0,0 +1,106 @@
+# Author:     Andrew Smith
+# File:       type_masks.py
+# Project:    Pokemon Team Builder
+
+'''
+type_masks.py: This file encodes weaknesses, resistances, and immunities as
+               18-bit masks, one bit per attacking type in TYPE_INDICES order,
+               so that team-level checks are a few integer operations instead
+               of float math.
+
+Every mon gets four masks:
+    weak:         types it takes x2 or more from
+    double_weak:  types it takes x4 from
+    resist:       types it takes x1/2 or less from, but not x0
+    immune:       types it takes x0 from
+
+Teams are checked through a state, an array of STACK_SIZE + 1 masks:
+state[0] is the types some member resists or is immune to, and state[j] the
+types at least j members are weak to.  A type is an uncovered weakness if some
+member is weak to it and no member covers it, and a stacked weakness if at
+least STACK_SIZE members are weak to it.  Members are added to a state with
+add_members, so a search can carry one along as it picks mons.
+'''
+
+import numpy as np
+
+WEAK = 0
+DOUBLE_WEAK = 1
+RESIST = 2
+IMMUNE = 3
+MASK_KINDS = ('weak', 'double_weak', 'resist', 'immune')
+
+# How many members have to be weak to a type for it to count as stacked
+STACK_SIZE = 3
+
+
+def wri_masks(wri):
+    # Takes an (..., 18) array of weaknesses, resistances, and immunities and
+    # returns the (..., 4) weak, double_weak, resist, and immune masks as
+    # uint32
+    wri = np.asarray(wri)
+    bits = np.uint32(1) << np.arange(wri.shape[-1], dtype=np.uint32)
+    kinds = [wri >= 2, wri >= 4, (wri > 0) & (wri <= 1/2), wri == 0]
+    return np.stack([(kind * bits).sum(axis=-1, dtype=np.uint32) \
+                     for kind in kinds], axis=-1)
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(masks):
+        # Number of set bits in every mask
+        return np.bitwise_count(np.asarray(masks, dtype=np.uint32))
+else:
+    # Older numpy has no popcount, so count the bits of each byte from a table
+    _BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], \
+                            dtype=np.uint8)
+
+    def popcount(masks):
+        # Number of set bits in every mask
+        masks = np.ascontiguousarray(masks, dtype=np.uint32)
+        return _BYTE_COUNTS[masks.view(np.uint8)].reshape( \
+            masks.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+def mask_types(mask, type_names):
+    # Returns the names of the types set in a single mask
+    return [name for bit, name in enumerate(type_names) if int(mask) >> bit & 1]
+
+
+def empty_state(stack_size=STACK_SIZE):
+    return np.zeros(stack_size + 1, dtype=np.uint32)
+
+
+def add_members(state, masks):
+    # Adds members given by their (..., 4) masks to a state, one member per
+    # row, and returns the (..., stack_size + 1) state of each.  With a state
+    # and an (M, 4) array this gives the M teams of the state plus each mon.
+    masks = np.asarray(masks, dtype=np.uint32)
+    state = np.broadcast_to(state, masks.shape[:-1] + state.shape[-1:]).copy()
+    weak = masks[..., WEAK]
+
+    # Counts go up by one wherever the member is weak, highest count first so
+    # that a member only moves each type up a single level
+    for count in range(state.shape[-1] - 1, 1, -1):
+        state[..., count] |= state[..., count - 1] & weak
+    state[..., 1] |= weak
+    state[..., 0] |= masks[..., RESIST] | masks[..., IMMUNE]
+    return state
+
+
+def team_state(masks, stack_size=STACK_SIZE):
+    # Returns the state of a team given as an (T, 4) array of member masks
+    state = empty_state(stack_size)
+    for member in np.asarray(masks, dtype=np.uint32):
+        state = add_members(state, member)
+    return state
+
+
+def uncovered_weaknesses(state):
+    # Mask of the types some member is weak to and no member covers
+    state = np.asarray(state)
+    return state[..., 1] & ~state[..., 0]
+
+
+def stacked_weaknesses(state):
+    # Mask of the types at least stack_size members are weak to
+    return np.asarray(state)[..., -1]